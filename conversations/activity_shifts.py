@@ -0,0 +1,229 @@
+import warnings
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+shift_cols = ['row', 'period_idx', 'score', 'before', 'after']
+spike_cols = ['row', 'period_idx', 'z', 'value', 'baseline']
+
+# Activity is compared on a log scale (log1p), so a conversation going from 10 to 5 messages a week is as big a shift
+# as one going from 1,000 to 500. Noise estimates are floored at this, so near constant series don't flag tiny changes
+min_sigma = 0.25
+
+# MAD of normally distributed values, relative to their standard deviation
+mad_scale = 1.4826
+
+# Segments are searched in chunks of about this many (segment, split) cells, to bound the size of temporary arrays
+max_chunk_cells = 2 ** 22
+
+
+def build_period_matrix(timestamps_ns: np.ndarray, row_codes: np.ndarray, n_rows: int, period: str,
+                        weights: np.ndarray = None) -> Tuple[np.ndarray, pd.DatetimeIndex]:
+    """
+    Counts (or sums the weights of) messages per fixed period for every row (e.g. conversation) in a single bincount.
+    Periods are anchored to the epoch, so they line up across rows
+    :param timestamps_ns: The UTC timestamp (ns) of each message
+    :param row_codes: The row each message is counted in
+    :param period: A fixed period (e.g. '7D' or '12h'), calendar periods such as months aren't supported
+    :param weights: Optional amount to add for each message (e.g. its character count), defaults to counting messages
+    :return: An array of activity shaped (n_rows, n_periods), from the first period with any message to the last, and
+        the start of each period (UTC)
+    """
+
+    try:
+        period_ns = pd.to_timedelta(pd.tseries.frequencies.to_offset(period)).value
+    except ValueError:
+        raise ValueError(f"Activity periods must be a fixed length (e.g. '7D'), not: {period}")
+
+    period_codes = timestamps_ns // period_ns
+    first_period = period_codes.min() if period_codes.shape[0] > 0 else 0
+    n_periods = int(period_codes.max() - first_period + 1) if period_codes.shape[0] > 0 else 0
+
+    cell_codes = row_codes.astype(np.int64) * n_periods + (period_codes - first_period)
+    matrix = np.bincount(cell_codes, weights=weights, minlength=n_rows * n_periods).astype(float)
+
+    period_starts = pd.DatetimeIndex((first_period + np.arange(n_periods)) * period_ns, tz='UTC')
+
+    return matrix.reshape(n_rows, n_periods), period_starts
+
+
+def estimate_noise(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """
+    Estimates the noise (standard deviation) of each row from the median absolute change between periods, which isn't
+    thrown off by the shifts themselves. Rows where most periods don't change use the standard deviation of the changes
+    :param values: Log scaled activity, shaped (n_rows, n_periods)
+    :param starts: The first period of each row (e.g. when the conversation started), earlier periods are ignored
+    :return: The noise of each row, at least min_sigma
+    """
+
+    diffs = np.diff(values, axis=1)
+    diffs[np.arange(diffs.shape[1]) < starts[:, np.newaxis]] = np.nan
+
+    # Rows without any activity are all NaN, and fall back to min_sigma
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        abs_diffs = np.abs(diffs)
+        mad_sigma = mad_scale * np.nanmedian(abs_diffs, axis=1) / np.sqrt(2)
+        std_sigma = np.sqrt(np.nanmean(diffs ** 2, axis=1) / 2)
+
+    sigma = np.where(mad_sigma > 0, mad_sigma, std_sigma)
+
+    return np.maximum(np.nan_to_num(sigma), min_sigma)
+
+
+def find_mean_shifts(cum_values: np.ndarray, rows: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                     sigma: np.ndarray, min_segment: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the single most significant shift in mean of many segments at once. For every possible split, the CUSUM
+    statistic (the standardised difference between the means either side) is calculated from cumulative sums, so each
+    segment takes one vectorised pass however many splits it has
+    :param cum_values: Cumulative sums of each row's values, with a leading column of zeros, shaped (n_rows,
+        n_periods + 1)
+    :param rows: The row of each segment
+    :param starts: The first period of each segment
+    :param ends: The period after the last of each segment
+    :param sigma: The noise of each segment's row
+    :param min_segment: The minimum number of periods either side of a split
+    :return: The period each segment's shift starts at, and its score (in units of noise, 0 where there's no split)
+    """
+
+    chunk_size = max(1, max_chunk_cells // cum_values.shape[1])
+    if rows.shape[0] > chunk_size:
+        results = [find_mean_shifts(cum_values, *(x[ii:ii + chunk_size] for x in (rows, starts, ends, sigma)),
+                                    min_segment) for ii in range(0, rows.shape[0], chunk_size)]
+        return np.concatenate([x[0] for x in results]), np.concatenate([x[1] for x in results])
+
+    splits = np.arange(cum_values.shape[1])[np.newaxis, :]
+    seg_starts, seg_ends = starts[:, np.newaxis], ends[:, np.newaxis]
+
+    n_before = splits - seg_starts
+    n_after = seg_ends - splits
+    is_valid = (n_before >= min_segment) & (n_after >= min_segment)
+
+    seg_cum = cum_values[rows]
+    start_cum = np.take_along_axis(seg_cum, seg_starts, axis=1)
+    end_cum = np.take_along_axis(seg_cum, seg_ends, axis=1)
+
+    with np.errstate(all='ignore'):
+        mean_before = (seg_cum - start_cum) / n_before
+        mean_after = (end_cum - seg_cum) / n_after
+        scores = np.sqrt(n_before * n_after / (n_before + n_after)) * np.abs(mean_after - mean_before)
+
+    scores = np.where(is_valid, scores, 0) / sigma[:, np.newaxis]
+    best_splits = np.argmax(scores, axis=1)
+
+    return best_splits, scores[np.arange(scores.shape[0]), best_splits]
+
+
+def detect_shifts(matrix: np.ndarray, min_score: float = 5.0, min_segment: int = 4,
+                  max_depth: int = 3) -> pd.DataFrame:
+    """
+    Detects lasting changes in activity (e.g. a friendship fading or reviving) in every row at once, by binary
+    segmentation: the most significant shift of each row is found, then the periods either side of it are searched
+    again, up to max_depth times. Each row starts at its first active period, and runs to the end of the matrix
+    :param matrix: Activity per period, shaped (n_rows, n_periods)
+    :param min_score: The minimum CUSUM statistic (in units of noise) for a shift to be kept. The maximum of the
+        statistic over a series without any shift grows slowly with its length, rarely reaching 5 even over
+        thousands of periods
+    :param min_segment: The minimum number of periods before and after a shift
+    :param max_depth: The number of times segments are split, allowing up to 2 ** max_depth - 1 shifts per row
+    :return: A dataframe with a row per shift: ['row', 'period_idx', 'score', 'before', 'after'], where before and
+        after are the mean activity per period between the shift and the neighbouring shifts (or ends)
+    """
+
+    n_rows, n_periods = matrix.shape
+    values = np.log1p(matrix)
+
+    is_active = matrix > 0
+    row_starts = np.where(is_active.any(axis=1), np.argmax(is_active, axis=1), n_periods)
+
+    sigma = estimate_noise(values, row_starts)
+
+    zeros = np.zeros((n_rows, 1))
+    cum_values = np.hstack([zeros, np.cumsum(values, axis=1)])
+    cum_raw = np.hstack([zeros, np.cumsum(matrix, axis=1)])
+
+    # Segments to search, as (row, start, end), starting from each row's whole active span
+    rows = np.arange(n_rows)
+    starts = row_starts
+    ends = np.full(n_rows, n_periods)
+
+    found = []
+    for _ in range(max_depth):
+        if rows.shape[0] == 0:
+            break
+
+        splits, scores = find_mean_shifts(cum_values, rows, starts, ends, sigma[rows], min_segment)
+        is_shift = scores >= min_score
+
+        rows, starts, ends, splits, scores = (x[is_shift] for x in (rows, starts, ends, splits, scores))
+        found.append(pd.DataFrame({'row': rows, 'period_idx': splits, 'score': scores}))
+
+        # Search either side of each shift in the next pass
+        rows, starts, ends = (np.concatenate(x) for x in ((rows, rows), (starts, splits), (splits, ends)))
+
+    shifts_df = pd.concat(found, ignore_index=True) if found else \
+        pd.DataFrame({'row': np.array([], dtype=np.int64), 'period_idx': np.array([], dtype=np.int64), 'score': []})
+
+    # The activity either side of each shift is measured up to the neighbouring shifts (or the ends of the row)
+    shifts_df = shifts_df.sort_values(['row', 'period_idx'], kind='stable').reset_index(drop=True)
+    prev_splits = shifts_df.groupby('row')['period_idx'].shift(1).fillna(-1).values.astype(np.int64)
+    next_splits = shifts_df.groupby('row')['period_idx'].shift(-1).fillna(-1).values.astype(np.int64)
+
+    shift_rows = shifts_df['row'].values
+    shift_splits = shifts_df['period_idx'].values
+    prev_splits = np.where(prev_splits >= 0, prev_splits, row_starts[shift_rows])
+    next_splits = np.where(next_splits >= 0, next_splits, n_periods)
+
+    shifts_df['before'] = (cum_raw[shift_rows, shift_splits] - cum_raw[shift_rows, prev_splits]) / \
+                          (shift_splits - prev_splits)
+    shifts_df['after'] = (cum_raw[shift_rows, next_splits] - cum_raw[shift_rows, shift_splits]) / \
+                         (next_splits - shift_splits)
+
+    return shifts_df[shift_cols]
+
+
+def detect_spikes(matrix: np.ndarray, window: int = 8, min_z: float = 4.0, min_value: float = 10) -> pd.DataFrame:
+    """
+    Detects bursts of activity far above each row's recent level, comparing every period to the rolling mean and
+    standard deviation of the periods before it. The rolling statistics of every row are calculated at once from
+    cumulative sums
+    :param matrix: Activity per period, shaped (n_rows, n_periods)
+    :param window: The number of preceding periods the baseline is calculated from. Periods in a row's first window
+        (from its first active period) aren't tested
+    :param min_z: The minimum number of standard deviations (on the log scale) above the baseline
+    :param min_value: The minimum activity of a spike, so a few messages in a usually silent conversation aren't one
+    :return: A dataframe with a row per spike: ['row', 'period_idx', 'z', 'value', 'baseline'], where baseline is the
+        typical activity (geometric mean) of the preceding periods
+    """
+
+    n_rows, n_periods = matrix.shape
+    values = np.log1p(matrix)
+
+    is_active = matrix > 0
+    row_starts = np.where(is_active.any(axis=1), np.argmax(is_active, axis=1), n_periods)
+
+    zeros = np.zeros((n_rows, 1))
+    cum_values = np.hstack([zeros, np.cumsum(values, axis=1)])
+    cum_squares = np.hstack([zeros, np.cumsum(values ** 2, axis=1)])
+
+    # Sums of the window of periods before each period (column ii covers periods ii - window to ii - 1)
+    window_sums = np.zeros_like(values)
+    window_squares = np.zeros_like(values)
+    window_sums[:, window:] = cum_values[:, window:-1] - cum_values[:, :-window - 1]
+    window_squares[:, window:] = cum_squares[:, window:-1] - cum_squares[:, :-window - 1]
+
+    # A few periods give a noisy standard deviation, so it is floored at the noise of the whole row
+    baseline = window_sums / window
+    std = np.sqrt(np.maximum(window_squares / window - baseline ** 2, 0))
+    z = (values - baseline) / np.maximum(std, estimate_noise(values, row_starts)[:, np.newaxis])
+
+    is_tested = np.arange(n_periods)[np.newaxis, :] >= row_starts[:, np.newaxis] + window
+    spike_rows, spike_periods = np.nonzero(is_tested & (z >= min_z) & (matrix >= min_value))
+
+    return pd.DataFrame({'row': spike_rows,
+                         'period_idx': spike_periods,
+                         'z': z[spike_rows, spike_periods],
+                         'value': matrix[spike_rows, spike_periods],
+                         'baseline': np.expm1(baseline[spike_rows, spike_periods])}, columns=spike_cols)
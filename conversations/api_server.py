@@ -0,0 +1,384 @@
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import ipaddress
+import json
+import logging
+import urllib.parse
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+from conversations.user import User
+
+# Responses of each status code, for the status line
+status_phrases = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                  409: 'Conflict', 500: 'Internal Server Error'}
+
+# Requests larger than this (request line and headers) are rejected
+max_header_bytes = 16 * 1024
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def to_json_bytes(result: Any) -> bytes:
+    """
+    :param result: A dataframe (written as a list of row objects, including its index unless it is only row numbers),
+        series, or plain value
+    :return: The UTF-8 encoded JSON
+    """
+
+    if isinstance(result, pd.DataFrame):
+        result = result.reset_index(drop=isinstance(result.index, pd.RangeIndex))
+        return result.to_json(orient='records', date_format='iso').encode('utf-8')
+    if isinstance(result, pd.Series):
+        return result.to_json(date_format='iso').encode('utf-8')
+
+    def convert(value):
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, (pd.Timestamp, np.datetime64)):
+            return pd.Timestamp(value).isoformat()
+        raise TypeError(f"Can't convert {type(value).__name__} to JSON")
+
+    return json.dumps(result, default=convert).encode('utf-8')
+
+
+class AnalyticsServer:
+    """
+    Local HTTP JSON API over a loaded User, for front ends to browse the data. Every endpoint is served from the User's
+    precomputed tables, and each distinct response is kept in an LRU cache with an ETag, so repeated requests (and
+    revalidations, which return 304 without a body) take no computation. Requests are handled asynchronously, while
+    uncached responses are computed one at a time on a worker thread
+
+    Endpoints (GET):
+        /convos                             Every conversation's totals
+        /convos/{name}                      A conversation's totals per sender
+        /convos/{name}/timeseries           Messages and characters per sender per period (?period=7D)
+        /rankings/{metric}                  msg_count, char_ratio, reply_time, initiation or engagement (?n=, &desc=,
+                                            &no_groupchats=)
+        /timeseries                         Characters per conversation per period (?period=, &start=, &end=)
+        /hourly                             Messages per hour of the day (?by_sender=, &no_groupchats=)
+        /sentiment                          Sentiment rankings (?filter_user=, &no_groupchat=)
+        /shares/domains                     Each person's most shared domains per period (?period=30D or all, &n=,
+                                            &no_groupchats=)
+        /shares/links                       The most re-shared links (?n=, &min_shares=, &no_groupchats=)
+        /activity/shifts                    The biggest lasting changes in conversations' activity (?period=7D,
+                                            &measure=msgs or chars, &n=, &no_groupchats=)
+        /activity/spikes                    The biggest bursts of activity (?period=1D, &measure=, &n=, &no_groupchats=)
+    """
+
+    def __init__(self, user: User, host: str = '127.0.0.1', port: int = 8765, cache_size: int = 256):
+        """
+        :param host: The address to listen on, which must be a loopback address, as the data is private
+        :param cache_size: The number of responses to keep
+        """
+
+        if not ipaddress.ip_address(host).is_loopback:
+            raise ValueError(f"The server only listens on loopback addresses (e.g. 127.0.0.1), not: {host}")
+
+        self.user = user
+        self.host = host
+        self.port = port
+        self.cache_size = cache_size
+
+        self._cache: collections.OrderedDict[Tuple, Tuple[str, bytes]] = collections.OrderedDict()
+        self._cache_source = user.convos
+
+        # Messages and characters per sender per day of each conversation, built on first use, {Convo Name: Totals}
+        self._daily_totals: Dict[str, pd.DataFrame] = dict()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        self.routes: List[Tuple[Tuple[str, ...], Callable[..., Any]]] = [
+            (('convos',), self.get_convos),
+            (('convos', None), self.get_convo),
+            (('convos', None, 'timeseries'), self.get_convo_timeseries),
+            (('rankings', None), self.get_ranking),
+            (('timeseries',), self.get_timeseries),
+            (('hourly',), self.get_hourly),
+            (('sentiment',), self.get_sentiment),
+            (('shares', 'domains'), self.get_share_domains),
+            (('shares', 'links'), self.get_share_links),
+            (('activity', 'shifts'), self.get_activity_shifts),
+            (('activity', 'spikes'), self.get_activity_spikes),
+        ]
+
+    @staticmethod
+    def parse_bool(params: Dict[str, str], key: str, default: bool) -> bool:
+        if key not in params:
+            return default
+        if params[key].lower() not in ('true', 'false', '1', '0'):
+            raise ApiError(400, f"{key} must be true or false")
+
+        return params[key].lower() in ('true', '1')
+
+    @staticmethod
+    def parse_int(params: Dict[str, str], key: str, default: int) -> int:
+        try:
+            return int(params.get(key, default))
+        except ValueError:
+            raise ApiError(400, f"{key} must be an integer")
+
+    @staticmethod
+    def parse_period(params: Dict[str, str], default: str) -> str:
+        period = params.get('period', default)
+        try:
+            pd.tseries.frequencies.to_offset(period)
+        except ValueError:
+            raise ApiError(400, f"period must be a pandas frequency (e.g. 7D), not: {period}")
+
+        return period
+
+    def _get_convo(self, name: str):
+        if name not in self.user.convos:
+            raise ApiError(404, f"No conversation named: {name}")
+
+        return self.user.convos[name]
+
+    def get_convos(self, params: Dict[str, str]) -> pd.DataFrame:
+        return self.user.get_convo_leaderboard_df()
+
+    def get_convo(self, params: Dict[str, str], name: str) -> pd.DataFrame:
+        return self._get_convo(name).summary_df
+
+    def get_daily_totals(self, name: str) -> pd.DataFrame:
+        """
+        :return: A dataframe indexed by (sender_name, day): ['msgs', 'chars'], built from the messages once, so every
+            period a whole number of days long is resampled from (at most) a row per sender per day
+        """
+
+        if name not in self._daily_totals:
+            self._daily_totals[name] = self.resample_totals(self._get_convo(name).msgs_df, '1D')
+
+        return self._daily_totals[name]
+
+    @staticmethod
+    def resample_totals(msgs_df: pd.DataFrame, period: str) -> pd.DataFrame:
+        # Periods are anchored to the epoch, so daily totals resample into the same periods as the messages would
+        return (msgs_df.groupby('sender_name')
+                .resample(period, origin='epoch')['text_len']
+                .agg(['count', 'sum'])
+                .rename(columns={'count': 'msgs', 'sum': 'chars'}))
+
+    def get_convo_timeseries(self, params: Dict[str, str], name: str) -> pd.DataFrame:
+        period = self.parse_period(params, '7D')
+
+        # Daily totals are of days since the epoch, so can only be resampled into fixed periods of whole days. Shorter
+        # and calendar periods (e.g. months, which start at local midnight) are resampled from the messages
+        offset = pd.tseries.frequencies.to_offset(period)
+        if not isinstance(offset, pd.offsets.Tick) or offset.nanos % pd.Timedelta('1D').value != 0:
+            return self.resample_totals(self._get_convo(name).msgs_df, period)
+
+        daily_df = self.get_daily_totals(name)
+
+        return (daily_df.reset_index(level='sender_name')
+                .groupby('sender_name')
+                .resample(period, origin='epoch')[['msgs', 'chars']]
+                .sum())
+
+    def get_ranking(self, params: Dict[str, str], metric: str) -> List[Tuple]:
+        n = self.parse_int(params, 'n', 100)
+        desc = self.parse_bool(params, 'desc', True)
+
+        rankings = {
+            'msg_count': lambda: self.user.get_convos_ranked_by_msg_count(
+                n, self.parse_bool(params, 'no_groupchats', False)),
+            'char_ratio': lambda: self.user.get_convos_ranked_by_char_ratio(
+                desc, n, self.parse_bool(params, 'no_groupchats', True)),
+            'reply_time': lambda: self.user.get_convos_ranked_by_reply_time(n),
+            'initiation': lambda: self.user.get_convos_ranked_by_initiation(
+                desc, n, self.parse_bool(params, 'no_groupchats', True)),
+            'engagement': lambda: self.user.get_convos_ranked_by_engagement(
+                n, self.parse_bool(params, 'no_groupchats', False)),
+        }
+
+        if metric not in rankings:
+            raise ApiError(404, f"Rankings are available by: {', '.join(rankings)}")
+
+        return rankings[metric]()
+
+    def get_timeseries(self, params: Dict[str, str]) -> pd.DataFrame:
+        try:
+            return self.user.build_sma_df(self.parse_period(params, '30D'), params.get('start'), params.get('end'))
+        except ValueError as err:
+            raise ApiError(400, str(err))
+
+    def get_hourly(self, params: Dict[str, str]) -> pd.DataFrame:
+        by_sender = self.parse_bool(params, 'by_sender', False)
+        profiles_df = self.user.get_hour_profiles(by_sender, self.parse_bool(params, 'no_groupchats', False))
+
+        return profiles_df.rename_axis(['convo', 'sender_name'] if by_sender else 'convo')
+
+    def get_sentiment(self, params: Dict[str, str]) -> pd.DataFrame:
+        # Caches may be saved without affect data, so it is built on first use (on the worker thread)
+        if self.user.get_or_create_affect_df() is None:
+            raise ApiError(409, "No conversations have enough text for sentiment analysis")
+
+        try:
+            return self.user.get_convos_ranked_by_affect(self.parse_bool(params, 'filter_user', True),
+                                                         self.parse_bool(params, 'no_groupchat', True))
+        except ValueError as err:
+            raise ApiError(409, str(err))
+
+    def get_share_domains(self, params: Dict[str, str]) -> pd.DataFrame:
+        period = None if params.get('period') == 'all' else self.parse_period(params, '30D')
+
+        return self.user.get_top_domains(period, self.parse_int(params, 'n', 5), None,
+                                         self.parse_bool(params, 'no_groupchats', False))
+
+    def get_share_links(self, params: Dict[str, str]) -> pd.DataFrame:
+        return self.user.get_top_shared_links(self.parse_int(params, 'n', 20), self.parse_int(params, 'min_shares', 2),
+                                              self.parse_bool(params, 'no_groupchats', False))
+
+    def get_activity_shifts(self, params: Dict[str, str]) -> pd.DataFrame:
+        try:
+            return self.user.get_activity_shifts(self.parse_period(params, '7D'), params.get('measure', 'msgs'),
+                                                 self.parse_int(params, 'n', 20),
+                                                 self.parse_bool(params, 'no_groupchats', False))
+        except ValueError as err:
+            raise ApiError(400, str(err))
+
+    def get_activity_spikes(self, params: Dict[str, str]) -> pd.DataFrame:
+        try:
+            return self.user.get_activity_spikes(self.parse_period(params, '1D'), params.get('measure', 'msgs'),
+                                                 self.parse_int(params, 'n', 20),
+                                                 self.parse_bool(params, 'no_groupchats', False))
+        except ValueError as err:
+            raise ApiError(400, str(err))
+
+    def route(self, path: str) -> Tuple[Callable[..., Any], List[str]]:
+        """
+        :return: The handler for the path, and the path's variable parts to call it with
+        """
+
+        parts = tuple(urllib.parse.unquote(x) for x in path.strip('/').split('/'))
+
+        for pattern, handler in self.routes:
+            if len(pattern) == len(parts) and all(x is None or x == y for x, y in zip(pattern, parts)):
+                return handler, [y for x, y in zip(pattern, parts) if x is None]
+
+        raise ApiError(404, f"No endpoint at: {path}")
+
+    def compute_response(self, path: str, params: Dict[str, str]) -> Tuple[str, bytes]:
+        handler, args = self.route(path)
+        body = to_json_bytes(handler(params, *args))
+
+        return '"' + hashlib.sha1(body).hexdigest() + '"', body
+
+    async def get_response(self, path: str, params: Dict[str, str]) -> Tuple[str, bytes]:
+        """
+        :return: The ETag and body of the response, from the cache if it has been computed before
+        """
+
+        # Responses are only valid for the conversations they were computed from (which are replaced when they change)
+        if self._cache_source is not self.user.convos:
+            self._cache.clear()
+            self._daily_totals.clear()
+            self._cache_source = self.user.convos
+
+        key = (path, tuple(sorted(params.items())))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        response = await asyncio.get_running_loop().run_in_executor(self._executor, self.compute_response, path,
+                                                                    params)
+
+        self._cache[key] = response
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return response
+
+    @staticmethod
+    def format_response(status: int, body: bytes = b'', headers: Dict[str, str] = None) -> bytes:
+        headers = {'Content-Type': 'application/json; charset=utf-8', 'Content-Length': str(len(body)),
+                   **(headers or {})}
+        head = f"HTTP/1.1 {status} {status_phrases[status]}\r\n" + \
+               ''.join(f"{key}: {val}\r\n" for key, val in headers.items()) + "\r\n"
+
+        return head.encode('latin-1') + body
+
+    async def handle_request(self, method: str, target: str, headers: Dict[str, str]) -> bytes:
+        if method not in ('GET', 'HEAD'):
+            return self.format_response(405, to_json_bytes({'error': "Only GET requests are supported"}),
+                                        {'Allow': 'GET, HEAD'})
+
+        url = urllib.parse.urlsplit(target)
+        params = dict(urllib.parse.parse_qsl(url.query))
+
+        try:
+            etag, body = await self.get_response(url.path, params)
+
+        except ApiError as err:
+            return self.format_response(err.status, to_json_bytes({'error': str(err)}))
+
+        except Exception as err:
+            logging.warning(f"API request: {target} failed, due to the following: {err}")
+            return self.format_response(500, to_json_bytes({'error': f"{type(err).__name__}: {err}"}))
+
+        # Clients must revalidate each time, which is cheap as unchanged responses have no body
+        cache_headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+        if etag in (x.strip() for x in headers.get('if-none-match', '').split(',')):
+            return self.format_response(304, headers={**cache_headers, 'Content-Length': '0'})
+
+        response = self.format_response(200, body, cache_headers)
+
+        return response[:len(response) - len(body)] if method == 'HEAD' else response
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Connections are kept alive for further requests, until the client closes or asks to close them
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    writer.write(self.format_response(400, to_json_bytes({'error': "Request too large"})))
+                    break
+
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = request_line.split(' ')
+                except ValueError:
+                    writer.write(self.format_response(400, to_json_bytes({'error': "Malformed request"})))
+                    break
+
+                headers = {key.strip().lower(): val.strip() for key, _, val in
+                           (x.partition(':') for x in header_lines if x)}
+
+                writer.write(await self.handle_request(method, target, headers))
+                await writer.drain()
+
+                if headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0':
+                    break
+
+        finally:
+            writer.close()
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port, limit=max_header_bytes)
+        logging.info(f"Serving the analytics API at http://{self.host}:{self.port}/")
+
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        """
+        Serves requests until interrupted (Ctrl+C)
+        """
+
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            logging.info("Analytics API stopped")
+        finally:
+            self._executor.shutdown()
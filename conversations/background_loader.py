@@ -0,0 +1,101 @@
+import logging
+import threading
+from typing import *
+
+from conversations.user import User
+
+
+class BackgroundLoader:
+    """
+    Runs a cache load or build in a background thread, so the console can be used straight away. While building,
+    conversations are added to the loader's User as they are extracted. When a pickled cache is loaded, the User is
+    replaced once unpickling finishes
+    """
+
+    def __init__(self, user_name: str, fb_path: str = None, ig_path: str = None):
+        self.user: Union[User, None] = User(user_name, fb_path, ig_path)
+        self.ready = threading.Event()
+        self.failed = False
+        self.processed = 0
+        self.total = 0
+
+        self._thread: Union[threading.Thread, None] = None
+
+    def start(self, load_func: Callable[..., Union[User, None]], *args, **kwargs):
+        """
+        :param load_func: A function returning the loaded User (or None on failure), which accepts curr_user and
+            progress_callback keyword arguments, e.g. ConvoReader.load_or_create_cache or ConvoReader.build_cache
+        :param args: Positional arguments for load_func
+        :param kwargs: Keyword arguments for load_func
+        """
+
+        if self._thread is not None and self._thread.is_alive():
+            raise RuntimeError("A load is already running in the background")
+
+        self.ready.clear()
+        self.failed = False
+        self.processed = 0
+        self.total = 0
+        self.user = User(self.user.name, self.user.fb_path, self.user.ig_path)
+
+        kwargs = {**kwargs, 'curr_user': self.user, 'progress_callback': self._update_progress}
+        self._thread = threading.Thread(target=self._run, args=(load_func, args, kwargs), daemon=True)
+        self._thread.start()
+
+    def _run(self, load_func: Callable[..., Union[User, None]], args: Tuple, kwargs: Dict):
+        try:
+            loaded_user = load_func(*args, **kwargs)
+
+        except Exception as err:
+            # Bad practice catchall, but the console should keep running and report the failure
+            logging.warning(f"Loading conversations failed, due to the following: {err}")
+            loaded_user = None
+
+        if loaded_user is None:
+            self.failed = True
+        else:
+            self.user = loaded_user
+            self.processed = self.total = len(loaded_user.convos)
+
+        self.ready.set()
+
+    def _update_progress(self, processed: int, total: int):
+        self.processed = processed
+        self.total = total
+
+    def replace_user(self, user: User):
+        """
+        Swaps in a User loaded outside the background thread (e.g. after ingesting a newer export)
+        """
+
+        self.user = user
+        self.failed = False
+        self.processed = self.total = len(user.convos)
+
+    def status(self) -> str:
+        if self.ready.is_set():
+            if self.failed:
+                return "Loading failed"
+
+            quarantined = len(self.user.quarantined_convos)
+            quarantined_desc = f", {quarantined} could not be read (see log)" if quarantined else ""
+
+            return f"Ready ({len(self.user.convos)} conversations{quarantined_desc})"
+
+        if self.total == 0:
+            return "Loading ..."
+
+        return f"Loading ({self.processed} / {self.total} conversations processed, " \
+               f"{len(self.user.convos)} available)"
+
+    def wait_until_ready(self) -> Union[User, None]:
+        """
+        Blocks until the load finishes, for features which need the full dataset
+        :return: The fully loaded User, or None if loading failed
+        """
+
+        if not self.ready.is_set():
+            print(f"Waiting for all conversations to load: {self.status()}")
+            self.ready.wait()
+
+        return None if self.failed else self.user
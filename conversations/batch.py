@@ -0,0 +1,159 @@
+import argparse
+import concurrent.futures
+import logging
+import os
+import time
+from typing import *
+
+import pandas as pd
+
+from conversations.convo import Convo
+from conversations.convo_reader import ConvoReader
+from conversations.name_gender import NameGenderCache
+
+# Manifest columns, only user_name and at least one of the export paths are required
+manifest_cols = ['user_name', 'fb_path', 'ig_path', 'whatsapp_path', 'match_path']
+export_cols = ['fb_path', 'ig_path', 'whatsapp_path']
+summary_file_name = "batch_summary.csv"
+
+
+def read_manifest(manifest_path: str) -> pd.DataFrame:
+    """
+    :param manifest_path: A CSV with a row per export: ['user_name', 'fb_path', 'ig_path', 'whatsapp_path',
+        'match_path'], where match_path is an optional Instagram to Facebook conversation mapping (see
+        ConvoReader.generate_fb_ig_convo_matches)
+    :return: The manifest, with missing optional columns and values as None
+    """
+
+    manifest_df = pd.read_csv(manifest_path, dtype=str, keep_default_na=False)
+
+    if 'user_name' not in manifest_df.columns:
+        raise ValueError(f"The manifest must have a user_name column, found: {list(manifest_df.columns)}")
+
+    manifest_df = manifest_df.reindex(columns=manifest_cols).fillna('')
+    manifest_df = manifest_df.apply(lambda x: x.str.strip())
+
+    if (manifest_df['user_name'] == '').any() or (manifest_df[export_cols] == '').all(axis=1).any():
+        raise ValueError("Every manifest row needs a user_name and at least one of fb_path, ig_path or whatsapp_path")
+
+    return manifest_df.replace('', None)
+
+
+def export_size(*paths: Union[str, None]) -> int:
+    """
+    :return: The total size (bytes) of every file in the export folders, used to estimate how long each will take
+    """
+
+    total_size = 0
+
+    for path in paths:
+        if not path or not os.path.exists(path):
+            continue
+
+        for dir_path, _, file_names in os.walk(path):
+            total_size += sum(os.path.getsize(os.path.join(dir_path, x)) for x in file_names)
+
+    return total_size
+
+
+def user_dirs(batch_root: str, user_name: str) -> Tuple[str, str]:
+    """
+    :return: The (cache, output) folders of a user, each user's results are kept separate
+    """
+
+    user_root = os.path.join(batch_root, Convo.sanitise_text(user_name) or 'unnamed')
+
+    return os.path.join(user_root, "cache"), os.path.join(user_root, "output")
+
+
+def init_worker():
+    # Load the models once per worker process, rather than once per export (or per conversation)
+    logging.basicConfig(level=logging.INFO, format=f'%(levelname)s - %(asctime)s - {os.getpid()} - %(message)s')
+
+    # A model which can't be loaded shouldn't break the pool, exports which need it report the error instead
+    for load_model in (Convo.get_sentiment_model, NameGenderCache.get_model):
+        try:
+            load_model()
+        except Exception as err:
+            logging.warning(f"Failed to preload model, due to the following: {err}")
+
+
+def process_export(batch_root: str, user_name: str, fb_path: str = None, ig_path: str = None,
+                   whatsapp_path: str = None, match_path: str = None) -> Dict[str, Any]:
+    """
+    Loads (or builds) the cache of one export and writes its tables to the user's output folder
+    :return: A summary of the run, structured: {'user_name', 'conversations', 'quarantined', 'duration_s', 'output_dir'}
+    """
+
+    start_time = time.perf_counter()
+    cache_root, output_dir = user_dirs(batch_root, user_name)
+    os.makedirs(output_dir, exist_ok=True)
+
+    matching_df = pd.read_csv(match_path) if match_path and os.path.isfile(match_path) else None
+
+    source_paths = {'WhatsApp': whatsapp_path} if whatsapp_path else {}
+
+    curr_user = ConvoReader.load_or_create_cache(fb_path, cache_root, user_name, ig_path=ig_path,
+                                                 ig_fb_match_df=matching_df, source_paths=source_paths)
+
+    curr_user.get_convo_leaderboard_df().to_csv(os.path.join(output_dir, "Conversation Leaderboard.csv"))
+
+    if curr_user.get_or_create_affect_df() is not None:
+        curr_user.get_convos_ranked_by_affect().to_csv(os.path.join(output_dir, "Sentiment Rankings.csv"), index=False)
+
+    return {'user_name': user_name, 'conversations': len(curr_user.convos),
+            'quarantined': len(curr_user.quarantined_convos), 'duration_s': time.perf_counter() - start_time,
+            'output_dir': output_dir}
+
+
+def run_batch(manifest_path: str, batch_root: str, max_workers: int = None) -> pd.DataFrame:
+    """
+    Processes every export in the manifest with one shared pool of worker processes. The largest exports are started
+    first, so a large export left until the end can't hold up the whole batch
+    :param batch_root: Folder to write each user's cache and output folders to
+    :param max_workers: Number of worker processes, defaults to the number of CPUs
+    :return: A dataframe with a row per export, summarising the run (or the error it failed with)
+    """
+
+    manifest_df = read_manifest(manifest_path)
+    manifest_df['size'] = [export_size(*paths) for paths in manifest_df[export_cols].itertuples(index=False)]
+    manifest_df = manifest_df.sort_values('size', ascending=False, kind='stable')
+
+    logging.info(f"Processing {manifest_df.shape[0]} exports "
+                 f"({manifest_df['size'].sum() / 2 ** 20:,.0f} MB, largest first)")
+
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker) as executor:
+        futures = {executor.submit(process_export, batch_root, **row[manifest_cols].to_dict()): row['user_name']
+                   for _, row in manifest_df.iterrows()}
+
+        for future in concurrent.futures.as_completed(futures):
+            # Bad practice catchall, but one failed export shouldn't stop the rest of the batch
+            try:
+                result = future.result()
+                logging.info(f"Finished {result['user_name']} in {result['duration_s']:.0f}s")
+
+            except Exception as err:
+                logging.warning(f"Failed to process export for: {futures[future]}, due to the following: {err}")
+                result = {'user_name': futures[future], 'error': f"{type(err).__name__}: {err}"}
+
+            results.append(result)
+
+    summary_df = pd.DataFrame(results).reindex(columns=['user_name', 'conversations', 'quarantined', 'duration_s',
+                                                        'output_dir', 'error'])
+
+    os.makedirs(batch_root, exist_ok=True)
+    summary_df.to_csv(os.path.join(batch_root, summary_file_name), index=False)
+
+    return summary_df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Process many exports from a manifest with a shared worker pool")
+    parser.add_argument('manifest_path', help="CSV with columns: " + ", ".join(manifest_cols))
+    parser.add_argument('batch_root', help="Folder for each user's cache and output folders")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(asctime)s - %(message)s')
+    print(run_batch(args.manifest_path, args.batch_root, args.workers).to_string(index=False))
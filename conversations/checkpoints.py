@@ -0,0 +1,78 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import pickle
+import shutil
+from typing import *
+
+from conversations.convo import Convo
+
+
+class BuildCheckpoints:
+    """
+    Saves each conversation to disk as soon as it has been extracted, so a cache build which fails partway (or is
+    killed) can resume from where it stopped rather than starting again. Checkpoints from a build with different
+    inputs are discarded
+    """
+
+    manifest_file_name = "checkpoint_manifest.json"
+
+    def __init__(self, checkpoint_dir: str, build_params: Dict[str, Union[str, None]]):
+        """
+        :param checkpoint_dir: Folder to store checkpoints in
+        :param build_params: Inputs to the build (e.g. user name and export paths), which checkpoints must match
+        """
+
+        self.checkpoint_dir = checkpoint_dir
+        manifest_path = os.path.join(checkpoint_dir, BuildCheckpoints.manifest_file_name)
+
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as file_obj:
+                prev_build_params = json.load(file_obj)
+
+            if prev_build_params != build_params:
+                logging.info("Discarding checkpoints from a build with different inputs")
+                self.clear()
+
+            else:
+                logging.info(f"Resuming from {len(os.listdir(checkpoint_dir)) - 1} checkpointed conversations")
+
+        pathlib.Path(checkpoint_dir).mkdir(parents=True, exist_ok=True)
+
+        with open(manifest_path, "w") as file_obj:
+            json.dump(build_params, file_obj)
+
+    def _checkpoint_path(self, convo_path: str) -> str:
+        return os.path.join(self.checkpoint_dir, hashlib.sha1(convo_path.encode('utf-8')).hexdigest() + ".p")
+
+    def load(self, convo_path: str) -> Union[Tuple[Union[Convo, None], int, int], None]:
+        """
+        :param convo_path: The path of the conversation in the export
+        :return: None if there is no checkpoint, otherwise a tuple structured: (Convo or None if the conversation was
+            empty, User.unknown_people, User.unknown_convos) with the User counters as they were after extracting it
+        """
+
+        checkpoint_path = self._checkpoint_path(convo_path)
+        if not os.path.isfile(checkpoint_path):
+            return None
+
+        try:
+            with open(checkpoint_path, "rb") as file_obj:
+                return pickle.load(file_obj)
+
+        except (IOError, EOFError, pickle.UnpicklingError):
+            logging.info(f"Checkpoint for {convo_path} could not be read, it will be extracted again")
+            return None
+
+    def save(self, convo_path: str, convo: Union[Convo, None], unknown_people: int, unknown_convos: int):
+        checkpoint_path = self._checkpoint_path(convo_path)
+
+        # Write to a temporary file first, so being killed mid-write can't leave a corrupt checkpoint
+        with open(checkpoint_path + ".tmp", "wb") as file_obj:
+            pickle.dump((convo, unknown_people, unknown_convos), file_obj)
+        os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+    def clear(self):
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
@@ -1,13 +1,19 @@
 import os
 import re
+import types
+import warnings
 from typing import *
 
 import nltk
+import numpy as np
 import pandas as pd
 import unicodedata
 # from django.utils.text import slugify
 from tabulate import tabulate
 
+from conversations import engagement, hourly_profiles, leaderboard, near_duplicates, reactions, response_times, \
+    sampling, sessions, shares, text_similarity
+
 nltk.download('vader_lexicon')
 from nltk.sentiment.vader import SentimentIntensityAnalyzer
 
@@ -28,6 +34,17 @@ class Convo:
         'audio_files': 'Voice Memos'
     }
 
+    # Messages separated by more than this gap are split into separate sessions
+    session_gap = pd.Timedelta(minutes=30)
+
+    # Engagement scores are summed into fixed periods, weights not provided here use engagement.default_weights. Each
+    # conversation keeps its own copy of the weights (see Convo.build_engagement)
+    engagement_period = '7D'
+    engagement_weights: Mapping[str, float] = types.MappingProxyType({})
+
+    # Loaded once per process and shared by every conversation (see Convo.get_sentiment_model)
+    _sentiment_model = None
+
     def __init__(self, name: str, speakers: List[str], is_active: bool, is_group: bool,
                  messages_df: pd.DataFrame):
         self.convo_name = name
@@ -46,16 +63,179 @@ class Convo:
         self.msg_count = messages_df.shape[0]
         self.msgs_df = messages_df
 
+        # Reactions are kept in a long format table, referencing messages by their position in msgs_df
+        self.reactions_df = Convo.pop_reactions_df(self.msgs_df)
+
+        # Shared links parsed into URL, domain and path, also referencing messages by their position in msgs_df
+        self.shares_df = shares.build_shares_df(self.msgs_df)
+
         # Guess 'gender' based on name to avoid extensive data entry
         self._pgf = -1  # Retain logistic regression result to enable troubleshooting (set default value)
         self.name_gender = 'Uncertain'
 
+        Convo.add_derived_cols(self.msgs_df)
+
+        self.sessions_df = sessions.build_sessions_df(self.msgs_df, self.session_gap)
+
+        self.engagement_weights = dict(self.engagement_weights)
+        self.engagement_df = engagement.build_period_scores(self.msgs_df, self.engagement_period,
+                                                            self.engagement_weights, self.reaction_counts)
+
+        # Per sender totals (messages, characters, media, calls and reactions), which rankings are served from
+        self.summary_df = leaderboard.build_sender_summary(self.msgs_df, self.reactions_df)
+
+        # Hashed term counts for each sender, used for text similarity across conversations
+        self.text_counts, self.text_senders = text_similarity.build_sender_counts(self.msgs_df)
+
+        # MinHash signatures of longer messages (referenced by position), for finding near-duplicates
+        self.signed_msg_idx, self.msg_signatures = near_duplicates.build_msg_signatures(self.msgs_df)
+
+    @staticmethod
+    def pop_reactions_df(msgs_df: pd.DataFrame) -> pd.DataFrame:
+        # Sources without reactions (and messages created elsewhere, e.g. in tests) have no reactions column
+        reaction_lists = msgs_df.pop('reactions') if 'reactions' in msgs_df.columns else pd.Series([], dtype=object)
+
+        return reactions.build_reactions_df(reaction_lists)
+
+    @property
+    def reaction_counts(self) -> np.ndarray:
+        return reactions.count_reactions_by_msg(self.reactions_df, self.msgs_df.shape[0])
+
+    @staticmethod
+    def add_derived_cols(msgs_df: pd.DataFrame):
         # Add categorical hour of day column
-        self.msgs_df['hour_of_day'] = self.msgs_df.index.map(lambda x: x.hour)
+        msgs_df['hour_of_day'] = msgs_df.index.hour
 
         # Create character counts for each message
-        self.msgs_df['text_len'] = self.msgs_df['text'].apply(lambda x: len(x) if type(x) == str else 0)
+        msgs_df['text_len'] = msgs_df['text'].apply(lambda x: len(x) if type(x) == str else 0)
+
+    @property
+    def last_timestamp_ms(self) -> int:
+        return int(self.msgs_df.index[-1].value // 10 ** 6)
+
+    @staticmethod
+    def msg_keys(msgs_df: pd.DataFrame) -> np.ndarray:
+        '''
+        Hashes each message by (sender, timestamp, content), to identify messages duplicated across overlapping exports
+        :param msgs_df: A dataframe of messages, indexed by timestamp
+        :return: An array of uint64 keys, one per message
+        '''
+
+        key_df = pd.DataFrame({'sender_name': msgs_df['sender_name'].values,
+                               'timestamp_ms': msgs_df.index.asi8 // 10 ** 6,
+                               'text': msgs_df['text'].astype(str).values})
+
+        return pd.util.hash_pandas_object(key_df, index=False).values
+
+    def append_msgs(self, new_msgs_df: pd.DataFrame) -> int:
+        '''
+        Appends newer messages (e.g. from a more recent export), skipping any that have already been stored
+        :param new_msgs_df: A cleaned dataframe of messages, all at or after the last stored timestamp
+        :return: The number of messages appended
+        '''
+
+        if new_msgs_df.shape[0] == 0:
+            return 0
+
+        new_msgs_df = new_msgs_df.sort_index()
+
+        # Only the stored messages which overlap the new messages in time can be duplicates
+        overlap_start = self.msgs_df.index.searchsorted(new_msgs_df.index[0])
+        existing_keys = Convo.msg_keys(self.msgs_df.iloc[overlap_start:])
+        new_keys = Convo.msg_keys(new_msgs_df)
+
+        is_new = ~np.isin(new_keys, existing_keys) & ~pd.Series(new_keys).duplicated().values
+        new_msgs_df = new_msgs_df[is_new].copy()
+
+        if new_msgs_df.shape[0] == 0:
+            return 0
+
+        Convo.add_derived_cols(new_msgs_df)
+
+        new_reactions_df = Convo.pop_reactions_df(new_msgs_df)
+        self.summary_df = leaderboard.add_sender_summaries(
+            self.summary_df, leaderboard.build_sender_summary(new_msgs_df, new_reactions_df))
+
+        new_reactions_df['msg_idx'] += self.msgs_df.shape[0]
+        self.reactions_df = reactions.concat_reactions_dfs([self.reactions_df, new_reactions_df])
+
+        new_shares_df = shares.build_shares_df(new_msgs_df)
+        new_shares_df['msg_idx'] += self.msgs_df.shape[0]
+        self.shares_df = shares.concat_shares_dfs([self.shares_df, new_shares_df])
+
+        new_signed_msg_idx, new_msg_signatures = near_duplicates.build_msg_signatures(new_msgs_df)
+        self.signed_msg_idx = np.concatenate([self.signed_msg_idx, new_signed_msg_idx + self.msgs_df.shape[0]])
+        self.msg_signatures = np.concatenate([self.msg_signatures, new_msg_signatures])
+
+        # Ignore FutureWarning about all-NA columns (e.g. no calls in the newer messages)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            self.msgs_df = pd.concat([self.msgs_df, new_msgs_df])
+
+        if not self.msgs_df.index.is_monotonic_increasing:
+            order = np.argsort(self.msgs_df.index.asi8, kind='stable')
+            self.msgs_df = self.msgs_df.iloc[order]
+
+            # Reactions, shares and signatures reference messages by position, so map them to the sorted positions
+            new_positions = np.empty_like(order)
+            new_positions[order] = np.arange(order.shape[0])
+            self.reactions_df['msg_idx'] = new_positions[self.reactions_df['msg_idx'].values].astype(np.int32)
+            self.shares_df['msg_idx'] = new_positions[self.shares_df['msg_idx'].values].astype(np.int32)
+            self.signed_msg_idx = new_positions[self.signed_msg_idx].astype(np.int32)
+
+        # Only the last session can be extended by newer messages, so only it and anything after it is rebuilt
+        last_session_start = self.sessions_df['start'].iloc[-1]
+        if new_msgs_df.index[0] >= last_session_start:
+            tail_start = self.msgs_df.index.searchsorted(last_session_start)
+            tail_sessions_df = sessions.build_sessions_df(self.msgs_df.iloc[tail_start:], self.session_gap)
+            self.sessions_df = pd.concat([self.sessions_df.iloc[:-1], tail_sessions_df], ignore_index=True)
+        else:
+            self.sessions_df = sessions.build_sessions_df(self.msgs_df, self.session_gap)
+
+        self.engagement_df = engagement.update_period_scores(self.engagement_df, self.msgs_df, new_msgs_df.index[0],
+                                                             self.engagement_period, self.engagement_weights,
+                                                             self.reaction_counts)
 
+        # Term counts are additive, so only the new messages need to be vectorised
+        new_counts, new_senders = text_similarity.build_sender_counts(new_msgs_df)
+        self.text_counts, self.text_senders = text_similarity.add_sender_counts(self.text_counts, self.text_senders,
+                                                                                new_counts, new_senders)
+
+        self.msg_count = self.msgs_df.shape[0]
+        self.speakers.extend([x for x in new_msgs_df['sender_name'].unique() if x not in self.speakers])
+        self.is_group = self.is_group or len(self.msgs_df['sender_name'].unique()) > 2
+
+        return new_msgs_df.shape[0]
+
+
+    def sample_msgs(self, fraction: float, seed: int = 0) -> Union['Convo', None]:
+        '''
+        Creates a copy of the conversation with a deterministic sample of its messages (and their reactions)
+        :param fraction: The approximate fraction of messages to keep
+        :param seed: Different seeds choose different messages
+        :return: The sampled conversation, or None if no messages were sampled
+        '''
+
+        keep = sampling.sample_mask(Convo.msg_keys(self.msgs_df), fraction, seed)
+
+        if not keep.any():
+            return None
+
+        msgs_df = self.msgs_df[keep].drop(columns=['hour_of_day', 'text_len'])
+
+        # Convert the kept reactions back into lists per message, referencing the sampled positions
+        new_positions = np.cumsum(keep) - 1
+        kept_reactions_df = self.reactions_df[keep[self.reactions_df['msg_idx'].values]]
+        reaction_lists = pd.Series(list(zip(kept_reactions_df['actor'].astype(object),
+                                            kept_reactions_df['reaction'].astype(object))),
+                                   index=new_positions[kept_reactions_df['msg_idx'].values], dtype=object)
+        msgs_df['reactions'] = reaction_lists.groupby(level=0).agg(list).reindex(np.arange(msgs_df.shape[0])).values
+
+        sampled_convo = Convo(self.convo_name, list(self.speakers), self.is_active, self.is_group, msgs_df)
+        sampled_convo._pgf = self._pgf
+        sampled_convo.name_gender = self.name_gender
+
+        return sampled_convo
 
     def __str__(self) -> str:
         output = f'''Conversation Name: {self.convo_name}\n
@@ -63,8 +243,6 @@ class Convo:
 
         subset_cols = ['sender_name', 'text_len', 'photos', 'share_link', 'sticker_path', 'call_duration',
                        'call', 'missed_call', 'videos', 'files', 'audio_files', 'gifs']
-        reaction_cols = [x for x in self.msgs_df.columns if '_reaction' in x]
-        subset_cols.extend(reaction_cols)
 
         # Media Columns have counts of elements per message, need to sum these instead of counting
         # Most columns just need to be counted (how many links, stickers etc)
@@ -77,18 +255,25 @@ class Convo:
 
         counts_df['call_duration'] = (counts_df['call_duration'] / 60).round(1)  # Convert from seconds to minutes
 
-        # Collapse multi-index columns, rename using class field dictionary and prettified reaction cols
-        cleaned_reaction_cols = [x.replace('_', ' ').title() for x in reaction_cols]
-        renamed_count_cols = {**Convo.count_cols, **dict(zip(reaction_cols, cleaned_reaction_cols))}
-
+        # Collapse multi-index columns, rename using class field dictionary
         counts_df.columns = counts_df.columns.get_level_values(0)
-        counts_df = counts_df.rename(columns=renamed_count_cols)
+        counts_df = counts_df.rename(columns=Convo.count_cols)
+
+        # Add a column per person, counting how many of each sender's messages they reacted to
+        reaction_counts_df = reactions.count_reactions_by_sender(self.msgs_df['sender_name'].values, self.reactions_df)
+        reaction_counts_df.columns = [f'{x} Reactions' for x in reaction_counts_df.columns]
+        counts_df = counts_df.join(reaction_counts_df.astype(float)).fillna(0)
         
         # Temporarily remove less interesting fields (as they don't fit easily on smaller screens)
         counts_df = counts_df.drop(columns=['Links', 'Stickers', 'Files', 'Videos'])
 
         output += tabulate(counts_df, headers=counts_df.columns, intfmt=",")
 
+        # Links are summarised by their most shared domains instead
+        if self.shares_df.shape[0] > 0:
+            domain_counts = self.shares_df['domain'].value_counts().head(5)
+            output += '\n\nMost Shared Domains: ' + ', '.join(f'{x} ({y:,})' for x, y in domain_counts.items() if y > 0)
+
         return output
 
     def get_char_counts_by_hour(self) -> pd.DataFrame:
@@ -96,13 +281,79 @@ class Convo:
         :return: A data frame containing the msg counts for each speaker (columns) for each hour of the day (rows)
         '''
 
-        # Find the msg counts for each sender, for each hour. Rename columns and fill in the blanks
-        hours_series = self.msgs_df.groupby(['sender_name', 'hour_of_day']).size().unstack(fill_value=0)
-        hours_series.columns = [str(x) + ':00' for x in hours_series.columns]
-        hours_series = hours_series.reindex([str(x) + ':00' for x in range(24)], axis=1, fill_value=0)
-        hours_series.sort_index()
+        # Find the msg counts for each sender, for each hour
+        sender_codes, senders = pd.factorize(self.msgs_df['sender_name'], sort=True)
+        hour_counts = hourly_profiles.build_hour_counts(self.msgs_df['hour_of_day'].values, sender_codes, len(senders))
+
+        return pd.DataFrame(hour_counts.T, index=hourly_profiles.hour_labels, columns=senders)
+
+    def build_sessions(self, gap: pd.Timedelta) -> pd.DataFrame:
+        '''
+        Re-materialises the conversation's sessions using a different gap between sessions
+        :param gap: the minimum time between messages which separates two sessions
+        :return: A data frame with a row per session
+        '''
+
+        self.session_gap = gap
+        self.sessions_df = sessions.build_sessions_df(self.msgs_df, gap)
+
+        return self.sessions_df
+
+    def build_engagement(self, period: str = None, weights: Dict[str, float] = None) -> pd.DataFrame:
+        '''
+        Re-materialises the conversation's engagement scores with a different period or weights
+        :param period: Fixed period to sum scores into (days or smaller, so periods stay anchored to the epoch)
+        :param weights: Points per unit of each column, any weights not provided use engagement.default_weights
+        :return: A data frame indexed by period start, with a column of scores for each sender
+        '''
+
+        self.engagement_period = period or self.engagement_period
+        self.engagement_weights = dict(weights) if weights is not None else self.engagement_weights
+        self.engagement_df = engagement.build_period_scores(self.msgs_df, self.engagement_period,
+                                                            self.engagement_weights, self.reaction_counts)
+
+        return self.engagement_df
+
+    def get_reply_times(self, max_latency: pd.Timedelta = None) -> pd.DataFrame:
+        '''
+        :param max_latency: Optional cut-off, longer gaps are treated as restarting the conversation rather than replies
+        :return: A data frame with a row for each reply (a message following a message from someone else), indexed by
+            the reply's timestamp, with the replier, who they replied to and the latency in seconds
+        '''
+
+        sender_codes, senders = pd.factorize(self.msgs_df['sender_name'])
+        convo_codes = np.zeros(sender_codes.shape[0], dtype=np.int32)
+
+        reply_df = response_times.build_reply_df(self.msgs_df.index.asi8, sender_codes, convo_codes, max_latency)
+
+        return pd.DataFrame({'sender_name': senders[reply_df['sender'].values],
+                             'replied_to': senders[reply_df['replied_to'].values],
+                             'latency_s': reply_df['latency_s'].values},
+                            index=self.msgs_df.index[reply_df['msg_idx']])
+
+    def get_turns(self) -> pd.DataFrame:
+        '''
+        :return: A data frame with a row for each turn (consecutive messages from the same sender), indexed by the
+            turn's start time, with the sender, number of messages and duration in seconds
+        '''
+
+        sender_codes, senders = pd.factorize(self.msgs_df['sender_name'])
+        convo_codes = np.zeros(sender_codes.shape[0], dtype=np.int32)
+
+        turn_df = response_times.build_turn_df(self.msgs_df.index.asi8, sender_codes, convo_codes)
+
+        return pd.DataFrame({'sender_name': senders[turn_df['sender'].values],
+                             'msg_count': turn_df['msg_count'].values,
+                             'duration_s': turn_df['duration_s'].values},
+                            index=self.msgs_df.index[turn_df['start_idx']])
+
+    @staticmethod
+    def get_sentiment_model() -> SentimentIntensityAnalyzer:
+        # Reading the VADER lexicon is far slower than scoring a period, so it is only done once
+        if Convo._sentiment_model is None:
+            Convo._sentiment_model = SentimentIntensityAnalyzer()
 
-        return hours_series.T
+        return Convo._sentiment_model
 
     def build_sentiment_analysis_df(self, user_name: str, sample_period: str, min_period_char: int,
                                     min_periods: int = 5, exclude_txt=True) -> [pd.DataFrame, None]:
@@ -139,8 +390,9 @@ class Convo:
         if user_msgs_df.shape[0] < min_periods:
             period_msgs_df['exclude_convo'] = True
 
-        vader_results = period_msgs_df['text'].apply(
-            lambda x: pd.Series(SentimentIntensityAnalyzer().polarity_scores(x)))
+        sentiment_model = Convo.get_sentiment_model()
+        vader_results = pd.DataFrame([sentiment_model.polarity_scores(x) for x in period_msgs_df['text']],
+                                     index=period_msgs_df.index, columns=['neg', 'neu', 'pos', 'compound'])
         period_msgs_df = period_msgs_df.join(vader_results)
 
         period_msgs_df['text_len'] = period_msgs_df['text'].str.len()
@@ -5,75 +5,39 @@ import pathlib
 import pickle
 import re
 import shutil
-import time
-import warnings
 import zipfile
 from typing import *
 
-import nomquamgender as nqg
 import numpy as np
 import pandas as pd
 
+from conversations.checkpoints import BuildCheckpoints
 from conversations.convo import Convo
+from conversations.msg_store import MsgStore
+from conversations import source_readers
+from conversations.name_gender import NameGenderCache
+from conversations.sketches import OverviewSketches
 from conversations.user import User
 
 
-# FIXME: establish abstract pattern and then build specific implementations for FB, IG, Whatsapp etc, instead of gross
-# hardcoded pattern. However, that is extensive extra work for minimal benefit for now (given limited interest in Whatsapp)
-
-
 class ConvoReader:
     cache_file_name = "user_pickle.p"
-    fb_inbox_path = os.path.join("your_facebook_activity", "messages", "inbox")
-    fb_archive_path = os.path.join("your_facebook_activity", "messages", "archived_threads")
-    ig_inbox_path = os.path.join("your_instagram_activity", "messages", "inbox")
-    file_name_pattern = r"(message_\d{1}.json)"
-
-    # Uses result of json normalisation, which combines names where nested
-    facebook_field_names = {
-        "sender_name": "sender_name",
-        "timestamp_ms": "timestamp",
-        "content": "text",
-        "reactions": "reactions_dict",
-        "type": "major_type",
-        "is_unsent": "is_unsent",
-        "photos": "photos",
-        "share.link": "share_link",
-        "sticker.uri": "sticker_path",
-        "call_duration": "call_duration",
-        "videos": "videos",
-        "share.share_text": "share_text",
-        "files": "files",
-        "missed": "missed_call",
-        "audio_files": "audio_files",
-        "gifs": "gifs"
-    }
-
-    facebook_field_types = {
-        "sender_name": pd.Series(dtype='str'),
-        "timestamp_ms": pd.Series(dtype='int64'),
-        "content": pd.Series(dtype='str'),
-        "reactions": pd.Series(dtype='object'),
-        "type": pd.Series(dtype='str'),
-        "is_unsent": pd.Series(dtype='str'),
-        "photos": pd.Series(dtype='str'),
-        "share.link": pd.Series(dtype='str'),
-        "sticker.uri": pd.Series(dtype='str'),
-        "call_duration": pd.Series(dtype='float64'),
-        "videos": pd.Series(dtype='str'),
-        "share.share_text": pd.Series(dtype='str'),
-        "files": pd.Series(dtype='str'),
-        "missed": pd.Series(dtype='bool'),
-        "audio_files": pd.Series(dtype='str'),
-        "gifs": pd.Series(dtype='str')
-    }
-
-    if set(facebook_field_names.keys()) != set(facebook_field_types.keys()):
-        raise ValueError(
-            "Safety Check Failed: All keys in the field types must be keys in the field names (consistent input pattern)")
-
-    # Model to guess most common binarized gender associated with name, produces 0-1 output to roughly indicate confidence
-    nqg_model = nqg.NBGC()
+    # Increment whenever the cached User (or its Convos) gains or changes attributes, so older caches are rebuilt rather
+    # than failing partway through an analysis
+    cache_version = 2
+    msg_store_dir = "msg_store"
+    sketch_file_name = "overview_sketches.p"
+    checkpoint_dir = "checkpoints"
+    quarantine_file_name = "quarantine.json"
+    # Facebook and Instagram conversations are found and read by source_readers.FacebookReader and InstagramReader
+    fb_inbox_path, fb_archive_path = source_readers.FacebookReader.inbox_paths
+    ig_inbox_path = source_readers.InstagramReader.inbox_paths[0]
+
+    # Senders of deleted accounts are labelled with this and a number, e.g. 'Unknown Person #1'
+    unknown_person_prefix = "Unknown Person #"
+
+    # Name gender guesses are kept outside the cache folder, so they survive cache rebuilds
+    name_pgf_path = os.path.join("model_cache", "name_pgf.csv")
     pgf_cutoff = 0.15
 
 
@@ -114,128 +78,314 @@ class ConvoReader:
 
     @staticmethod
     def read_convos(user_name: str, fb_path: str = None, ig_path: str = None, ig_fb_matches: pd.DataFrame = None,
-                    individual_convo: str = None) -> User:
+                    individual_convo: str = None, curr_user: User = None,
+                    progress_callback: Callable[[int, int], None] = None, checkpoint_dir: str = None,
+                    source_paths: Dict[str, str] = None) -> User:
 
         """
         :param user_name:   Name of person whose data is being analysed
         :param root_path:   Path to folder of zipped or unzipped folders FB has provided (assumes unzipped have same name their zipped counterpart)
         :param individual_convo:    Optional argument to specify a specific person or groupchat's name
+        :param curr_user:   Optional empty User to populate, so conversations can be used (e.g. by another thread) as
+            they are loaded. Conversations are published in batches by replacing User.convos, rather than mutating it,
+            so other threads can safely iterate over the conversations they have
+        :param progress_callback:   Optional function called with (conversations processed, total conversations)
+        :param checkpoint_dir:  Optional folder to checkpoint each extracted conversation to, so a failed read can resume
+        :param source_paths:    Optional export paths of other sources, by source name (see source_readers.readers),
+            e.g. {'WhatsApp': path}
         :return: a User object, containing all the conversations
 
-        Reads all conversations located in the object's filepath
+        Reads all conversations located in the object's filepath. Conversations which fail to be extracted are skipped
+        and recorded in User.quarantined_convos, rather than aborting the whole read
         """
 
-        if (not fb_path and not ig_path) or (ig_path and not os.path.exists(ig_path)) or (fb_path and not os.path.exists(fb_path)):
-            raise ValueError("You must provide a valid data extract path for at least Facebook OR Instagram")
+        source_paths = source_paths or {}
+        ConvoReader.check_export_paths(fb_path, ig_path, source_paths)
+
+        curr_user = curr_user if curr_user is not None else User(user_name, fb_path, ig_path)
+        curr_user.source_paths.update(source_paths)
 
-        curr_user = User(user_name, fb_path, ig_path)
-        convo_list = []
-        
         # ConvoReader.unzip_and_merge_files(fb_path)
 
-        # Identify all conversations in directories (needed even to retrieve individual conversations, to search for FB file names)
-        if curr_user.has_fb:
-            local_fb_inbox_path = os.path.join(fb_path, ConvoReader.fb_inbox_path)
-            convo_list.extend([os.path.join(local_fb_inbox_path, x) for x in os.listdir(local_fb_inbox_path)])
-            
-            # Add archived threads
-            local_fb_archived_path = os.path.join(fb_path, ConvoReader.fb_archive_path)
-            convo_list.extend([os.path.join(local_fb_archived_path, x) for x in os.listdir(local_fb_archived_path)])
-            
+        convo_paths = ConvoReader.find_convo_paths(curr_user, fb_path, ig_path, ig_fb_matches)
 
-        if curr_user.has_ig and curr_user.has_fb:
-            if ig_fb_matches is None:
-                ig_fb_matches = ConvoReader.generate_fb_ig_convo_matches(fb_path, ig_path)
+        source_convos = ConvoReader.find_source_convo_paths(source_paths)
+        convo_paths.extend((x, []) for x in source_convos)
 
-            # Remove rows with no matches
-            ig_fb_matches = ig_fb_matches[ig_fb_matches['ig_path'].notna() & ig_fb_matches['fb_path'].notna()]
+        if individual_convo is not None:
+            individual_path = ConvoReader.find_individual_convo_path(individual_convo, [x[0] for x in convo_paths])
+            convo_paths = [x for x in convo_paths if x[0] == individual_path]
 
-            # Create dictionary to enable easy name standardisation across platforms
-            curr_user.ig_2_fb_names = {key: val for key, val in zip(ig_fb_matches['ig_name'].values, ig_fb_matches['fb_name'].values)}
+        checkpoints = None
+        if checkpoint_dir is not None:
+            build_params = {'user_name': user_name, 'fb_path': fb_path, 'ig_path': ig_path,
+                            'individual_convo': individual_convo, 'source_paths': source_paths,
+                            'cache_version': ConvoReader.cache_version}
+            checkpoints = BuildCheckpoints(checkpoint_dir, build_params)
 
         empty_convo_count = 0
-
-        if curr_user.has_ig:
-            local_ig_inbox_path = os.path.join(ig_path, ConvoReader.ig_inbox_path)
-            
-            # Only add paths for IG accounts that we have identified are not linked to Facebook accounts
-            all_ig_paths = set(os.listdir(local_ig_inbox_path))
-            linked_ig_paths = set(ig_fb_matches['ig_path'][ig_fb_matches['fb_path'].notna()])
-            unlinked_ig_paths = all_ig_paths.difference(linked_ig_paths)
-            convo_list.extend([os.path.join(local_ig_inbox_path, x) for x in unlinked_ig_paths])
-
-        if individual_convo is not None:
-            convo_list = [ConvoReader.find_individual_convo_path(individual_convo, convo_list)]
+        loaded_convos = dict(curr_user.convos)
 
         # Extract each conversation
         logging.info("Extracting conversations:")
-        for ii, convo_path in enumerate(convo_list):
+        for ii, (convo_path, linked_ig_paths) in enumerate(convo_paths):
 
-            # Print out progress every 50 conversations
+            # Print out progress and publish loaded conversations every 50 conversations
             if ii % 50 == 0:
-                logging.info(f"\t\t{ii} / {len(convo_list)}")
+                logging.info(f"\t\t{ii} / {len(convo_paths)}")
+                curr_user.convos = dict(loaded_convos)
 
-            linked_ig_path = None
-            if local_fb_inbox_path in convo_path and curr_user.has_ig:
-                linked_ig_col = ig_fb_matches['ig_path'][ig_fb_matches['fb_path'] == os.path.basename(convo_path)]
+                if progress_callback is not None:
+                    progress_callback(ii, len(convo_paths))
 
-                if linked_ig_col.shape[0] > 1:
-                    raise ValueError(f"Multiple Instagram paths matched to Facebook path: {convo_path}")
+            checkpoint = checkpoints.load(convo_path) if checkpoints is not None else None
 
-                elif linked_ig_col.shape[0] == 1:
-                    linked_ig_path = os.path.join(local_ig_inbox_path, linked_ig_col.iloc[0])
+            if checkpoint is not None:
+                curr_convo, curr_user.unknown_people, curr_user.unknown_convos = checkpoint
 
-            curr_convo = ConvoReader.extract_single_convo(curr_user, convo_path, linked_ig_path)
+            else:
+                # Bad practice catchall, but one malformed conversation shouldn't lose every other conversation
+                try:
+                    if convo_path in source_convos:
+                        curr_convo = ConvoReader.extract_source_convo(curr_user, source_convos[convo_path][0],
+                                                                      convo_path, loaded_convos)
+                    else:
+                        linked_ig_path = ConvoReader.resolve_linked_ig_path(convo_path, linked_ig_paths)
+                        curr_convo = ConvoReader.extract_single_convo(curr_user, convo_path, linked_ig_path)
+
+                except Exception as err:
+                    logging.warning(f"Quarantined conversation: {convo_path}, due to the following: {err}")
+                    curr_user.quarantined_convos[convo_path] = f"{type(err).__name__}: {err}"
+                    continue
+
+                if checkpoints is not None:
+                    checkpoints.save(convo_path, curr_convo, curr_user.unknown_people, curr_user.unknown_convos)
 
             if curr_convo is not None:
-                curr_user.convos[curr_convo.convo_name] = curr_convo
+                # Conversations are keyed by name, so a later conversation with the same name replaces the earlier one
+                if curr_convo.convo_name in loaded_convos:
+                    curr_user.source_dirs = {key: val for key, val in curr_user.source_dirs.items()
+                                             if val != curr_convo.convo_name}
+                loaded_convos[curr_convo.convo_name] = curr_convo
+                curr_user.source_dirs[ConvoReader.source_key(convo_path, source_convos)] = curr_convo.convo_name
 
             else:
                 empty_convo_count += 1
 
+        curr_user.convos = loaded_convos
+        if progress_callback is not None:
+            progress_callback(len(convo_paths), len(convo_paths))
+
         logging.info(f"{empty_convo_count} conversations were empty")
 
+        if curr_user.quarantined_convos:
+            logging.warning(f"{len(curr_user.quarantined_convos)} conversations could not be read and were quarantined")
+
+        ConvoReader.assign_name_genders(curr_user)
+
         curr_user.build_sma_df()
         curr_user.get_or_create_affect_df()
 
         return curr_user
 
     @staticmethod
-    def extract_jsons(file_path, field_types) -> Tuple[pd.DataFrame, bool, str, List[str]]:
+    def read_new_convo_msgs(curr_user: User, fb_path: str = None, ig_path: str = None,
+                            ig_fb_matches: pd.DataFrame = None, source_paths: Dict[str, str] = None) -> List[str]:
+
+        """
+        Delta ingestion of a newer export into an existing User. Each export contains the full history again, so for
+        every conversation only the shards holding messages at or after the last stored timestamp are parsed, and only
+        messages that haven't already been stored are appended. Overlapping messages are detected using a
+        (sender, timestamp, content hash) key
+        :param curr_user: the previously ingested User object, which is updated in place
+        :param fb_path: path to the newer Facebook extract
+        :param ig_path: path to the newer Instagram extract
+        :param ig_fb_matches: optional manual matching of Instagram and Facebook conversation folders
+        :param source_paths: optional paths to the newer exports of other sources, by source name
+        :return: the names of the conversations which were created or had messages appended
+        """
+
+        source_paths = source_paths or {}
+        ConvoReader.check_export_paths(fb_path, ig_path, source_paths)
+
+        # Newer exports may add a platform that the original export didn't have
+        curr_user.fb_path, curr_user.has_fb = (fb_path, True) if fb_path else (curr_user.fb_path, curr_user.has_fb)
+        curr_user.ig_path, curr_user.has_ig = (ig_path, True) if ig_path else (curr_user.ig_path, curr_user.has_ig)
+        curr_user.source_paths.update(source_paths)
 
-        # Identify all json files corresponding to conversation and add file path
-        json_list = [os.path.join(file_path, x) for x in os.listdir(file_path) if
-                     re.match(ConvoReader.file_name_pattern, x)]
+        convo_paths = ConvoReader.find_convo_paths(curr_user, fb_path, ig_path, ig_fb_matches)
+
+        source_convos = ConvoReader.find_source_convo_paths(source_paths)
+        convo_paths.extend((x, []) for x in source_convos)
+
+        changed_convos = []
+
+        logging.info("Extracting new messages:")
+        for ii, (convo_path, linked_ig_paths) in enumerate(convo_paths):
+
+            # Print out progress every 50 conversations
+            if ii % 50 == 0:
+                logging.info(f"\t\t{ii} / {len(convo_paths)}")
 
-        # Setup conversation Dataframe (to guarantee all cols exist, loop through each JSON file and append new rows
-        raw_msgs_df_list = [pd.DataFrame(field_types, index=[])]
+            source_dir = ConvoReader.source_key(convo_path, source_convos)
+            existing_convo = curr_user.convos.get(curr_user.source_dirs.get(source_dir))
+            since_ms = existing_convo.last_timestamp_ms if existing_convo is not None else None
 
-        for path in json_list:
-            # Load json as string as its nesting doesn't allow direct normalisation
+            # Bad practice catchall, but one malformed conversation shouldn't stop every other conversation updating
             try:
-                with open(path) as file_obj:
-                    raw_json_file_str = file_obj.read()
-                    raw_json = json.loads(raw_json_file_str)
+                if convo_path in source_convos:
+                    extracted = ConvoReader.extract_source_msgs(curr_user, source_convos[convo_path][0], convo_path,
+                                                                since_ms, existing_convo)
+                else:
+                    linked_ig_path = ConvoReader.resolve_linked_ig_path(convo_path, linked_ig_paths)
+                    extracted = ConvoReader.extract_convo_msgs(curr_user, convo_path, linked_ig_path, since_ms,
+                                                               existing_convo)
+
+            except Exception as err:
+                logging.warning(f"Quarantined conversation: {convo_path}, due to the following: {err}")
+                curr_user.quarantined_convos[convo_path] = f"{type(err).__name__}: {err}"
+                continue
+
+            if extracted is None:
+                continue
+
+            msgs_df, is_active, title, convo_persons = extracted
+
+            # New conversations from other sources are kept separate from any conversation with the same name
+            if existing_convo is None and convo_path in source_convos and title in curr_user.convos:
+                title = f"{title} ({source_convos[convo_path][0].source_name})"
+
+            # Conversations from caches without source directories are matched on name, deduplication handles the
+            # fully re-read history. Names already owned by another folder were replaced during the original ingest
+            if existing_convo is None and title in curr_user.convos:
+                if title in curr_user.source_dirs.values():
+                    logging.info(f"Skipping {source_dir}, as its name is already used by another conversation")
+                    continue
+
+                existing_convo = curr_user.convos[title]
+
+            if existing_convo is not None:
+                curr_user.source_dirs[source_dir] = existing_convo.convo_name
+                if is_active is not None:
+                    existing_convo.is_active = is_active
+
+                appended_count = existing_convo.append_msgs(msgs_df)
+                if appended_count > 0:
+                    changed_convos.append(existing_convo.convo_name)
+                    ConvoReader.sketch_convo(curr_user, existing_convo, appended_count)
+
+            else:
+                curr_convo = ConvoReader.build_convo(title, convo_persons, is_active, msgs_df)
+
+                if curr_convo is not None:
+                    curr_user.convos[curr_convo.convo_name] = curr_convo
+                    curr_user.source_dirs[source_dir] = curr_convo.convo_name
+                    changed_convos.append(curr_convo.convo_name)
+                    ConvoReader.sketch_convo(curr_user, curr_convo)
+
+        logging.info(f"{len(changed_convos)} conversations had new messages")
+
+        ConvoReader.assign_name_genders(curr_user)
+
+        curr_user.refresh_aggregates(changed_convos)
+
+        return changed_convos
+
+    @staticmethod
+    def check_export_paths(fb_path: str = None, ig_path: str = None, source_paths: Dict[str, str] = None):
+        source_paths = source_paths or {}
+        export_paths = [fb_path, ig_path] + list(source_paths.values())
+
+        if not any(export_paths) or any(x and not os.path.exists(x) for x in export_paths):
+            raise ValueError("You must provide a valid data extract path for at least Facebook, Instagram OR another "
+                             "source")
+
+        unknown_sources = set(source_paths).difference(source_readers.readers)
+        if unknown_sources:
+            raise ValueError(f"No reader for sources: {sorted(unknown_sources)}, available sources are: "
+                             f"{sorted(source_readers.readers)}")
+
+    @staticmethod
+    def find_convo_paths(curr_user: User, fb_path: str = None, ig_path: str = None,
+                         ig_fb_matches: pd.DataFrame = None) -> List[Tuple[str, List[str]]]:
+
+        """
+        Identifies all conversation folders in the extracts and pairs Facebook folders with their linked Instagram
+        folders. Ambiguous links (multiple IG folders) are only raised when the conversation is extracted, using
+        ConvoReader.resolve_linked_ig_path, so they don't stop every other conversation from being read
+        :param curr_user: the current User object instance, which stores the IG -> FB name mapping
+        :return: A list of tuples in a consistent order, structured: (Conversation Path, Linked IG Paths)
+        """
+
+        convo_list = []
+        local_fb_inbox_path = None
+
+        # Identify all conversations in directories (needed even to retrieve individual conversations, to search for FB file names)
+        if fb_path:
+            local_fb_inbox_path = os.path.join(fb_path, ConvoReader.fb_inbox_path)
+
+            # Includes archived threads
+            convo_list.extend(source_readers.facebook_reader.find_convo_paths(fb_path))
+
+        if ig_path and fb_path:
+            if ig_fb_matches is None:
+                ig_fb_matches = ConvoReader.generate_fb_ig_convo_matches(fb_path, ig_path)
+
+            # Remove rows with no matches
+            ig_fb_matches = ig_fb_matches[ig_fb_matches['ig_path'].notna() & ig_fb_matches['fb_path'].notna()]
+
+            # Create dictionary to enable easy name standardisation across platforms
+            curr_user.ig_2_fb_names = {key: val for key, val in zip(ig_fb_matches['ig_name'].values, ig_fb_matches['fb_name'].values)}
+
+        if ig_path:
+            local_ig_inbox_path = os.path.join(ig_path, ConvoReader.ig_inbox_path)
+            
+            # Only add paths for IG accounts that we have identified are not linked to Facebook accounts
+            linked_ig_paths = set(ig_fb_matches['ig_path'][ig_fb_matches['fb_path'].notna()]) if fb_path else set()
+            convo_list.extend([x for x in source_readers.instagram_reader.find_convo_paths(ig_path)
+                               if os.path.basename(x) not in linked_ig_paths])
 
-            except FileNotFoundError as err:
-                print(f"File: {path} not found")
-                print(err)
-                return None
+        convo_paths = []
+        for convo_path in convo_list:
 
-            # Add json normalised data to list, for performant appending once all have been collected
-            raw_msgs_df_list.append(pd.json_normalize(raw_json["messages"]))
+            linked_ig_paths = []
+            if local_fb_inbox_path and local_fb_inbox_path in convo_path and ig_path:
+                linked_ig_col = ig_fb_matches['ig_path'][ig_fb_matches['fb_path'] == os.path.basename(convo_path)]
+                linked_ig_paths = [os.path.join(local_ig_inbox_path, x) for x in linked_ig_col]
 
-        # Ignore FutureWarning that empty df types will affect result, I explicitly want that to happen as I have set them
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            raw_msgs_df = pd.concat(raw_msgs_df_list)
+            convo_paths.append((convo_path, linked_ig_paths))
 
-        is_active = raw_json["is_still_participant"]
-        title = raw_json["title"].encode("latin1").decode("utf-8")
-        participants = [x['name'].encode("latin1").decode("utf-8") for x in raw_json["participants"]]
+        return convo_paths
 
-        # Ugly multiple return to avoid extra file I/O. Take values from last JSON as they are all consistent
-        return raw_msgs_df, is_active, title, participants
+    @staticmethod
+    def find_source_convo_paths(source_paths: Dict[str, str]) -> Dict[str, Tuple[source_readers.SourceReader, str]]:
+        """
+        :param source_paths: Export paths of sources other than Facebook and Instagram, by source name
+        :return: A dictionary in a consistent order, structured: {Conversation Path: (Reader, Source Key)}
+        """
+
+        source_convos = {}
+        for source_name, export_path in source_paths.items():
+            reader = source_readers.readers[source_name]
+            source_convos.update({x: (reader, reader.convo_key(export_path, x))
+                                  for x in reader.find_convo_paths(export_path)})
+
+        return source_convos
+
+    @staticmethod
+    def source_key(convo_path: str, source_convos: Dict[str, Tuple[source_readers.SourceReader, str]]) -> str:
+        """
+        :return: The key identifying the conversation in every export (see User.source_dirs)
+        """
+
+        return source_convos[convo_path][1] if convo_path in source_convos else os.path.basename(convo_path)
+
+    @staticmethod
+    def resolve_linked_ig_path(convo_path: str, linked_ig_paths: List[str]) -> Union[str, None]:
+        if len(linked_ig_paths) > 1:
+            raise ValueError(f"Multiple Instagram paths matched to Facebook path: {convo_path}")
+
+        return linked_ig_paths[0] if linked_ig_paths else None
 
     @staticmethod
     def extract_single_convo(curr_user: User, fb_path: str = None, ig_path: str = None) -> Union[Convo, None]:
@@ -247,39 +397,136 @@ class ConvoReader:
         :return: a "nullable-like" Convo, in case the Convo cannot be initialised properly
         """
 
-        msgs_df = pd.DataFrame()
-        is_active = None
-        title = ''
-        fb_speakers = {}
+        msgs_df, is_active, title, convo_persons = ConvoReader.extract_convo_msgs(curr_user, fb_path, ig_path)
 
-        if fb_path:
-            raw_fb_msgs_df, is_active, title, raw_speakers = ConvoReader.extract_jsons(fb_path,
-                                                                                       ConvoReader.facebook_field_types)
-            msgs_df = ConvoReader.clean_facebook_msg_data(raw_fb_msgs_df)
-            msgs_df['source'] = 'Facebook'
-            fb_speakers = set(msgs_df["sender_name"].unique().tolist() + raw_speakers)
+        return ConvoReader.build_convo(title, convo_persons, is_active, msgs_df)
 
-        if ig_path:
-            # TODO: establish Instagram field types/names (separate function may be required
-            # Is active and is still participant logic doesn't really make sense (separation on one platform?)
-            raw_ig_msgs_df, ig_active, ig_title, raw_speakers = ConvoReader.extract_jsons(ig_path,
-                                                                                          ConvoReader.facebook_field_types)
-            is_active = is_active if is_active else ig_active
-            title = title if title else ig_title
-            # TODO: add separate IG cleaning function
-            ig_msgs_df = ConvoReader.clean_facebook_msg_data(raw_ig_msgs_df)
-            ig_msgs_df['source'] = 'Instagram'
+    @staticmethod
+    def extract_convo_msgs(curr_user: User, fb_path: str = None, ig_path: str = None, since_ms: int = None,
+                           existing_convo: Convo = None) -> Tuple[pd.DataFrame, bool, str, List[str]]:
+
+        """
+        Reads and cleans the messages of a single conversation across Facebook and its linked Instagram conversation.
+        Each platform's conversation is read on its own, then they are linked
+        :param curr_user: the current User object instance, which is being added to
+        :param fb_path: the path to the conversation within the Raw Data extract
+        :param ig_path: the path to the linked Instagram conversation
+        :param since_ms: optional timestamp (ms), only messages from this time onwards are extracted
+        :param existing_convo: the conversation the messages will be appended to, when ingesting a newer export
+        :return: The cleaned messages, whether the user is still a participant, the conversation title and speakers
+        """
+
+        read_convos = []
+        platform_paths = [(source_readers.facebook_reader, fb_path), (source_readers.instagram_reader, ig_path)]
+        for reader, convo_path in platform_paths:
+            if convo_path:
+                msgs_df, is_active, title = ConvoReader.read_source_convo(reader, convo_path, since_ms)
+                speakers = set(msgs_df["sender_name"].unique().tolist() + reader.read_participants(convo_path))
+                read_convos.append((msgs_df, is_active, title, speakers))
+
+        msgs_df, is_active, title = ConvoReader.link_convo_msgs(read_convos)
+
+        title, convo_persons = ConvoReader.label_convo_persons(curr_user, msgs_df, title, existing_convo)
 
-            ig_speakers = set(ig_msgs_df["sender_name"].unique().tolist() + raw_speakers)
+        return msgs_df, is_active, title, convo_persons
 
-            # Preferentially take FB sender name in two person conversations where IG name doesn't match
+    @staticmethod
+    def extract_source_msgs(curr_user: User, reader: source_readers.SourceReader, convo_path: str,
+                            since_ms: int = None,
+                            existing_convo: Convo = None) -> Tuple[pd.DataFrame, bool, str, List[str]]:
+
+        """
+        Reads and cleans the messages of a single conversation from a source other than Facebook or Instagram
+        :param reader: the reader of the conversation's source
+        :param since_ms: optional timestamp (ms), only messages from this time onwards are extracted
+        :param existing_convo: the conversation the messages will be appended to, when ingesting a newer export
+        :return: The cleaned messages, whether the user is still a participant, the conversation title and speakers
+        """
+
+        msgs_df, is_active, title = ConvoReader.read_source_convo(reader, convo_path, since_ms)
+
+        title, convo_persons = ConvoReader.label_convo_persons(curr_user, msgs_df, title, existing_convo)
+
+        return msgs_df, is_active, title, convo_persons
+
+    @staticmethod
+    def read_source_convo(reader: source_readers.SourceReader, convo_path: str,
+                          since_ms: int = None) -> Tuple[pd.DataFrame, Union[bool, None], str]:
+
+        """
+        Reads a conversation from any source through the shared ingest pipeline, before any linking or labelling
+        :param since_ms: optional timestamp (ms), only messages from this time onwards are extracted
+        :return: The cleaned messages, whether the user is still a participant and the conversation title
+        """
+
+        # Read after the messages, as readers may keep the conversation's details while reading them
+        msgs_df = source_readers.build_msgs_df(reader.read_batches(convo_path, since_ms), reader.source_name)
+        title, is_active = reader.read_convo_info(convo_path)
+
+        return msgs_df, is_active, title
+
+    @staticmethod
+    def link_convo_msgs(
+            read_convos: List[Tuple[pd.DataFrame, Union[bool, None], str, Set[str]]]) -> Tuple[pd.DataFrame, bool, str]:
+
+        """
+        Links the same conversation read from several platforms (a Facebook conversation and its Instagram
+        conversation) into one, after each has been read
+        :param read_convos: the messages, whether the user is still a participant, title and speakers read from each
+            platform, with the platform whose names are kept first
+        :return: The merged messages, whether the user is still a participant and the conversation title
+        """
+
+        msgs_df, is_active, title, speakers = read_convos[0]
+        linked_dfs = [msgs_df]
+
+        for linked_df, linked_active, linked_title, linked_speakers in read_convos[1:]:
+            # Is active and is still participant logic doesn't really make sense (separation on one platform?)
+            is_active = is_active if is_active else linked_active
+            title = title if title else linked_title
+
+            # Preferentially take the first platform's sender name in two person conversations where the names don't
+            # match
             # FIXME: Currently assumes user's FB and IG accounts are linked (and therefore share sender names)
-            if fb_path and len(ig_speakers) == 2 and len(fb_speakers) == 2 and ig_speakers != fb_speakers:
-                fb_name = list(fb_speakers.difference(ig_speakers))[0]
-                ig_name = list(ig_speakers.difference(fb_speakers))[0]
-                ig_msgs_df['sender_name'] = ig_msgs_df['sender_name'].replace(ig_name, fb_name)
+            if len(linked_speakers) == 2 and len(speakers) == 2 and linked_speakers != speakers:
+                name = list(speakers.difference(linked_speakers))[0]
+                linked_name = list(linked_speakers.difference(speakers))[0]
+                linked_df['sender_name'] = linked_df['sender_name'].replace(linked_name, name)
+
+            linked_dfs.append(linked_df)
+
+        return ConvoReader.merge_sorted_msgs(linked_dfs), is_active, title
 
-            msgs_df = pd.concat([msgs_df, ig_msgs_df])
+    @staticmethod
+    def extract_source_convo(curr_user: User, reader: source_readers.SourceReader, convo_path: str,
+                             loaded_convos: Dict[str, Convo]) -> Union[Convo, None]:
+
+        """
+        Initialises a Convo from a source other than Facebook or Instagram. A conversation with the same name as one
+        already loaded (e.g. the same person on Facebook) is kept separately, with the source added to its name
+        :param loaded_convos: the conversations already loaded, by name
+        :return: a "nullable-like" Convo, in case the Convo cannot be initialised properly
+        """
+
+        msgs_df, is_active, title, convo_persons = ConvoReader.extract_source_msgs(curr_user, reader, convo_path)
+
+        if title in loaded_convos:
+            title = f"{title} ({reader.source_name})"
+
+        return ConvoReader.build_convo(title, convo_persons, is_active, msgs_df)
+
+    @staticmethod
+    def label_convo_persons(curr_user: User, msgs_df: pd.DataFrame, title: str,
+                            existing_convo: Convo = None) -> Tuple[str, List[str]]:
+
+        """
+        Labels the senders of deleted accounts (in place) and titles untitled conversations after their speakers
+        :param curr_user: the current User object instance, which counts unknown people and conversations
+        :param msgs_df: the cleaned messages of the conversation
+        :param existing_convo: the conversation the messages will be appended to, when ingesting a newer export. Its
+            unknown person keeps the same label, so the messages overlapping the stored ones are still recognised
+        :return: The conversation title and speakers
+        """
 
         convo_persons = list(msgs_df["sender_name"].unique())
 
@@ -287,102 +534,93 @@ class ConvoReader:
         # number of messages (using proxy names), otherwise remove
         # If multiple unknown people are in the same conversation, they will likely be combined. There is little we can do
         if '' in convo_persons:
-            if msgs_df.shape[0] > 2:
-                for idx, val in enumerate(convo_persons):
-                    if val == '':
-                        curr_user.unknown_people += 1
-                        new_label = f"Unknown Person #{curr_user.unknown_people}"
-                        convo_persons[idx] = new_label
-
-                        # Change their sender name, so that it aligns with speakers list
-                        msgs_df['sender_name'] = msgs_df['sender_name'].replace('', new_label)
-            else:
-                convo_persons = [x for x in convo_persons if x != '']
+            existing_labels = [x for x in existing_convo.speakers if x.startswith(ConvoReader.unknown_person_prefix)] \
+                if existing_convo is not None else []
+            msg_count = msgs_df.shape[0] + (existing_convo.msg_count if existing_convo is not None else 0)
 
-        # Remove conversations where only one person has sent a message (conversations are initialised with one msg)
-        if msgs_df.shape[0] <= 1:
-            return None
+            if existing_labels or msg_count > 2:
+                if existing_labels:
+                    new_label = existing_labels[0]
+                else:
+                    curr_user.unknown_people += 1
+                    new_label = f"{ConvoReader.unknown_person_prefix}{curr_user.unknown_people}"
 
-        is_group = len(msgs_df['sender_name'].unique()) > 2
+                convo_persons = [new_label if x == '' else x for x in convo_persons]
 
-        if title == '':
+                # Change their sender name, so that it aligns with speakers list
+                msgs_df['sender_name'] = msgs_df['sender_name'].replace('', new_label)
+            else:
+                convo_persons = [x for x in convo_persons if x != '']
+
+        # Conversations being appended to already have a title
+        if title == '' and msgs_df.shape[0] > 1 and existing_convo is None:
             curr_user.unknown_convos += 1
             title = ', '.join([x for x in convo_persons if x != curr_user.name])
 
-        convo = Convo(title, convo_persons, is_active, is_group, msgs_df)
-        convo._pgf = ConvoReader.nqg_model.get_pgf(convo.convo_name)[0]
-        if convo._pgf < ConvoReader.pgf_cutoff:
-            convo.name_gender = 'Male'
-        elif convo._pgf > (1 - ConvoReader.pgf_cutoff):
-            convo.name_gender = 'Female'
-
-        return convo
+        return title, convo_persons
 
     @staticmethod
-    def restructure_reactions(reactions_list):
+    def build_convo(title: str, convo_persons: List[str], is_active: bool,
+                    msgs_df: pd.DataFrame) -> Union[Convo, None]:
 
         """
-        Converts FB's reaction dictionary for each message from a list with multiple entries into one dictionary linking
-        people and their reaction. Enables splitting into cols to make counting etc easier for group chats
-        :param reactions_list: list of sets containing any users that reacted and their reaction
-        :return: Dictionary of users and their corresponding reaction
+        Initialises a Convo object from cleaned messages
+        :return: a "nullable-like" Convo, in case the Convo cannot be initialised properly
         """
 
-        # Empty values are read as floats, return an empty dictionary so that the apply(series) handles appropriately
-        if type(reactions_list) != list: return {}
-
-        output_dict = {}
+        # Remove conversations where only one person has sent a message (conversations are initialised with one msg)
+        if msgs_df.shape[0] <= 1:
+            return None
 
-        for ii, val in enumerate(reactions_list):
-            person_key = val["actor"].replace(" ", "_").lower() + "_reactions"
-            emoji = val["reaction"].encode("latin1").decode("utf-8")
-            output_dict[person_key] = emoji
+        is_group = len(msgs_df['sender_name'].unique()) > 2
 
-        return output_dict
+        return Convo(title, convo_persons, is_active, is_group, msgs_df)
 
     @staticmethod
-    def clean_facebook_msg_data(msgs_df: pd.DataFrame) -> pd.DataFrame:
+    def assign_name_genders(curr_user: User):
 
         """
-        Renames columns to standardised names, converts types, sorts data, flattens and extracts highly nested columns.
-        :param msgs_df: A dataframe of all the messages in a conversation
-        :return: A dataframe of accessible and flattened messages in a conversation
+        Guesses 'gender' based on conversation names to avoid extensive data entry. All names which haven't been
+        guessed yet are scored in a single batch, using the persistent name table
+        :param curr_user: the User object instance, whose conversations are updated in place
         """
 
-        renamed_msgs_df = msgs_df.rename(columns=ConvoReader.facebook_field_names)
+        unscored_convos = [x for x in curr_user.convos.values() if x._pgf == -1]
+        if len(unscored_convos) == 0:
+            return
 
-        # Convert timestamp, reindex and use to sort
-        # FIXME: Fix janky hack to convert all timestamps from UTC to local zone, or at least provide an override
-        # Unfortunately Facebook gives us insufficient information to infer the tz of the sender for each message
-        renamed_msgs_df["timestamp"] = pd.to_datetime(renamed_msgs_df["timestamp"], unit="ms", utc=True)
-        cleaned_df = renamed_msgs_df.set_index("timestamp").sort_index().tz_convert(time.strftime("%z"))
+        pgfs = NameGenderCache(ConvoReader.name_pgf_path).get_pgfs([x.convo_name for x in unscored_convos])
 
-        # Decode fields with potential utf-8 characters
-        cleaned_df["sender_name"] = cleaned_df["sender_name"].astype(str).apply(
-            lambda x: x.encode("latin1").decode("utf-8"))
-        cleaned_df["text"] = cleaned_df["text"].astype(str).apply(lambda x: x.encode("latin1").decode("utf-8"))
+        for convo in unscored_convos:
+            convo._pgf = pgfs[convo.convo_name]
+            if convo._pgf < ConvoReader.pgf_cutoff:
+                convo.name_gender = 'Male'
+            elif convo._pgf > (1 - ConvoReader.pgf_cutoff):
+                convo.name_gender = 'Female'
 
-        # Clean reaction encoding FIXME: poor way to split out str into dict, however performance is not terrible
-        cleaned_df["reactions_dict"] = cleaned_df["reactions_dict"].apply(
-            lambda x: ConvoReader.restructure_reactions(x))
+    @staticmethod
+    def merge_sorted_msgs(msgs_dfs: List[pd.DataFrame]) -> pd.DataFrame:
 
-        # Split out reactions into individual columns
-        reactions_df = pd.DataFrame(cleaned_df['reactions_dict'].values.tolist(), index=cleaned_df.index)
-        cleaned_df = pd.concat([cleaned_df, reactions_df], axis=1)
-        cleaned_df.drop("reactions_dict", axis='columns', inplace=True)
+        """
+        Merges dataframes of messages which are each in time order (e.g. a conversation's Facebook and Instagram
+        messages) into one dataframe in time order. The stable sort used (timsort) finds the ordered runs and
+        merges them, so this takes linear passes rather than a full sort. Messages with the same timestamp keep the
+        order of the dataframes. Dataframes which aren't in time order are still fully sorted, with a warning
+        :param msgs_dfs: Dataframes of messages indexed by timestamp
+        :return: The combined messages, with a monotonically increasing index
+        """
 
-        # Extract video and photo counts (don't need nested uris)
-        media_cols = ["photos", "videos", "audio_files", "files"]
-        for col in media_cols:
-            cleaned_df[col] = cleaned_df[col].apply(lambda x: len(x) if type(x) is list else 0)
+        unordered_count = sum(not x.index.is_monotonic_increasing for x in msgs_dfs)
+        if unordered_count > 0:
+            logging.warning(f"{unordered_count} of {len(msgs_dfs)} sets of messages were out of time order, "
+                            f"so they were fully sorted")
 
-        # Extract call data
-        cleaned_df['missed_call'] = np.logical_and(cleaned_df['call_duration'].notna(),
-                                                   cleaned_df['call_duration'] == 0)
-        cleaned_df['call'] = np.logical_and(cleaned_df['call_duration'].notna(),
-                                                       cleaned_df['call_duration'] > 0)
+        msgs_df = pd.concat(msgs_dfs) if len(msgs_dfs) > 1 else msgs_dfs[0]
 
-        return cleaned_df
+        if not msgs_df.index.is_monotonic_increasing:
+            msgs_df = msgs_df.iloc[np.argsort(msgs_df.index.values, kind='stable')]
+
+        return msgs_df
 
     @staticmethod
     def find_individual_convo_path(individual_name: str, convo_list: List[str]) -> str:
@@ -409,9 +647,27 @@ class ConvoReader:
 
         return fb_convo_str
     
+    @staticmethod
+    def sketch_convo(curr_user: User, convo: Convo, new_msg_count: int = None,
+                     max_latency: pd.Timedelta = pd.Timedelta(hours=12)):
+
+        """
+        Adds a conversation's newly ingested messages to the User's overview sketches
+        :param new_msg_count: The number of messages appended to the conversation, defaults to all of its messages
+        :param max_latency: Gaps longer than this are treated as restarting the conversation rather than replies
+        """
+
+        # Newer messages are appended after the stored ones
+        new_msgs_df = convo.msgs_df.iloc[-new_msg_count:] if new_msg_count else convo.msgs_df
+        curr_user.sketches.add_msgs(convo.convo_name, new_msgs_df)
+
+        reply_df = convo.get_reply_times(max_latency)
+        curr_user.sketches.add_reply_latencies(reply_df['latency_s'].values[reply_df.index >= new_msgs_df.index[0]])
+
     @staticmethod
     def build_cache(fb_path: str, cache_root: str, user_name: str, ig_path: str = None,
-                    ig_fb_matches: pd.DataFrame = None):
+                    ig_fb_matches: pd.DataFrame = None, curr_user: User = None,
+                    progress_callback: Callable[[int, int], None] = None, source_paths: Dict[str, str] = None):
 
         cached_data = None
         full_cache_path = os.path.join(cache_root, ConvoReader.cache_file_name)
@@ -419,14 +675,35 @@ class ConvoReader:
 
         try:
             # Import Convos
-            cached_data = ConvoReader.read_convos(user_name, fb_path, ig_path=ig_path, ig_fb_matches=ig_fb_matches)
+            # Conversations are checkpointed as they are extracted, so a failed build resumes when it is rerun
+            checkpoint_path = os.path.join(cache_root, ConvoReader.checkpoint_dir)
+            cached_data = ConvoReader.read_convos(user_name, fb_path, ig_path=ig_path, ig_fb_matches=ig_fb_matches,
+                                                  curr_user=curr_user, progress_callback=progress_callback,
+                                                  checkpoint_dir=checkpoint_path, source_paths=source_paths)
 
             # Check if cache directory exists, if not create it
             pathlib.Path(cache_root).mkdir(parents=True, exist_ok=True)
 
-            # Cache user object
-            with open(full_cache_path, "wb") as file_obj:
+            ConvoReader.write_msg_store(cached_data, cache_root)
+
+            # Summarise every message for instant overviews, saved separately so they can be read without the cache
+            cached_data.sketches = OverviewSketches()
+            for convo in cached_data.convos.values():
+                ConvoReader.sketch_convo(cached_data, convo)
+            cached_data.sketches.save(os.path.join(cache_root, ConvoReader.sketch_file_name))
+
+            # Report conversations which failed to be read, so they can be investigated
+            with open(os.path.join(cache_root, ConvoReader.quarantine_file_name), "w") as file_obj:
+                json.dump(cached_data.quarantined_convos, file_obj, indent=4)
+
+            # Cache user object. Write to a temporary file first, so being killed mid-write can't corrupt the cache
+            cached_data.cache_version = ConvoReader.cache_version
+            with open(full_cache_path + ".tmp", "wb") as file_obj:
                 pickle.dump(cached_data, file_obj)
+            os.replace(full_cache_path + ".tmp", full_cache_path)
+
+            # Checkpoints are no longer needed once the full cache has been written
+            shutil.rmtree(checkpoint_path, ignore_errors=True)
 
         except IOError as err:
             logging.info("Cache Build Failed")
@@ -437,9 +714,74 @@ class ConvoReader:
 
         return cached_data
 
+    @staticmethod
+    def write_msg_store(curr_user: User, cache_root: str, convo_names: List[str] = None):
+
+        """
+        Writes conversations to the on-disk columnar message store and attaches it to the User, so queries can read
+        only the columns and rows they need
+        :param convo_names: Optional names of the conversations to (re)write, defaults to all
+        """
+
+        msg_store = curr_user.msg_store or MsgStore(os.path.join(cache_root, ConvoReader.msg_store_dir))
+
+        for convo_name in (convo_names if convo_names is not None else curr_user.convos.keys()):
+            msg_store.write_convo(convo_name, curr_user.convos[convo_name].msgs_df)
+
+        msg_store.save_manifest()
+        curr_user.msg_store = msg_store
+
+    @staticmethod
+    def update_cache(fb_path: str, cache_root: str, user_name: str, ig_path: str = None,
+                     ig_fb_matches: pd.DataFrame = None, source_paths: Dict[str, str] = None):
+
+        """
+        Ingests only the new messages from a newer export into the existing cache (building it if it doesn't exist)
+        """
+
+        full_cache_path = os.path.join(cache_root, ConvoReader.cache_file_name)
+
+        if not os.path.exists(full_cache_path):
+            return ConvoReader.build_cache(fb_path, cache_root, user_name, ig_path, ig_fb_matches,
+                                           source_paths=source_paths)
+
+        cached_data = None
+        logging.info("Updating Cache")
+
+        try:
+            with open(full_cache_path, "rb") as file_obj:
+                cached_data = pickle.load(file_obj)
+
+            # A cache from a different version is missing attributes, so is rebuilt from the newer export instead
+            if getattr(cached_data, 'cache_version', None) != ConvoReader.cache_version:
+                logging.info("Cache was built by a different version, rebuilding")
+                return ConvoReader.build_cache(fb_path, cache_root, user_name, ig_path, ig_fb_matches,
+                                               source_paths=source_paths)
+
+            changed_convos = ConvoReader.read_new_convo_msgs(cached_data, fb_path, ig_path=ig_path,
+                                                             ig_fb_matches=ig_fb_matches, source_paths=source_paths)
+            ConvoReader.write_msg_store(cached_data, cache_root, changed_convos)
+            cached_data.sketches.save(os.path.join(cache_root, ConvoReader.sketch_file_name))
+
+            # Write to a temporary file first, so a failure can't corrupt the existing cache
+            with open(full_cache_path + ".tmp", "wb") as file_obj:
+                pickle.dump(cached_data, file_obj)
+            os.replace(full_cache_path + ".tmp", full_cache_path)
+
+        except IOError as err:
+            logging.info("Cache Update Failed")
+            logging.info(err)
+
+        else:
+            logging.info("Cache Updated")
+
+        return cached_data
+
     @staticmethod
     def load_or_create_cache(fb_path: str, cache_root: str, user_name: str, ig_path: str = None,
-                             ig_fb_match_df: pd.DataFrame = None):
+                             ig_fb_match_df: pd.DataFrame = None, curr_user: User = None,
+                             progress_callback: Callable[[int, int], None] = None,
+                             source_paths: Dict[str, str] = None):
 
         cached_data = None
         full_cache_path = os.path.join(cache_root, ConvoReader.cache_file_name)
@@ -449,17 +791,27 @@ class ConvoReader:
                 with open(full_cache_path, "rb") as file_obj:
                     cached_data = pickle.load(file_obj)
 
-            except IOError:
+            except (IOError, EOFError, pickle.UnpicklingError):
                 print("The Cache Output Filepath exists but could not be opened. It will be rebuilt")
-                # Delete the previous filepath, triggering a rebuild of the cache
-                shutil.rmtree(cache_root)
+                # Delete the previous file, triggering a rebuild of the cache (keeping any checkpoints to resume from)
+                os.remove(full_cache_path)
 
             else:
-                print("Cache: Found")
-                # TODO: Add Cache Integrity Check
+                if getattr(cached_data, 'cache_version', None) != ConvoReader.cache_version:
+                    # Caches built before attributes were added would fail once analyses use them
+                    print("The Cache was built by a different version. It will be rebuilt")
+                    os.remove(full_cache_path)
+
+                else:
+                    print("Cache: Found")
+                    # TODO: Add Cache Integrity Check
+
+                    msg_store_path = os.path.join(cache_root, ConvoReader.msg_store_dir)
+                    cached_data.msg_store = MsgStore(msg_store_path) if os.path.isdir(msg_store_path) else None
 
         if not os.path.exists(full_cache_path):
-            cached_data = ConvoReader.build_cache(fb_path, cache_root, user_name, ig_path, ig_fb_match_df)
+            cached_data = ConvoReader.build_cache(fb_path, cache_root, user_name, ig_path, ig_fb_match_df, curr_user,
+                                                  progress_callback, source_paths)
 
         return cached_data
 
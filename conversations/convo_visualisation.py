@@ -4,66 +4,167 @@ import warnings
 from typing import *
 
 import bar_chart_race as bcr
+import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+import scipy.spatial
+import scipy.stats
 import seaborn as sns
-from mplcursors import cursor
 
 
 # -*- coding: utf-8 -*-
 
-def create_msg_time_hist(hours_series: pd.DataFrame, convo_name: str) -> plt.Figure:
+class FigureTemplates:
+    """
+    Keeps one figure for each chart type and layout (e.g. number of speakers), so charts for every conversation reuse
+    the same figure, axes, legend and layout, only updating the data, labels and limits. Each chart should be saved
+    before the next chart of the same type is created, as it is then overwritten
+    """
+
+    def __init__(self):
+        self._templates = dict()
+
+    def get(self, template_cls: type, *layout) -> Any:
+        """
+        :param template_cls: The template class of the chart type, e.g. MsgTimeHistTemplate
+        :param layout: The arguments the template is built with, a new template is only built for a new layout
+        """
+
+        key = (template_cls, *layout)
+        if key not in self._templates:
+            self._templates[key] = template_cls(*layout)
+
+        return self._templates[key]
+
+
+def get_template(templates: Union[FigureTemplates, None], template_cls: type, *layout) -> Any:
+    # Without a set of templates, a new figure is built for each chart
+    return templates.get(template_cls, *layout) if templates is not None else template_cls(*layout)
+
+
+def kde_curve(values: np.ndarray, grid_size: int = 200, cut: float = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gaussian kernel density estimate with Scott's bandwidth, evaluated past the data by cut bandwidths (as seaborn does)
+    :return: The x values and their densities, both empty if the density can't be estimated
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+
+    if values.shape[0] < 2 or np.ptp(values) == 0:
+        return np.array([]), np.array([])
+
+    kde = scipy.stats.gaussian_kde(values, bw_method='scott')
+    bandwidth = kde.factor * values.std(ddof=1)
+    x_values = np.linspace(values.min() - cut * bandwidth, values.max() + cut * bandwidth, grid_size)
+
+    return x_values, kde(x_values)
+
+
+class MsgTimeHistTemplate:
+    hist_hours = [str(x) + ":00" for x in range(24)]
+
+    def __init__(self, n_speakers: int):
+        # Use np.arrange and -0.5 to create bins centred on labels
+        self.fig = plt.figure(figsize=(14, 8))
+        self.ax = self.fig.gca()
+        _, _, bars = self.ax.hist([self.hist_hours] * n_speakers, bins=np.arange(25) - 0.5,
+                                  weights=np.zeros((24, n_speakers)))
+
+        # A single speaker's bars aren't wrapped in a list
+        self.bars = bars if n_speakers > 1 else [bars]
+        self.legend = self.ax.legend([""] * n_speakers, loc="upper left")
+        plt.close(self.fig)
+
+    def update(self, hours_series: pd.DataFrame, convo_name: str) -> plt.Figure:
+        for bars, speaker in zip(self.bars, hours_series.columns):
+            for bar, height in zip(bars, hours_series[speaker].values):
+                bar.set_height(height)
+
+        for text, speaker in zip(self.legend.get_texts(), hours_series.columns):
+            text.set_text(speaker)
+
+        self.ax.set_ylim(0, (hours_series.values.max() or 1) * 1.05)
+        self.ax.set_title(f"Histogram of Characters Sent by Hour of the Day and Sender for {convo_name}")
+
+        return self.fig
+
+
+def create_msg_time_hist(hours_series: pd.DataFrame, convo_name: str,
+                         templates: FigureTemplates = None) -> plt.Figure:
     """
     Creates a plot which shows the frequency of msgs for each hour of the day and speaker.
     :param hours_series: A dataframe with each row as hours of the day, and each column a new speaker
     :param convo_name: A string, containing the name of the conversation
+    :param templates: Optional figure templates to reuse (see FigureTemplates), otherwise a new figure is built
     :return: A Matplotlib figure of time of the day message frequency
     """
 
     if len(hours_series.shape) != 2 or hours_series.shape[0] != 24 or hours_series.shape[1] < 1:
         raise ValueError("hours series must have shape (x, 24), and x > 0")
 
-    # Create hourly labels for time histogram, 2D array to match shape of series
-    hist_hours = [[str(x) + ":00" for x in range(24)] for y in range(hours_series.shape[1])]
+    return get_template(templates, MsgTimeHistTemplate, hours_series.shape[1]).update(hours_series, convo_name)
+
+
+class TimelineHistTemplate:
+
+    def __init__(self, n_speakers: int):
+        self.fig, axs = plt.subplots(n_speakers, 1, figsize=(16, 8), squeeze=False)
+        self.axs = axs[:, 0]
+        self.title = self.fig.suptitle("Weekly Histogram of Character Counts")
+
+        # Steps can have their bins and heights replaced, unlike the separate bars of a histogram
+        self.steps = []
+        for ax in self.axs:
+            self.steps.append(ax.stairs([0], [0, 1], fill=True, alpha=0.8))
+            ax.xaxis_date()
+            ax.set_xlabel("Speaker")
+            ax.grid(True)
 
-    # Use np.arrange and -0.5 to create bins centred on labels
-    histogram = plt.figure(figsize=(14, 8))
-    plt.hist(hist_hours, bins=np.arange(25) - 0.5, weights=hours_series)
-    plt.legend([x for x in hours_series.columns], loc="upper left")
+        self.axs[-1].set_title("Time")
+        self.fig.tight_layout()
+        plt.close(self.fig)
 
-    plt.title(f"Histogram of Characters Sent by Hour of the Day and Sender for {convo_name}")
-    plt.close()
+    def update(self, convo_name: str, weekly_counts: pd.Series, speakers: List[str]) -> plt.Figure:
+        self.title.set_text("Weekly Histogram of Character Counts for " + convo_name)
+        senders = weekly_counts.index.get_level_values(0)
 
-    return histogram
+        for ax, steps, speaker in zip(self.axs, self.steps, speakers):
+            speaker_counts = weekly_counts[senders == speaker]
 
+            # Each week is counted in a bin starting 3 days before it and ending where the next week's starts
+            edges = mdates.date2num((speaker_counts.index.get_level_values(1) - datetime.timedelta(3)).to_pydatetime())
+            heights = speaker_counts.values[:-1]
 
-def create_timeline_hist(convo_name: str, msgs_df: pd.DataFrame, speakers: List[str]) -> plt.Figure:
+            if edges.shape[0] < 2:
+                edges, heights = np.array([0, 1]), np.array([0])
+
+            steps.set_data(heights, edges)
+
+            margin = (edges[-1] - edges[0]) * 0.05
+            ax.set_xlim(edges[0] - margin, edges[-1] + margin)
+            ax.set_ylim(0, (heights.max(initial=0) or 1) * 1.05)
+            ax.set_xlabel(speaker)
+
+        return self.fig
+
+
+def create_timeline_hist(convo_name: str, msgs_df: pd.DataFrame, speakers: List[str],
+                         templates: FigureTemplates = None) -> plt.Figure:
     """
     Creates a histogram of character counts sent by each user every 3 days for the entire history of the conversation
     :param convo_name: Name of conversation. To be included in the title
     :param msgs_df: A dataframe containing all the messages of the conversation
     :param speakers: A list of the speakers names to include in the legend
+    :param templates: Optional figure templates to reuse (see FigureTemplates), otherwise a new figure is built
     :return:
     """
 
     # Calculate sums of message character counts for each week for each sender
     weekly_counts = msgs_df.groupby("sender_name").resample("W")["text_len"].sum()
 
-    fig, axs = plt.subplots(len(speakers), 1, figsize=(16, 8))
-    fig.suptitle("Weekly Histogram of Character Counts for " + convo_name)
-
-    for ii, speaker in enumerate(speakers):
-        bins = weekly_counts[speaker].index - datetime.timedelta(3)
-        axs[ii].hist(weekly_counts[speaker].index, bins=bins, weights=weekly_counts[speaker].values, alpha=0.8)
-        axs[ii].set_xlabel(speaker)
-        axs[ii].grid(True)
-
-    axs[len(speakers) - 1].set_title("Time")
-    fig.tight_layout()
-    plt.close()
-
-    return fig
+    return get_template(templates, TimelineHistTemplate, len(speakers)).update(convo_name, weekly_counts, speakers)
 
 
 def create_bcr_top_convo_animation(agg_msg_count_df: pd.DataFrame, top_n: int, frame_length: int, output_path: str,
@@ -107,8 +208,61 @@ def create_bcr_top_convo_animation(agg_msg_count_df: pd.DataFrame, top_n: int, f
     logging.info("Finished Rendering")
 
 
+class SentimentDistTemplate:
+
+    def __init__(self, n_fields: int):
+        self.fig, axs = plt.subplots(n_fields, 2, sharey='all', sharex='all', figsize=(16, 10), squeeze=False)
+        # Flatten axes to allow 1d indexing in case of 1d or 2d subplot struture (only one field submitted)
+        self.axes = axs.flatten()
+
+        self.axes[0].set_title("User Messaging Behaviour", fontfamily='serif', loc='center', fontsize='medium')
+        self.axes[1].set_title("Other Speakers Messaging Behaviour", fontfamily='serif', loc='center',
+                               fontsize='medium')
+
+        # Each axis compares the conversation's density curve to the population's
+        self.curves = [(ax.plot([], [])[0], ax.plot([], [])[0]) for ax in self.axes]
+        self.legends = [ax.legend(labels=["", "Population"], title="") for ax in self.axes]
+        for ax in self.axes:
+            ax.set_xlabel("tone score [0-1]")
+            ax.set_ylabel("Density")
+
+        self.fig.tight_layout()
+        plt.close(self.fig)
+
+    def update(self, user_df: pd.DataFrame, receiver_df: pd.DataFrame, convo_name: str, user_name: str,
+               fields: List[str]) -> plt.Figure:
+
+        x_limits, y_max = [np.inf, -np.inf], 0
+
+        for ii, field in enumerate(fields):
+            for jj, (cat_df, cat_col, label) in enumerate([(user_df, "user_cat", user_name),
+                                                           (receiver_df, "receiver_cat", convo_name)]):
+                ax_idx = 2 * ii + jj
+                is_convo = (cat_df[cat_col] == convo_name).values
+
+                for curve, values in zip(self.curves[ax_idx], (cat_df[field].values[is_convo],
+                                                               cat_df[field].values[~is_convo])):
+                    x_values, densities = kde_curve(values)
+                    curve.set_data(x_values, densities)
+
+                    if x_values.shape[0]:
+                        x_limits = [min(x_limits[0], x_values[0]), max(x_limits[1], x_values[-1])]
+                        y_max = max(y_max, densities.max())
+
+                self.legends[ax_idx].get_texts()[0].set_text(label)
+                self.axes[ax_idx].set_xlabel(f"{field} tone score [0-1]")
+
+        # Axes are shared, so setting the first axis' limits sets them all
+        if np.isfinite(x_limits).all():
+            margin = (x_limits[1] - x_limits[0]) * 0.05
+            self.axes[0].set_xlim(x_limits[0] - margin, x_limits[1] + margin)
+        self.axes[0].set_ylim(0, (y_max or 1) * 1.05)
+
+        return self.fig
+
+
 def create_sentiment_dist_comparison(user_df: pd.DataFrame, receiver_df: pd.DataFrame, convo_name: str, user_name: str,
-                                     fields: List[str]) -> plt.Figure:
+                                     fields: List[str], templates: FigureTemplates = None) -> plt.Figure:
     # Check that fields have been provided and they exist within the dataframe
     extra_fields = set(fields).difference(set(user_df.columns)).union(set(fields).difference(set(receiver_df.columns)))
     if len(fields) == 0:
@@ -118,40 +272,117 @@ def create_sentiment_dist_comparison(user_df: pd.DataFrame, receiver_df: pd.Data
         raise ValueError(
             f"fields variable must only contain columns in the dataframe, the following were not found: {extra_fields}")
 
-    fig, axs = plt.subplots(len(fields), 2, sharey='all', sharex='all', figsize=(16, 10))
-    # Flatten axes to allow 1d indexing in case of 1d or 2d subplot struture (only one field submitted)
-    fltn_axes = axs.flatten()
+    return get_template(templates, SentimentDistTemplate, len(fields)).update(user_df, receiver_df, convo_name,
+                                                                               user_name, fields)
 
-    fltn_axes[0].set_title("User Messaging Behaviour", fontfamily='serif', loc='center', fontsize='medium')
-    fltn_axes[1].set_title("Other Speakers Messaging Behaviour", fontfamily='serif', loc='center', fontsize='medium')
 
-    for ii, field in enumerate(fields):
-        user_axes = fltn_axes[2 * ii]
-        sns.kdeplot(user_df, x=field, hue="user_cat", common_norm=False, ax=user_axes)
-        user_axes.legend(labels=[user_name, "Population"], title="")
-        user_axes.set_xlabel(f"{field} tone score [0-1]")
+class QuadrantView:
+    """
+    Interactive scatter plot which stays responsive with many thousands of points. Points overlapping at the current
+    zoom are merged into one (drawn larger), the nearest point to the mouse is found with a KD-tree over the points'
+    screen positions, and the hover label is redrawn on its own with blitting rather than redrawing the whole figure
+    """
 
-        receiver_axes = fltn_axes[2 * ii + 1]
-        sns.kdeplot(receiver_df, x=field, hue="receiver_cat", common_norm=False, ax=receiver_axes)
-        receiver_axes.legend(labels=[convo_name, "Population"], title="")
-        receiver_axes.set_xlabel(f"{field} tone score [0-1]")
+    # Points within the same square of this many pixels are drawn as one, and hovering within hover_px shows a label
+    cell_px = 8
+    hover_px = 10
+    marker_size = 100
 
-    fig.tight_layout()
-    plt.close()
+    def __init__(self, ax: plt.Axes, x: np.ndarray, y: np.ndarray, names: np.ndarray, categories: np.ndarray):
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        self.points = np.column_stack([x, y]).astype(np.float64)
+        self.names = np.asarray(names, dtype=object)
 
-    return fig
+        self.category_codes, category_labels = pd.factorize(pd.Series(categories).fillna('Unknown'), sort=True)
+        self.scatters = [ax.scatter(*self.points[self.category_codes == ii].T, s=self.marker_size, label=label)
+                         for ii, label in enumerate(category_labels)]
+        ax.legend(title="")
+
+        # Fix the limits to all the points, as only some of them are drawn at a time
+        ax.autoscale_view()
+        ax.set_autoscale_on(False)
+
+        self.annotation = ax.annotate("", xy=(0, 0), xytext=(15, 15), textcoords="offset points",
+                                      bbox={'boxstyle': 'round', 'fc': 'w'}, arrowprops={'arrowstyle': '->'},
+                                      visible=False, animated=True)
+        self.background = None
+        self.tree = None
+
+        ax.callbacks.connect('xlim_changed', self.update_view)
+        ax.callbacks.connect('ylim_changed', self.update_view)
+        self.canvas.mpl_connect('resize_event', self.update_view)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+        self.canvas.mpl_connect('motion_notify_event', self.on_hover)
+
+        self.update_view()
+
+    def update_view(self, *_):
+        pixels = self.ax.transData.transform(self.points)
+        self.tree = scipy.spatial.cKDTree(pixels)
+
+        # Only keep the first point of each occupied cell (per category) inside the axes
+        x_min, y_min, x_max, y_max = self.ax.bbox.extents
+        is_visible = (pixels[:, 0] >= x_min) & (pixels[:, 0] <= x_max) & (pixels[:, 1] >= y_min) & \
+                     (pixels[:, 1] <= y_max)
+
+        cells = np.floor((pixels - [x_min, y_min]) / self.cell_px).astype(np.int64)
+        n_cols, n_rows = int((x_max - x_min) / self.cell_px) + 2, int((y_max - y_min) / self.cell_px) + 2
+        cell_keys = (self.category_codes * n_rows + cells[:, 1]) * n_cols + cells[:, 0]
+
+        visible_idx = np.flatnonzero(is_visible)
+        _, first_idx, counts = np.unique(cell_keys[visible_idx], return_index=True, return_counts=True)
+        kept_idx = visible_idx[first_idx]
+
+        for ii, scatter in enumerate(self.scatters):
+            is_category = self.category_codes[kept_idx] == ii
+            scatter.set_offsets(self.points[kept_idx[is_category]])
+            scatter.set_sizes(self.marker_size * (1 + np.log2(counts[is_category])))
+
+    def on_draw(self, _):
+        self.tree = scipy.spatial.cKDTree(self.ax.transData.transform(self.points))
+
+        # The annotation is animated, so the background saved after each full draw doesn't include it
+        self.background = self.canvas.copy_from_bbox(self.ax.figure.bbox) if self.canvas.supports_blit else None
+
+    def on_hover(self, event):
+        if event.inaxes is not self.ax or self.tree is None:
+            return
+
+        distance, idx = self.tree.query([event.x, event.y])
+        is_near = distance <= self.hover_px
+
+        if not is_near and not self.annotation.get_visible():
+            return
+
+        self.annotation.set_visible(is_near)
+        if is_near:
+            self.annotation.xy = self.points[idx]
+            self.annotation.set_text(self.names[idx])
+
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+
+        self.canvas.restore_region(self.background)
+        self.ax.draw_artist(self.annotation)
+        self.canvas.blit(self.ax.figure.bbox)
 
 
 def create_sentiment_quadrant_graph(means_df: pd.DataFrame, title: str):
     sns.set_context("notebook", font_scale=2, rc={"lines.markersize": 10})
     fig = plt.figure()
-    plot = sns.scatterplot(means_df, x='pos', y='neg', hue="name_gender", )
-    plot.set_title(title)
-    plot.set_xlabel("Positive Sentiment [0-1]")
-    plot.set_ylabel("Negative Sentiment [0-1]")
-    # FIXME: Difficult to read the small font but I have wasted too much time trying to make it bigger
-    cursor(hover=True).connect("add", lambda sel: sel.annotation.set_text(means_df['name'].iloc[sel.index]))
     fig.set_size_inches(16, 8)
+    ax = fig.gca()
+
+    # The view is kept on the figure, as the figure's event callbacks only hold weak references to it
+    fig.quadrant_view = QuadrantView(ax, means_df['pos'].values, means_df['neg'].values, means_df['name'].values,
+                                     means_df['name_gender'].values)
+
+    ax.set_title(title)
+    ax.set_xlabel("Positive Sentiment [0-1]")
+    ax.set_ylabel("Negative Sentiment [0-1]")
+    # FIXME: Difficult to read the small font but I have wasted too much time trying to make it bigger
 
     sns.reset_defaults()
 
@@ -0,0 +1,96 @@
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+
+# Points per unit of each column. Text length and call time use logarithmic points, so a single essay or marathon call
+# can't dominate a conversation's score
+default_weights = {
+    'msg': 1.0,
+    'text_len': 1.0,
+    'call_duration': 5.0,
+    'photos': 2.0,
+    'gifs': 1.0,
+    'sticker_path': 0.5,
+    'share_link': 1.5,
+    'reactions': 0.5,
+}
+
+log_weighted_cols = ['text_len', 'call_duration']
+
+
+def build_msg_scores(msgs_df: pd.DataFrame, weights: Dict[str, float] = None,
+                     reaction_counts: np.ndarray = None) -> np.ndarray:
+    """
+    Scores each message in a single vectorised pass
+    :param msgs_df: A dataframe of cleaned messages
+    :param weights: Points per unit of each column, any weights not provided use the defaults
+    :param reaction_counts: The number of reactions to each message (see reactions.count_reactions_by_msg)
+    :return: An array with the engagement score of each message
+    """
+
+    weights = {**default_weights, **(weights or dict())}
+
+    # Sources without some of the columns (e.g. no calls) simply score nothing for them
+    scored_df = msgs_df.reindex(columns=['text_len', 'call_duration', 'photos', 'gifs', 'sticker_path', 'share_link'])
+
+    # Calls are scored in minutes
+    components = {
+        'msg': np.ones(msgs_df.shape[0]),
+        'text_len': scored_df['text_len'].fillna(0).values,
+        'call_duration': scored_df['call_duration'].fillna(0).values / 60,
+        'photos': scored_df['photos'].fillna(0).values,
+        'gifs': pd.to_numeric(scored_df['gifs'].astype(object).str.len()).fillna(0).values,
+        'sticker_path': scored_df['sticker_path'].notna().values,
+        'share_link': scored_df['share_link'].notna().values,
+        'reactions': reaction_counts if reaction_counts is not None else np.zeros(msgs_df.shape[0]),
+    }
+
+    scores = np.zeros(msgs_df.shape[0])
+    for col, values in components.items():
+        values = np.log1p(values.astype(float)) if col in log_weighted_cols else values.astype(float)
+        scores += weights[col] * values
+
+    return scores
+
+
+def build_period_scores(msgs_df: pd.DataFrame, period: str, weights: Dict[str, float] = None,
+                        reaction_counts: np.ndarray = None) -> pd.DataFrame:
+    """
+    Sums message scores into fixed periods for each sender. Periods are anchored to the epoch, so they line up across
+    conversations and incremental updates
+    :return: A dataframe indexed by period start, with a column of scores for each sender
+    """
+
+    scores_df = pd.DataFrame({'sender_name': msgs_df['sender_name'].values,
+                              'score': build_msg_scores(msgs_df, weights, reaction_counts)}, index=msgs_df.index)
+
+    return (scores_df.groupby('sender_name')
+            .resample(period, origin='epoch')['score'].sum()
+            .unstack(level='sender_name', fill_value=0)
+            .fillna(0))
+
+
+def update_period_scores(period_scores_df: pd.DataFrame, msgs_df: pd.DataFrame, first_new_time: pd.Timestamp,
+                         period: str, weights: Dict[str, float] = None,
+                         reaction_counts: np.ndarray = None) -> pd.DataFrame:
+    """
+    Incrementally updates period scores after newer messages have been appended, only rescoring the messages in the
+    periods from the first new message onwards
+    :param period_scores_df: The previous result of build_period_scores
+    :param msgs_df: All the conversation's messages, including the newly appended ones
+    :param first_new_time: The timestamp of the earliest appended message
+    :param reaction_counts: The number of reactions to each of the messages
+    """
+
+    # Find the start of the epoch anchored period that the first new message falls into (in the index's timezone)
+    period_start = pd.Series([0], index=[first_new_time]).resample(period, origin='epoch').sum().index[0]
+
+    tail_start = msgs_df.index.searchsorted(period_start)
+    tail_reaction_counts = reaction_counts[tail_start:] if reaction_counts is not None else None
+    tail_scores_df = build_period_scores(msgs_df.iloc[tail_start:], period, weights, tail_reaction_counts)
+
+    kept_scores_df = period_scores_df[period_scores_df.index < period_start]
+
+    return pd.concat([kept_scores_df, tail_scores_df]).fillna(0)
@@ -0,0 +1,55 @@
+from typing import *
+
+import numpy as np
+from sklearn.cluster import KMeans
+
+hour_labels = [f'{x}:00' for x in range(24)]
+
+# Broad descriptions of when conversations happen, keyed by the first hour of each part of the day
+day_parts = {0: 'Late Night', 6: 'Morning', 12: 'Afternoon', 18: 'Evening'}
+
+
+def build_hour_counts(hours: np.ndarray, row_codes: np.ndarray, n_rows: int) -> np.ndarray:
+    """
+    Counts messages per hour of the day for every row (e.g. conversation or (conversation, sender) pair) in a single
+    bincount
+    :param hours: The hour of day (0-23) of each message
+    :param row_codes: The row each message is counted in
+    :return: An array of message counts, shaped (n_rows, 24)
+    """
+
+    return np.bincount(row_codes.astype(np.int64) * 24 + hours, minlength=n_rows * 24).reshape(n_rows, 24)
+
+
+def normalise_profiles(hour_counts: np.ndarray) -> np.ndarray:
+    """
+    :return: Each row's share of messages in each hour, so busy and quiet conversations with the same rhythm match
+    """
+
+    totals = hour_counts.sum(axis=1, keepdims=True)
+
+    return np.divide(hour_counts, totals, out=np.zeros(hour_counts.shape), where=totals > 0)
+
+
+def cluster_profiles(profiles: np.ndarray, n_clusters: int, random_state: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Clusters normalised hour profiles with batch k-means
+    :return: The cluster label of each row, and each cluster's centroid (its average profile)
+    """
+
+    n_clusters = min(n_clusters, profiles.shape[0])
+    model = KMeans(n_clusters=n_clusters, n_init=10, random_state=random_state).fit(profiles)
+
+    return model.labels_, model.cluster_centers_
+
+
+def describe_profile(profile: np.ndarray) -> str:
+    """
+    :return: A short description of when a profile's messages happen, e.g. 'Evening (peak 21:00)'
+    """
+
+    # The busiest part of the day (in 6 hour blocks) names the profile, along with its busiest hour
+    part_start = int(np.argmax(profile.reshape(4, 6).sum(axis=1))) * 6
+    peak_hour = part_start + int(np.argmax(profile[part_start:part_start + 6]))
+
+    return f'{day_parts[part_start]} (peak {hour_labels[peak_hour]})'
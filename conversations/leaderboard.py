@@ -0,0 +1,80 @@
+import heapq
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+# Columns summed per sender, structured: {Summary Column: Message Column}
+sum_cols = {
+    'chars': 'text_len',
+    'photos': 'photos',
+    'videos': 'videos',
+    'voice_memos': 'audio_files',
+    'files': 'files',
+    'calls': 'call',
+    'missed_calls': 'missed_call',
+    'call_duration': 'call_duration',
+}
+
+# Columns where each non-empty value counts once
+count_cols = {
+    'gifs': 'gifs',
+    'stickers': 'sticker_path',
+    'links': 'share_link',
+}
+
+summary_cols = ['msgs'] + list(sum_cols) + list(count_cols) + ['reactions_received', 'reactions_given']
+
+
+def build_sender_summary(msgs_df: pd.DataFrame, reactions_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Totals each sender's messages, characters, media, calls and reactions in one grouped pass
+    :param msgs_df: A dataframe of cleaned messages, with derived columns
+    :param reactions_df: The reactions to those messages (see reactions.build_reactions_df)
+    :return: A dataframe indexed by sender name, with a column for each of summary_cols
+    """
+
+    # Sources without some of the columns (e.g. no calls) simply count nothing for them
+    source_df = msgs_df.reindex(columns=list(sum_cols.values()) + list(count_cols.values()))
+
+    values_df = pd.DataFrame({'msgs': np.ones(msgs_df.shape[0], dtype=np.int64)}, index=msgs_df.index)
+    for col, msg_col in sum_cols.items():
+        values_df[col] = pd.to_numeric(source_df[msg_col], errors='coerce').fillna(0).values
+    for col, msg_col in count_cols.items():
+        values_df[col] = source_df[msg_col].notna().values.astype(np.int64)
+
+    summary_df = values_df.groupby(msgs_df['sender_name'].values).sum()
+
+    # Reactions are credited to the sender of the message reacted to, and to the reactor
+    recipients = msgs_df['sender_name'].values[reactions_df['msg_idx'].values]
+    summary_df = summary_df.join(pd.Series(recipients).value_counts().rename('reactions_received'), how='outer')
+    summary_df = summary_df.join(pd.Series(reactions_df['actor'].values.astype(object)).value_counts()
+                                 .rename('reactions_given'), how='outer')
+
+    summary_df = summary_df.reindex(columns=summary_cols).fillna(0)
+    summary_df.index.name = 'sender_name'
+
+    return summary_df
+
+
+def add_sender_summaries(summary_df: pd.DataFrame, new_summary_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    :return: The combined totals of two sender summaries (e.g. stored and newly appended messages)
+    """
+
+    return summary_df.add(new_summary_df, fill_value=0)
+
+
+def top_k(items: Iterable[Tuple[str, Any]], n: int, desc: bool = True) -> List[Tuple[str, Any]]:
+    """
+    Selects the top n items by their second element with a heap, instead of fully sorting every item. Ties keep their
+    original order, matching a stable sort
+    :param items: Tuples, structured: ('Name', Value, ...)
+    :param n: Number of items to return. For n <= 1, all items are returned sorted
+    :param desc: Whether the largest values are first
+    """
+
+    if n > 1:
+        return (heapq.nlargest if desc else heapq.nsmallest)(n, items, key=lambda x: x[1])
+
+    return sorted(items, key=lambda x: x[1], reverse=desc)
@@ -0,0 +1,304 @@
+import json
+import os
+import pathlib
+import shutil
+import time
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+
+class MsgStore:
+    """
+    Column oriented on-disk copy of every conversation's messages, so selective queries only read the columns and row
+    ranges they need. Each conversation has its own folder of .npy files, which are memory mapped when read:
+        - timestamp: sorted int64 (UTC nanoseconds), allowing date ranges to be found with searchsorted
+        - numeric and boolean columns: stored as is
+        - low cardinality text (e.g. sender_name): int32 codes, with the dictionary kept in the manifest. Nulls have
+          the code -1
+        - other text: utf-8 bytes with int64 offsets and a null mask
+        - anything else (e.g. lists of GIFs): pickled, so has to be read in full
+    """
+
+    manifest_file_name = "manifest.json"
+    coded_cols = ['sender_name', 'source', 'major_type']
+
+    # Message types which can be filtered on, with a function identifying them using a single column
+    msg_types = {
+        'text': ('text_len', lambda x: x > 0),
+        'photo': ('photos', lambda x: x > 0),
+        'video': ('videos', lambda x: x > 0),
+        'voice_memo': ('audio_files', lambda x: x > 0),
+        'file': ('files', lambda x: x > 0),
+        'call': ('call', lambda x: x),
+        'missed_call': ('missed_call', lambda x: x),
+        'link': ('share_link', lambda x: pd.notna(x)),
+        'sticker': ('sticker_path', lambda x: pd.notna(x)),
+        'gif': ('gifs', lambda x: pd.notna(x)),
+    }
+
+    def __init__(self, root_path: str):
+        self.root_path = root_path
+        self.manifest: Dict[str, Dict] = dict()
+
+        manifest_path = os.path.join(root_path, MsgStore.manifest_file_name)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as file_obj:
+                self.manifest = json.load(file_obj)
+
+    def save_manifest(self):
+        pathlib.Path(self.root_path).mkdir(parents=True, exist_ok=True)
+
+        with open(os.path.join(self.root_path, MsgStore.manifest_file_name), "w") as file_obj:
+            json.dump(self.manifest, file_obj)
+
+    def write_convo(self, convo_name: str, msgs_df: pd.DataFrame):
+        """
+        Writes (or overwrites) a conversation's messages. The manifest must be saved afterwards
+        :param convo_name: The name of the conversation, used to look it up when querying
+        :param msgs_df: The conversation's messages, sorted by timestamp
+        """
+
+        if convo_name in self.manifest:
+            folder = self.manifest[convo_name]['folder']
+        else:
+            folder = f"{len(self.manifest):06d}"
+            while any(x['folder'] == folder for x in self.manifest.values()):
+                folder = f"{int(folder) + 1:06d}"
+
+        convo_path = os.path.join(self.root_path, folder)
+        shutil.rmtree(convo_path, ignore_errors=True)
+        pathlib.Path(convo_path).mkdir(parents=True)
+
+        np.save(os.path.join(convo_path, "timestamp.npy"), msgs_df.index.asi8)
+
+        col_kinds = dict()
+        dictionaries = dict()
+        for col in msgs_df.columns:
+            values = msgs_df[col]
+
+            if col in MsgStore.coded_cols:
+                # Nulls are given the code -1 (rather than a dictionary entry), which is decoded back to NaN
+                codes, uniques = pd.factorize(values, use_na_sentinel=True)
+                np.save(os.path.join(convo_path, f"{col}.npy"), codes.astype(np.int32))
+                dictionaries[col] = uniques.tolist()
+                col_kinds[col] = 'coded'
+
+            elif values.dtype.kind in 'biuf':
+                np.save(os.path.join(convo_path, f"{col}.npy"), values.values)
+                col_kinds[col] = 'numeric'
+
+            elif all(isinstance(x, str) for x in values.dropna()):
+                is_null = values.isna().values
+                encoded = [x.encode('utf-8') for x in values.fillna('')]
+                offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+                np.cumsum([len(x) for x in encoded], out=offsets[1:])
+
+                np.save(os.path.join(convo_path, f"{col}.data.npy"), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+                np.save(os.path.join(convo_path, f"{col}.offsets.npy"), offsets)
+                np.save(os.path.join(convo_path, f"{col}.null.npy"), is_null)
+                col_kinds[col] = 'text'
+
+            else:
+                values.reset_index(drop=True).to_pickle(os.path.join(convo_path, f"{col}.p"))
+                col_kinds[col] = 'object'
+
+        self.manifest[convo_name] = {
+            'folder': folder,
+            'rows': msgs_df.shape[0],
+            'columns': col_kinds,
+            'dictionaries': dictionaries,
+        }
+
+    def remove_convo(self, convo_name: str):
+        if convo_name in self.manifest:
+            shutil.rmtree(os.path.join(self.root_path, self.manifest.pop(convo_name)['folder']), ignore_errors=True)
+
+    def _read_col(self, convo_name: str, col: str, lo: int, hi: int) -> np.ndarray:
+        """
+        Reads rows [lo, hi) of a single column, only touching those rows on disk where the encoding allows it
+        """
+
+        convo_info = self.manifest[convo_name]
+        convo_path = os.path.join(self.root_path, convo_info['folder'])
+        col_kind = convo_info['columns'][col]
+
+        if col_kind == 'coded':
+            codes = np.load(os.path.join(convo_path, f"{col}.npy"), mmap_mode='r')[lo:hi]
+
+            # Nulls are stored with the code -1, which is pointed at a NaN appended to the dictionary
+            return np.asarray(convo_info['dictionaries'][col] + [np.nan], dtype=object)[codes]
+
+        elif col_kind == 'numeric':
+            return np.array(np.load(os.path.join(convo_path, f"{col}.npy"), mmap_mode='r')[lo:hi])
+
+        elif col_kind == 'text':
+            offsets = np.load(os.path.join(convo_path, f"{col}.offsets.npy"), mmap_mode='r')[lo:hi + 1]
+            is_null = np.load(os.path.join(convo_path, f"{col}.null.npy"), mmap_mode='r')[lo:hi]
+            data = np.load(os.path.join(convo_path, f"{col}.data.npy"), mmap_mode='r')[offsets[0]:offsets[-1]]
+
+            data_bytes = data.tobytes()
+            rel_offsets = offsets - offsets[0]
+            values = np.array([data_bytes[rel_offsets[ii]:rel_offsets[ii + 1]].decode('utf-8')
+                               for ii in range(hi - lo)], dtype=object)
+            values[is_null] = np.nan
+
+            return values
+
+        else:
+            return pd.read_pickle(os.path.join(convo_path, f"{col}.p")).values[lo:hi]
+
+    def _read_coded_mask(self, convo_name: str, col: str, lo: int, hi: int, allowed: Set[str]) -> np.ndarray:
+        """
+        Filters a dictionary coded column by comparing codes, without decoding any values. Nulls (code -1) never match
+        """
+
+        convo_info = self.manifest[convo_name]
+        if col not in convo_info['dictionaries']:
+            return np.zeros(hi - lo, dtype=bool)
+
+        allowed_codes = [ii for ii, x in enumerate(convo_info['dictionaries'][col]) if x in allowed]
+        codes = np.load(os.path.join(self.root_path, convo_info['folder'], f"{col}.npy"), mmap_mode='r')[lo:hi]
+
+        return np.isin(codes, allowed_codes)
+
+    def query(self, convos: Iterable[str] = None, senders: Iterable[str] = None, sources: Iterable[str] = None,
+              start_date: pd.Timestamp = None, end_date: pd.Timestamp = None, msg_types: Iterable[str] = None,
+              columns: Iterable[str] = None) -> pd.DataFrame:
+        """
+        Reads messages matching all the provided filters. Date ranges are found with searchsorted on the timestamps,
+        then only the requested columns (and any columns needed to filter) are read for that row range
+        :param convos: Names of conversations to include, defaults to all
+        :param senders: Names of senders to include, defaults to all
+        :param sources: Sources to include (e.g. 'Facebook', 'Instagram'), defaults to all
+        :param start_date: Optional timezone aware timestamp, messages before it are excluded
+        :param end_date: Optional timezone aware timestamp, messages after it are excluded
+        :param msg_types: Message types to include (any of MsgStore.msg_types), defaults to all
+        :param columns: Columns to return, defaults to all
+        :return: A dataframe of the matching messages indexed by timestamp, with an additional 'convo' column
+        """
+
+        convo_names = list(self.manifest.keys()) if convos is None else [x for x in convos if x in self.manifest]
+        msg_types = list(msg_types) if msg_types is not None else None
+
+        # Filters are used once per conversation, so generators are materialised first
+        senders = set(senders) if senders is not None else None
+        sources = set(sources) if sources is not None else None
+        columns = list(columns) if columns is not None else None
+
+        if msg_types and set(msg_types).difference(MsgStore.msg_types.keys()):
+            raise ValueError(f"msg_types must be in: {list(MsgStore.msg_types.keys())}")
+
+        results = []
+        for convo_name in convo_names:
+            convo_info = self.manifest[convo_name]
+            convo_path = os.path.join(self.root_path, convo_info['folder'])
+
+            # Predicate pushdown: narrow the row range using the sorted timestamps before reading anything else
+            timestamps = np.load(os.path.join(convo_path, "timestamp.npy"), mmap_mode='r')
+            lo = int(np.searchsorted(timestamps, start_date.value, 'left')) if start_date is not None else 0
+            hi = int(np.searchsorted(timestamps, end_date.value, 'right')) if end_date is not None else len(timestamps)
+
+            if hi <= lo:
+                continue
+
+            mask = np.ones(hi - lo, dtype=bool)
+            if senders is not None:
+                mask &= self._read_coded_mask(convo_name, 'sender_name', lo, hi, senders)
+
+            if sources is not None:
+                mask &= self._read_coded_mask(convo_name, 'source', lo, hi, sources)
+
+            if msg_types:
+                type_mask = np.zeros(hi - lo, dtype=bool)
+                for msg_type in msg_types:
+                    col, predicate = MsgStore.msg_types[msg_type]
+                    if col in convo_info['columns']:
+                        type_mask |= np.asarray(predicate(self._read_col(convo_name, col, lo, hi)), dtype=bool)
+                mask &= type_mask
+
+            if not mask.any():
+                continue
+
+            # Columns which don't exist for this conversation (e.g. calls for Instagram only conversations) are skipped
+            selected_cols = [x for x in (columns if columns is not None else convo_info['columns'])
+                             if x in convo_info['columns']]
+            row_idx = np.flatnonzero(mask)
+
+            convo_df = pd.DataFrame({col: self._read_col(convo_name, col, lo, hi)[row_idx] for col in selected_cols},
+                                    index=pd.DatetimeIndex(np.asarray(timestamps[lo:hi])[row_idx], tz='UTC'))
+            convo_df['convo'] = convo_name
+            results.append(convo_df)
+
+        return MsgStore._combine_results(results, convo_names, columns)
+
+    @staticmethod
+    def query_in_memory(msgs_dfs: Dict[str, pd.DataFrame], convos: Iterable[str] = None,
+                        senders: Iterable[str] = None, sources: Iterable[str] = None, start_date: pd.Timestamp = None,
+                        end_date: pd.Timestamp = None, msg_types: Iterable[str] = None,
+                        columns: Iterable[str] = None) -> pd.DataFrame:
+        """
+        Same as MsgStore.query, but over conversations already loaded in memory (e.g. when there is no store yet)
+        :param msgs_dfs: A dictionary of conversation names and their messages, sorted by timestamp
+        """
+
+        convo_names = list(msgs_dfs.keys()) if convos is None else [x for x in convos if x in msgs_dfs]
+        msg_types = list(msg_types) if msg_types is not None else None
+
+        # Filters are used once per conversation, so generators are materialised first
+        senders = set(senders) if senders is not None else None
+        sources = set(sources) if sources is not None else None
+        columns = list(columns) if columns is not None else None
+
+        if msg_types and set(msg_types).difference(MsgStore.msg_types.keys()):
+            raise ValueError(f"msg_types must be in: {list(MsgStore.msg_types.keys())}")
+
+        results = []
+        for convo_name in convo_names:
+            msgs_df = msgs_dfs[convo_name]
+
+            # Slice the date range using the sorted index, rather than masking every row
+            lo = msgs_df.index.searchsorted(start_date, 'left') if start_date is not None else 0
+            hi = msgs_df.index.searchsorted(end_date, 'right') if end_date is not None else msgs_df.shape[0]
+            msgs_df = msgs_df.iloc[lo:hi]
+
+            mask = np.ones(msgs_df.shape[0], dtype=bool)
+            if senders is not None:
+                mask &= msgs_df['sender_name'].isin(senders).values
+
+            if sources is not None:
+                mask &= msgs_df['source'].isin(sources).values if 'source' in msgs_df.columns else False
+
+            if msg_types:
+                type_mask = np.zeros(msgs_df.shape[0], dtype=bool)
+                for msg_type in msg_types:
+                    col, predicate = MsgStore.msg_types[msg_type]
+                    if col in msgs_df.columns:
+                        type_mask |= np.asarray(predicate(msgs_df[col].values), dtype=bool)
+                mask &= type_mask
+
+            if not mask.any():
+                continue
+
+            selected_cols = [x for x in (columns if columns is not None else msgs_df.columns) if x in msgs_df.columns]
+            convo_df = msgs_df.loc[mask, selected_cols].copy()
+            convo_df['convo'] = convo_name
+            results.append(convo_df)
+
+        return MsgStore._combine_results(results, convo_names, columns)
+
+    @staticmethod
+    def _combine_results(results: List[pd.DataFrame], convo_names: List[str],
+                         columns: Union[Iterable[str], None]) -> pd.DataFrame:
+
+        columns = list(columns) if columns is not None else []
+        if len(results) == 0:
+            empty_index = pd.DatetimeIndex([], tz='UTC').tz_convert(time.strftime("%z"))
+            return pd.DataFrame(columns=columns + ['convo'], index=empty_index.rename('timestamp'))
+
+        result_df = pd.concat(results)
+        result_df.index = result_df.index.tz_convert(time.strftime("%z")).rename('timestamp')
+        result_df['convo'] = pd.Categorical(result_df['convo'], categories=convo_names)
+
+        return result_df
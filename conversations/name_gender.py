@@ -0,0 +1,68 @@
+import logging
+import os
+import pathlib
+from typing import *
+
+import pandas as pd
+
+
+class NameGenderCache:
+    """
+    Persistent name -> p(gf) table, so each name is only ever scored once across runs and cache rebuilds. The
+    nomquamgender model is only loaded when there are names which haven't been scored before
+    """
+
+    _model = None
+
+    def __init__(self, table_path: str):
+        self.table_path = table_path
+        self.pgfs: Dict[str, float] = NameGenderCache.read_table(table_path)
+
+    @staticmethod
+    def read_table(table_path: str) -> Dict[str, float]:
+        if not os.path.isfile(table_path):
+            return dict()
+
+        # Names are never missing values (e.g. 'Nan'), but names the model can't score (e.g. group titles) have none
+        table_df = pd.read_csv(table_path, keep_default_na=False, na_values={'pgf': ['']},
+                               dtype={'name': str, 'pgf': float})
+
+        return dict(zip(table_df['name'], table_df['pgf']))
+
+    @staticmethod
+    def get_model():
+        # Model to guess most common binarized gender associated with name, produces 0-1 output to roughly indicate confidence
+        if NameGenderCache._model is None:
+            import nomquamgender as nqg
+            NameGenderCache._model = nqg.NBGC()
+
+        return NameGenderCache._model
+
+    def get_pgfs(self, names: Iterable[str]) -> Dict[str, float]:
+        """
+        :param names: Names to retrieve the p(gf) for, any which haven't been seen before are scored in a single batch
+        :return: A dictionary of each distinct name and its p(gf)
+        """
+
+        distinct_names = set(names)
+        uncached_names = sorted(distinct_names.difference(self.pgfs.keys()))
+
+        if uncached_names:
+            logging.info(f"Estimating name genders for {len(uncached_names)} new names")
+            new_pgfs = NameGenderCache.get_model().get_pgf(uncached_names)
+            self.pgfs.update(zip(uncached_names, new_pgfs))
+            self.save()
+
+        return {name: self.pgfs[name] for name in distinct_names}
+
+    def save(self):
+        pathlib.Path(os.path.dirname(self.table_path) or '.').mkdir(parents=True, exist_ok=True)
+
+        # Batch workers share the table, so names another worker saved since it was read are kept rather than overwritten
+        self.pgfs = {**NameGenderCache.read_table(self.table_path), **self.pgfs}
+
+        # Write to a temporary file first, as batch workers can share the table and must never see a partial file
+        temp_path = f"{self.table_path}.{os.getpid()}.tmp"
+        table_df = pd.DataFrame({'name': list(self.pgfs.keys()), 'pgf': list(self.pgfs.values())})
+        table_df.to_csv(temp_path, index=False)
+        os.replace(temp_path, self.table_path)
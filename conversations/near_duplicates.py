@@ -0,0 +1,151 @@
+from typing import *
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+import scipy.sparse.csgraph
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# Messages are compared as sets of hashed 5 character shingles, so small edits (typos, added names) barely matter
+shingle_vectorizer = HashingVectorizer(analyzer='char_wb', ngram_range=(5, 5), n_features=2 ** 30, binary=True,
+                                       alternate_sign=False, norm=None, dtype=np.float32)
+
+# Short messages ('haha', 'ok') are near-duplicates of each other by nature, so aren't signed
+min_chars = 30
+
+# Signatures are split into bands of rows, any pair of messages with an identical band are candidates. With 16 bands of
+# 4, pairs with ~50% shingles in common are candidates half the time, and pairs with 80%+ almost always are
+num_perm = 64
+bands = 16
+rows_per_band = num_perm // bands
+
+_prime = np.uint64(4294967311)  # First prime larger than 2 ** 32
+_rng = np.random.default_rng(20240601)
+_perm_a = _rng.integers(1, 2 ** 32, num_perm, dtype=np.uint64)
+_perm_b = _rng.integers(0, 2 ** 32, num_perm, dtype=np.uint64)
+_band_multipliers = _rng.integers(1, 2 ** 63, rows_per_band, dtype=np.uint64) | np.uint64(1)
+
+chunk_size = 20_000
+
+# Messages sharing a band are compared pairwise in buckets up to this size. Larger buckets (e.g. a popular chain
+# message) are compared against their first message instead, to keep the number of comparisons linear
+max_pairwise_bucket = 8
+
+
+def signable_text(msgs_df: pd.DataFrame) -> pd.Series:
+    """
+    :return: The text (and any shared link) of each message long enough to be signed, indexed by position
+    """
+
+    # Missing text is read as the string 'nan', forwarded links are compared by their link as well as any text
+    text = msgs_df['text'].where(msgs_df['text'] != 'nan', '').astype(str)
+    if 'share_link' in msgs_df.columns:
+        text = text + ' ' + msgs_df['share_link'].fillna('').astype(str)
+
+    text = text.str.strip().str.lower()
+    text = pd.Series(text.values)
+
+    return text[text.str.len() >= min_chars]
+
+
+def build_signatures(texts: np.ndarray) -> np.ndarray:
+    """
+    Builds a MinHash signature for each text in a vectorised pass per hash function
+    :return: An array of uint32 shaped (texts, num_perm)
+    """
+
+    signatures = np.full((texts.shape[0], num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+
+    for start in range(0, texts.shape[0], chunk_size):
+        shingle_matrix = shingle_vectorizer.transform(texts[start:start + chunk_size]).tocsr()
+        shingle_matrix.sort_indices()
+
+        has_shingles = np.diff(shingle_matrix.indptr) > 0
+        row_starts = shingle_matrix.indptr[:-1][has_shingles]
+        shingles = shingle_matrix.indices.astype(np.uint64)
+
+        if shingles.shape[0] == 0:
+            continue
+
+        rows = np.flatnonzero(has_shingles) + start
+        for ii in range(num_perm):
+            hashes = ((_perm_a[ii] * shingles + _perm_b[ii]) % _prime).astype(np.uint32)
+            signatures[rows, ii] = np.minimum.reduceat(hashes, row_starts)
+
+    return signatures
+
+
+def build_msg_signatures(msgs_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: The positions of the messages which were signed and their MinHash signatures
+    """
+
+    text = signable_text(msgs_df)
+
+    return text.index.values.astype(np.int32), build_signatures(text.values)
+
+
+def estimate_similarity(signatures_a: np.ndarray, signatures_b: np.ndarray) -> np.ndarray:
+    """
+    :return: The estimated Jaccard similarity of each pair of rows (the fraction of equal signature values)
+    """
+
+    return (signatures_a == signatures_b).mean(axis=1)
+
+
+def find_duplicate_groups(signatures: np.ndarray, min_similarity: float = 0.8) -> np.ndarray:
+    """
+    Groups near-duplicate signatures using locality sensitive hashing. Each band's hashes are sorted, so messages
+    sharing a band form a contiguous bucket, and only candidates within a bucket are compared, keeping the whole search
+    near-linear
+    :param signatures: MinHash signatures shaped (messages, num_perm)
+    :param min_similarity: The minimum estimated Jaccard similarity for two messages to be linked
+    :return: A group label for each message, messages without any near-duplicates are labelled -1
+    """
+
+    n_msgs = signatures.shape[0]
+    linked_from = []
+    linked_to = []
+
+    for band in range(bands):
+        band_rows = signatures[:, band * rows_per_band:(band + 1) * rows_per_band].astype(np.uint64)
+        band_keys = (band_rows * _band_multipliers).sum(axis=1)
+
+        order = np.argsort(band_keys, kind='stable')
+        sorted_keys = band_keys[order]
+        bucket_starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        bucket_sizes = np.diff(np.r_[bucket_starts, n_msgs])
+        bucket_idx = np.repeat(np.arange(bucket_starts.shape[0]), bucket_sizes)
+        pos_in_bucket = np.arange(n_msgs) - bucket_starts[bucket_idx]
+        msg_bucket_sizes = bucket_sizes[bucket_idx]
+
+        # A dissimilar message that collides in a band can sit between two similar ones, so comparing neighbours isn't
+        # enough. Small buckets are compared pairwise, and large ones against their first message as well as neighbours
+        pairs = []
+        for offset in range(1, min(max_pairwise_bucket, n_msgs)):
+            is_candidate = (pos_in_bucket[:n_msgs - offset] + offset < msg_bucket_sizes[:n_msgs - offset]) & \
+                ((msg_bucket_sizes[:n_msgs - offset] <= max_pairwise_bucket) | (offset == 1))
+            pairs.append((order[:n_msgs - offset][is_candidate], order[offset:][is_candidate]))
+
+        is_candidate = (msg_bucket_sizes > max_pairwise_bucket) & (pos_in_bucket >= 2)
+        pairs.append((order[bucket_starts[bucket_idx[is_candidate]]], order[is_candidate]))
+
+        pairs_from = np.concatenate([x for x, _ in pairs])
+        pairs_to = np.concatenate([x for _, x in pairs])
+
+        is_similar = estimate_similarity(signatures[pairs_from], signatures[pairs_to]) >= min_similarity
+        linked_from.append(pairs_from[is_similar])
+        linked_to.append(pairs_to[is_similar])
+
+    linked_from = np.concatenate(linked_from) if linked_from else np.array([], dtype=np.int64)
+    linked_to = np.concatenate(linked_to) if linked_to else np.array([], dtype=np.int64)
+
+    graph = scipy.sparse.coo_matrix((np.ones(linked_from.shape[0], dtype=np.int8), (linked_from, linked_to)),
+                                    shape=(n_msgs, n_msgs))
+    _, labels = scipy.sparse.csgraph.connected_components(graph, directed=False)
+
+    # Only keep groups with more than one message
+    group_sizes = np.bincount(labels, minlength=n_msgs)
+    labels[group_sizes[labels] < 2] = -1
+
+    return labels
@@ -0,0 +1,245 @@
+import collections
+import concurrent.futures
+import io
+import logging
+import os
+import pathlib
+import sys
+import tarfile
+import time
+import zipfile
+from typing import *
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from PIL import Image
+
+# Containers are one file per run, 'files' keeps the original loose files in a folder per conversation
+output_modes = ('files', 'zip', 'tar', 'pdf')
+
+# PNG and WebP are lossless, {Image Format: (PIL format, PIL save options)}
+image_formats = {
+    'jpeg': ('JPEG', {'quality': 95}),
+    'png': ('PNG', {'optimize': False}),
+    'webp': ('WEBP', {'lossless': True}),
+}
+
+index_cols = ['label', 'folder', 'file_name', 'location', 'offset', 'size']
+
+
+class OutputSink:
+    """
+    Writes every figure of a run to one place: loose image files (creating each folder only once), a single zip or tar
+    archive, or a multipage PDF. Figures are rendered to pixels as they are added, then encoded in background threads
+    while the next figure is generated. An index CSV records where each figure was written, so a figure can be found
+    (or read straight out of a tar by its offset) without listing or extracting anything
+    """
+
+    # Figures waiting to be encoded are held in memory, so only this many can be pending at once
+    max_pending = 16
+
+    def __init__(self, output_root: str, run_name: str, mode: str = 'files', image_format: str = 'jpeg',
+                 max_workers: int = 4):
+        """
+        :param output_root: Folder to write the container (or folders of loose files) and index to
+        :param run_name: Name of the container and index, e.g. 'Time of Day Histograms'
+        :param mode: One of output_modes
+        :param image_format: One of image_formats (not used by PDFs, which keep the figures as vector graphics)
+        :param max_workers: Number of background threads encoding images
+        """
+
+        if mode not in output_modes:
+            raise ValueError(f"Output mode must be one of {output_modes}, not: {mode}")
+        if image_format not in image_formats:
+            raise ValueError(f"Image format must be one of {list(image_formats)}, not: {image_format}")
+
+        self.output_root = os.path.abspath(output_root)
+        self.run_name = run_name
+        self.mode = mode
+        self.image_format = image_format
+
+        pathlib.Path(self.output_root).mkdir(parents=True, exist_ok=True)
+        self.index_path = os.path.join(self.output_root, f"{run_name} Index.csv")
+        self.container_path = None if mode == 'files' else os.path.join(self.output_root, f"{run_name}.{mode}")
+
+        self._index_rows = []
+        self._created_dirs = set()
+        self._pending = collections.deque()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+        self._container = None
+        if mode == 'zip':
+            # Images are already compressed, so they are stored as they are
+            self._container = zipfile.ZipFile(self.container_path, 'w', compression=zipfile.ZIP_STORED)
+        elif mode == 'tar':
+            self._container = tarfile.open(self.container_path, 'w')
+        elif mode == 'pdf':
+            self._container = PdfPages(self.container_path)
+
+    def __enter__(self) -> 'OutputSink':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def prepare_dirs(self, folders: Iterable[str]):
+        """
+        Creates every folder needed for loose files in one pass, before any figures are written
+        """
+
+        if self.mode != 'files':
+            return
+
+        for folder in set(folders).difference(self._created_dirs):
+            pathlib.Path(self._dir_path(folder)).mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(folder)
+
+    def _dir_path(self, folder: str) -> str:
+        dir_path = os.path.join(self.output_root, folder)
+
+        # On windows, use file prefix to bypass 260 filepath char limit, needs to be outside os.path.join to work
+        if sys.platform == 'win32':
+            dir_path = r'//?/' + dir_path
+
+        return dir_path
+
+    def add_figure(self, fig: plt.Figure, folder: str, file_name: str, label: str = None):
+        """
+        :param fig: The figure to write, it isn't used again once this returns
+        :param folder: The folder within the output (e.g. the conversation's cleaned name)
+        :param file_name: File name without an extension, e.g. 'Time of Day Histogram'
+        :param label: Name to look the figure up by in the index, e.g. the conversation's name
+        """
+
+        label = label if label is not None else folder
+
+        # Bad practice catchall, but program shouldn't halt because of any one figure failing to render or save
+        try:
+            if self.mode == 'pdf':
+                self._container.savefig(fig)
+                page = self._container.get_pagecount()
+                self._index_rows.append((label, folder, file_name, f"page {page}", np.nan, np.nan))
+                return
+
+            # Matplotlib isn't thread safe, so the figure is drawn here and only its pixels are encoded in the
+            # background
+            canvas = FigureCanvasAgg(fig)
+            canvas.draw()
+            pixels = np.asarray(canvas.buffer_rgba()).copy()
+
+        except Exception as err:
+            logging.warning(f"Failed to save graph for Convo: {label}, due to the following: {err}")
+            return
+
+        if self.mode == 'files':
+            self.prepare_dirs([folder])
+
+        future = self._executor.submit(OutputSink.encode_image, pixels, self.image_format)
+        self._pending.append((future, label, folder, f"{file_name}.{self.image_format}"))
+
+        while len(self._pending) > self.max_pending or (self._pending and self._pending[0][0].done()):
+            self._write_next()
+
+    @staticmethod
+    def encode_image(pixels: np.ndarray, image_format: str) -> bytes:
+        pil_format, save_options = image_formats[image_format]
+
+        # JPEG has no alpha channel
+        image = Image.fromarray(pixels, 'RGBA')
+        if pil_format == 'JPEG':
+            image = image.convert('RGB')
+
+        buffer = io.BytesIO()
+        image.save(buffer, format=pil_format, **save_options)
+
+        return buffer.getvalue()
+
+    def _write_next(self):
+        # Encoded images are written in the order they were added, so containers and the index are deterministic
+        future, label, folder, file_name = self._pending.popleft()
+
+        try:
+            data = future.result()
+            member_name = f"{folder}/{file_name}"
+
+            if self.mode == 'files':
+                file_path = os.path.join(self._dir_path(folder), file_name)
+                with open(file_path, 'wb') as file_obj:
+                    file_obj.write(data)
+                self._index_rows.append((label, folder, file_name, file_path, np.nan, len(data)))
+
+            elif self.mode == 'zip':
+                self._container.writestr(member_name, data)
+                offset = self._container.getinfo(member_name).header_offset
+                self._index_rows.append((label, folder, file_name, member_name, offset, len(data)))
+
+            else:
+                member_info = tarfile.TarInfo(member_name)
+                member_info.size = len(data)
+                member_info.mtime = int(time.time())
+
+                # The data follows the member's header (which includes any extra blocks for long names)
+                header = member_info.tobuf(self._container.format, self._container.encoding, self._container.errors)
+                offset = self._container.offset + len(header)
+
+                self._container.addfile(member_info, io.BytesIO(data))
+                self._index_rows.append((label, folder, file_name, member_name, offset, len(data)))
+
+        except Exception as err:
+            logging.warning(f"Failed to save graph for Convo: {label}, due to the following: {err}")
+
+    def close(self) -> List[str]:
+        """
+        Waits for all figures to be encoded and written, then closes the container and writes the index
+        :return: The paths written (container, or folder of loose files, and index)
+        """
+
+        while self._pending:
+            self._write_next()
+
+        self._executor.shutdown()
+
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+
+        pd.DataFrame(self._index_rows, columns=index_cols).to_csv(self.index_path, index=False)
+
+        return [self.container_path or self.output_root, self.index_path]
+
+
+def read_indexed_figure(index_path: str, label: str, file_name: str = None) -> bytes:
+    """
+    Reads one image back out of a run's output, using the index to seek straight to it
+    :param label: The label the figure was added with (e.g. the conversation's name)
+    :param file_name: Optional file name (with extension) if the label has more than one figure
+    :return: The encoded image
+    """
+
+    index_df = pd.read_csv(index_path)
+    matches = index_df[(index_df['label'] == label) &
+                       ((index_df['file_name'] == file_name) if file_name is not None else True)]
+
+    if matches.shape[0] == 0:
+        raise KeyError(f"No figure for: {label} in {index_path}")
+
+    entry = matches.iloc[0]
+    container_path = index_path[:-len(" Index.csv")]
+
+    if os.path.isfile(container_path + ".tar"):
+        with open(container_path + ".tar", 'rb') as file_obj:
+            file_obj.seek(int(entry['offset']))
+            return file_obj.read(int(entry['size']))
+
+    if os.path.isfile(container_path + ".zip"):
+        with zipfile.ZipFile(container_path + ".zip") as zip_file:
+            return zip_file.read(entry['location'])
+
+    if os.path.isfile(entry['location']):
+        with open(entry['location'], 'rb') as file_obj:
+            return file_obj.read()
+
+    raise KeyError(f"The figure for: {label} is not stored as an image (e.g. it is a PDF page: {entry['location']})")
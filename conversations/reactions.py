@@ -0,0 +1,85 @@
+from typing import *
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+
+reaction_cols = ['msg_idx', 'actor', 'reaction']
+
+
+def build_reactions_df(reaction_lists: pd.Series) -> pd.DataFrame:
+    """
+    Converts each message's list of reactions into one compact long table, instead of a mostly empty column for every
+    person who has ever reacted
+    :param reaction_lists: A series with a list of (actor, reaction) tuples (or NaN) for each message, in message order
+    :return: A dataframe with a row per reaction: [msg_idx (position of the message), actor, reaction], where actor and
+        reaction are categorical (integer codes with a dictionary). Only each actor's last reaction to a message is kept
+    """
+
+    exploded = pd.Series(reaction_lists.values).explode().dropna()
+
+    if exploded.shape[0] == 0:
+        return pd.DataFrame({'msg_idx': np.array([], dtype=np.int32),
+                             'actor': pd.Categorical([]),
+                             'reaction': pd.Categorical([])})
+
+    actors, emojis = zip(*exploded.values)
+    reactions_df = pd.DataFrame({'msg_idx': exploded.index.values.astype(np.int32),
+                                 'actor': pd.Categorical(actors),
+                                 'reaction': pd.Categorical(emojis)})
+
+    return reactions_df.drop_duplicates(['msg_idx', 'actor'], keep='last').reset_index(drop=True)
+
+
+def concat_reactions_dfs(reactions_dfs: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenates reaction tables, merging their categorical dictionaries
+    """
+
+    # Empty tables have no dtypes to merge, so are only kept if everything is empty
+    combined_df = pd.concat([x for x in reactions_dfs if x.shape[0] > 0] or reactions_dfs[:1], ignore_index=True)
+    for col in ('actor', 'reaction'):
+        combined_df[col] = pd.Categorical(combined_df[col].astype(object))
+
+    return combined_df
+
+
+def count_reactions_by_msg(reactions_df: pd.DataFrame, msg_count: int) -> np.ndarray:
+    """
+    :return: An array with the number of reactions to each message, in message order
+    """
+
+    return np.bincount(reactions_df['msg_idx'].values, minlength=msg_count)
+
+
+def count_reactions_by_sender(sender_names: np.ndarray, reactions_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param sender_names: The sender of each message, in message order
+    :return: A dataframe indexed by sender, with a column per actor counting the sender's messages they reacted to
+    """
+
+    recipients = sender_names[reactions_df['msg_idx'].values]
+
+    return pd.crosstab(recipients, reactions_df['actor'].values)
+
+
+def build_coded_matrix(row_codes: np.ndarray, col_codes: np.ndarray, shape: Tuple[int, int]) -> scipy.sparse.csr_matrix:
+    """
+    Counts occurrences of each (row, col) code pair into a sparse matrix, duplicate pairs are summed
+    """
+
+    return scipy.sparse.coo_matrix((np.ones(row_codes.shape[0], dtype=np.int64), (row_codes, col_codes)),
+                                   shape=shape).tocsr()
+
+
+def top_matrix_entries(matrix: scipy.sparse.spmatrix, row_labels: pd.Index, col_labels: pd.Index,
+                       n: int = 20) -> List[Tuple[str, str, int]]:
+    """
+    :return: The n largest non-zero entries of a sparse matrix, structured: (Row Label, Column Label, Value)
+    """
+
+    coo = matrix.tocoo()
+    top_idx = np.argsort(coo.data)[::-1][:n] if n > 0 else np.argsort(coo.data)[::-1]
+
+    return [(row_labels[coo.row[ii]], col_labels[coo.col[ii]], int(coo.data[ii])) for ii in top_idx]
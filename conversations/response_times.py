@@ -0,0 +1,97 @@
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+
+# Timestamps are handled as int64 nanoseconds
+NS_PER_S = 10 ** 9
+
+
+def build_turn_boundaries(timestamps_ns: np.ndarray, sender_codes: np.ndarray,
+                          convo_codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the messages which start a new turn (a run of consecutive messages from the same sender)
+    :param timestamps_ns: int64 message timestamps, sorted within each conversation
+    :param sender_codes: integer code of each message's sender
+    :param convo_codes: integer code of each message's conversation, all messages of a conversation must be contiguous
+    :return: A tuple of boolean arrays: (starts a new turn, is a reply to another sender in the same conversation)
+    """
+
+    if not (timestamps_ns.shape == sender_codes.shape == convo_codes.shape):
+        raise ValueError("timestamps, senders and conversations must all have the same length")
+
+    new_convo = np.empty(convo_codes.shape[0], dtype=bool)
+    new_convo[:1] = True
+    np.not_equal(convo_codes[1:], convo_codes[:-1], out=new_convo[1:])
+
+    sender_change = np.empty(sender_codes.shape[0], dtype=bool)
+    sender_change[:1] = False
+    np.not_equal(sender_codes[1:], sender_codes[:-1], out=sender_change[1:])
+
+    is_reply = sender_change & ~new_convo
+    turn_start = sender_change | new_convo
+
+    return turn_start, is_reply
+
+
+def build_reply_df(timestamps_ns: np.ndarray, sender_codes: np.ndarray, convo_codes: np.ndarray,
+                   max_latency: pd.Timedelta = None) -> pd.DataFrame:
+    """
+    Calculates the latency of every reply (a message following a message from a different sender in the same
+    conversation) in a single vectorised pass
+    :param max_latency: Optional cut-off, longer gaps are treated as new conversations rather than replies
+    :return: A dataframe with one row per reply: ['msg_idx', 'convo', 'sender', 'replied_to', 'latency_s']
+    """
+
+    turn_start, is_reply = build_turn_boundaries(timestamps_ns, sender_codes, convo_codes)
+
+    # Shift by one message to compare each message with its predecessor
+    latencies_ns = np.zeros(timestamps_ns.shape[0], dtype=np.int64)
+    latencies_ns[1:] = np.diff(timestamps_ns)
+
+    if max_latency is not None:
+        is_reply &= latencies_ns <= max_latency.value
+
+    reply_idx = np.flatnonzero(is_reply)
+
+    return pd.DataFrame({
+        'msg_idx': reply_idx,
+        'convo': convo_codes[reply_idx],
+        'sender': sender_codes[reply_idx],
+        'replied_to': sender_codes[reply_idx - 1],
+        'latency_s': latencies_ns[reply_idx] / NS_PER_S,
+    })
+
+
+def build_turn_df(timestamps_ns: np.ndarray, sender_codes: np.ndarray, convo_codes: np.ndarray) -> pd.DataFrame:
+    """
+    Collapses messages into turns in a single vectorised pass
+    :return: A dataframe with one row per turn: ['convo', 'sender', 'start_idx', 'msg_count', 'duration_s']
+    """
+
+    turn_start, _ = build_turn_boundaries(timestamps_ns, sender_codes, convo_codes)
+
+    start_idx = np.flatnonzero(turn_start)
+    end_idx = np.append(start_idx[1:], timestamps_ns.shape[0]) - 1
+
+    return pd.DataFrame({
+        'convo': convo_codes[start_idx],
+        'sender': sender_codes[start_idx],
+        'start_idx': start_idx,
+        'msg_count': end_idx - start_idx + 1,
+        'duration_s': (timestamps_ns[end_idx] - timestamps_ns[start_idx]) / NS_PER_S,
+    })
+
+
+def summarise_replies(reply_df: pd.DataFrame, group_cols: List[str]) -> pd.DataFrame:
+    """
+    Aggregates reply latencies, medians are used as reply times are heavily skewed by overnight gaps
+    """
+
+    grouped = reply_df.groupby(group_cols, observed=True)['latency_s']
+    summary_df = grouped.agg(['count', 'median', 'mean'])
+    summary_df['p90'] = grouped.quantile(0.9)
+    summary_df.columns = ['replies', 'median_s', 'mean_s', 'p90_s']
+
+    return summary_df.reset_index()
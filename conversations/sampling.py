@@ -0,0 +1,104 @@
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+# Conversations are stratified by message count (bin edges), as well as group vs one-to-one and source
+size_bins = [0, 100, 1_000, 10_000, np.inf]
+size_labels = ['<100', '100-1k', '1k-10k', '10k+']
+
+# Two sided 95% normal interval
+ci_z = 1.96
+
+
+def stable_uniform(keys: Iterable, seed: int = 0) -> np.ndarray:
+    """
+    :return: A number in [0, 1) for each key, which is the same on every run for the same key and seed
+    """
+
+    hashes = pd.util.hash_array(np.asarray(keys, dtype=object), hash_key=f"{seed:016d}"[-16:])
+
+    return hashes / 2 ** 64
+
+
+def assign_strata(msg_counts: pd.Series, is_group: pd.Series, sources: pd.Series) -> pd.Series:
+    """
+    :param msg_counts: Message counts, indexed by conversation name
+    :param is_group: Whether each conversation is a group chat, indexed by conversation name
+    :param sources: The source(s) of each conversation's messages (e.g. 'Facebook', 'Facebook + Instagram')
+    :return: The stratum label of each conversation
+    """
+
+    size_strata = pd.cut(msg_counts, size_bins, labels=size_labels, right=False).astype(str)
+
+    return size_strata + ' | ' + np.where(is_group, 'Group', 'One-to-One') + ' | ' + sources.astype(str)
+
+
+def sample_strata(strata: pd.Series, fraction: float, seed: int = 0) -> pd.Series:
+    """
+    Deterministically samples the same fraction of every stratum (at least one from each), choosing the names with the
+    lowest stable hashes, so samples are reproducible and larger fractions contain smaller ones
+    :param strata: The stratum label of each conversation, indexed by conversation name
+    :return: The weight of each sampled conversation (stratum size / number sampled from it), indexed by name
+    """
+
+    ranks_df = pd.DataFrame({'stratum': strata.values, 'u': stable_uniform(strata.index, seed)}, index=strata.index)
+    ranks_df['rank'] = ranks_df.groupby('stratum')['u'].rank(method='first')
+
+    stratum_sizes = ranks_df['stratum'].map(ranks_df['stratum'].value_counts())
+    sample_sizes = np.maximum(1, np.ceil(stratum_sizes * fraction))
+
+    is_sampled = ranks_df['rank'] <= sample_sizes
+
+    return (stratum_sizes / sample_sizes)[is_sampled].rename('weight')
+
+
+def sample_mask(keys: np.ndarray, fraction: float, seed: int = 0) -> np.ndarray:
+    """
+    :param keys: A stable key for each item (e.g. message hashes)
+    :return: A boolean mask deterministically keeping roughly the fraction of items
+    """
+
+    return stable_uniform(keys, seed) < fraction
+
+
+def to_numeric_result(result: Any) -> pd.Series:
+    """
+    Converts an analysis result into a numeric series, so results from different samples can be aligned
+    :param result: A number, series, dataframe (numeric columns are stacked) or list of tuples ('Name', Value, ...)
+    """
+
+    if isinstance(result, pd.DataFrame):
+        return result.select_dtypes('number').stack()
+    if isinstance(result, pd.Series):
+        return result
+    if isinstance(result, list):
+        return pd.Series({x[0]: x[1] for x in result}, dtype=float)
+
+    return pd.Series([result], index=['value'], dtype=float)
+
+
+def summarise_replicates(results: List[pd.Series], full_result: pd.Series = None) -> pd.DataFrame:
+    """
+    Estimates each value and its error bars from the spread between results on independent samples
+    :param results: The numeric results (see to_numeric_result) of the analysis on each sample
+    :param full_result: Optional numeric result on the full dataset, to compare against
+    :return: A dataframe with a row per value: ['estimate', 'std_err', 'ci_low', 'ci_high', 'samples'], plus
+        ['full', 'error', 'within_ci'] when the full result is provided
+    """
+
+    results_df = pd.concat(results, axis=1)
+
+    summary_df = pd.DataFrame({'estimate': results_df.mean(axis=1),
+                               'samples': results_df.notna().sum(axis=1)})
+    summary_df['std_err'] = results_df.std(axis=1, ddof=1) / np.sqrt(summary_df['samples'])
+    summary_df['ci_low'] = summary_df['estimate'] - ci_z * summary_df['std_err']
+    summary_df['ci_high'] = summary_df['estimate'] + ci_z * summary_df['std_err']
+
+    if full_result is not None:
+        summary_df = summary_df.join(full_result.rename('full'), how='outer')
+        summary_df['error'] = summary_df['estimate'] - summary_df['full']
+        summary_df['within_ci'] = summary_df['full'].between(summary_df['ci_low'], summary_df['ci_high'])
+
+    return summary_df[[x for x in ['estimate', 'std_err', 'ci_low', 'ci_high', 'samples', 'full', 'error',
+                                   'within_ci'] if x in summary_df.columns]]
@@ -0,0 +1,60 @@
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+
+session_cols = ['start', 'end', 'duration_s', 'initiator', 'participants', 'participant_count', 'msg_count',
+                'char_count']
+
+
+def find_session_starts(timestamps_ns: np.ndarray, gap: pd.Timedelta) -> np.ndarray:
+    """
+    :param timestamps_ns: sorted int64 message timestamps
+    :param gap: the minimum time between messages which separates two sessions
+    :return: the positions of the first message of each session
+    """
+
+    is_start = np.empty(timestamps_ns.shape[0], dtype=bool)
+    is_start[:1] = True
+    np.greater(np.diff(timestamps_ns), gap.value, out=is_start[1:])
+
+    return np.flatnonzero(is_start)
+
+
+def build_sessions_df(msgs_df: pd.DataFrame, gap: pd.Timedelta) -> pd.DataFrame:
+    """
+    Splits messages into sessions (bursts of messages separated by more than gap) using vectorised gap detection on
+    the sorted timestamp index
+    :param msgs_df: A dataframe of messages sorted by its timestamp index, with sender_name and text_len columns
+    :param gap: the minimum time between messages which separates two sessions
+    :return: A dataframe with one row per session, with the columns in session_cols
+    """
+
+    if msgs_df.shape[0] == 0:
+        return pd.DataFrame(columns=session_cols)
+
+    timestamps_ns = msgs_df.index.asi8
+    # Sorted codes keep each session's participants in alphabetical order
+    sender_codes, senders = pd.factorize(msgs_df['sender_name'], sort=True)
+
+    start_idx = find_session_starts(timestamps_ns, gap)
+    end_idx = np.append(start_idx[1:], timestamps_ns.shape[0]) - 1
+    session_ids = np.repeat(np.arange(start_idx.shape[0]), end_idx - start_idx + 1)
+
+    # Unique (session, sender) pairs give the participants of each session
+    pair_keys = np.unique(session_ids.astype(np.int64) * len(senders) + sender_codes)
+    pair_sessions, pair_senders = np.divmod(pair_keys, len(senders))
+    participant_counts = np.bincount(pair_sessions, minlength=start_idx.shape[0])
+    participants = np.split(senders.values[pair_senders], np.cumsum(participant_counts)[:-1])
+
+    return pd.DataFrame({
+        'start': msgs_df.index[start_idx],
+        'end': msgs_df.index[end_idx],
+        'duration_s': (timestamps_ns[end_idx] - timestamps_ns[start_idx]) / 10 ** 9,
+        'initiator': senders.values[sender_codes[start_idx]],
+        'participants': [tuple(x) for x in participants],
+        'participant_count': participant_counts,
+        'msg_count': end_idx - start_idx + 1,
+        'char_count': np.add.reduceat(msgs_df['text_len'].values, start_idx),
+    })
@@ -0,0 +1,117 @@
+import re
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+share_cols = ['msg_idx', 'url', 'domain', 'path', 'title']
+
+# Splits a link into its parts, the scheme is optional as some sources (and people) leave it out
+url_pattern = re.compile(r'^(?:(?P<scheme>[a-z][a-z0-9+.-]*)://)?(?:[^@/?#\s]*@)?(?P<host>[^/?#:\s]+)'
+                         r'(?::(?P<port>\d*))?(?P<path>[^?#\s]*)(?:\?(?P<query>[^#\s]*))?', re.IGNORECASE)
+
+# Query parameters which only track where a link was shared from, so are removed to match re-shares of the same link.
+# Names must be followed by a value or the next parameter, so e.g. 'size' isn't mistaken for 'si'
+tracking_param_pattern = r'(?:^|&)(?:utm_[^=&]*|fbclid|gclid|igshid|igsh|si|ref_src|mibextid)(?:=[^&]*)?(?=&|$)'
+
+
+def parse_links(links: pd.Series) -> pd.DataFrame:
+    """
+    Parses links into their domain, path and a normalised URL with vectorised string operations, each distinct link is
+    only parsed once. Normalised URLs have no scheme, 'www.' prefix, default port, fragment, trailing slash or tracking
+    parameters, so the same page shared from different apps has the same URL, e.g. 'youtube.com/watch?v=abc'
+    :param links: The links (or NaN), e.g. the share_link column of msgs_df
+    :return: A dataframe with the same index as links: ['url', 'domain', 'path'], with NaN where there isn't a link
+    """
+
+    link_codes, unique_links = pd.factorize(links)
+    parts_df = pd.Series(unique_links, dtype=object).astype(str).str.strip().str.extract(url_pattern)
+
+    domains = parts_df['host'].str.lower().str.replace(r'^www\d*\.', '', regex=True).str.rstrip('.')
+
+    # Domains need a dot (or to be localhost), so text which happens to be in the share_link column isn't counted
+    domains = domains.where(domains.str.contains(r'\.[a-z]', regex=True, na=False) | (domains == 'localhost'))
+
+    paths = parts_df['path'].str.replace(r'/+$', '', regex=True).replace('', '/')
+
+    queries = parts_df['query'].fillna('').str.replace(tracking_param_pattern, '', regex=True).str.lstrip('&')
+    ports = parts_df['port'].where(~parts_df['port'].isin(['', '80', '443']))
+
+    urls = (domains + (':' + ports).fillna('') + paths.where(paths != '/', '') +
+            ('?' + queries).where(queries != '', ''))
+
+    parsed_df = pd.DataFrame({'url': urls.values, 'domain': domains.values,
+                              'path': paths.where(domains.notna()).values})
+
+    # Messages without a link have the code -1, which is pointed at an empty row
+    parsed_df.loc[len(parsed_df)] = np.nan
+
+    return parsed_df.iloc[link_codes].set_axis(links.index)
+
+
+def build_shares_df(msgs_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parses every shared link of a conversation into a compact long table, rather than keeping parsed columns for every
+    message (most of which have no link)
+    :param msgs_df: A conversation's messages, in message order
+    :return: A dataframe with a row per shared link: [msg_idx (position of the message), url, domain, path, title],
+        where url and domain are categorical and title is the text shared with the link (if any)
+    """
+
+    if 'share_link' not in msgs_df.columns:
+        return pd.DataFrame({'msg_idx': np.array([], dtype=np.int32), 'url': pd.Categorical([]),
+                             'domain': pd.Categorical([]), 'path': pd.Series([], dtype=object),
+                             'title': pd.Series([], dtype=object)})
+
+    msg_idx = np.flatnonzero(msgs_df['share_link'].notna().values)
+    parsed_df = parse_links(msgs_df['share_link'].iloc[msg_idx])
+
+    titles = msgs_df['share_text'].iloc[msg_idx].values if 'share_text' in msgs_df.columns else np.nan
+
+    shares_df = pd.DataFrame({'msg_idx': msg_idx.astype(np.int32),
+                              'url': pd.Categorical(parsed_df['url'].values),
+                              'domain': pd.Categorical(parsed_df['domain'].values),
+                              'path': parsed_df['path'].values,
+                              'title': titles})
+
+    return shares_df[shares_df['domain'].notna()].reset_index(drop=True)
+
+
+def concat_shares_dfs(shares_dfs: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenates share tables, merging their categorical dictionaries
+    """
+
+    # Empty tables have no dtypes to merge, so are only kept if everything is empty
+    combined_df = pd.concat([x for x in shares_dfs if x.shape[0] > 0] or shares_dfs[:1], ignore_index=True)
+    for col in ('url', 'domain'):
+        combined_df[col] = pd.Categorical(combined_df[col].astype(object))
+
+    return combined_df
+
+
+def build_domain_offsets(domain_codes: np.ndarray, n_domains: int) -> np.ndarray:
+    """
+    :param domain_codes: The domain code of each share, sorted
+    :return: The position each domain's shares start at (and the end of the last one), so a domain's shares are
+        rows [offsets[code], offsets[code + 1])
+    """
+
+    return np.searchsorted(domain_codes, np.arange(n_domains + 1))
+
+
+def rank_counts(counts: pd.Series, group_levels: List[str], n: int) -> pd.DataFrame:
+    """
+    :param counts: Counts indexed by the group levels and the item being counted (e.g. sender, period and domain)
+    :param n: Number of items to keep per group. For n < 1, all items will be kept
+    :return: The largest counts in each group, with their rank (1 is the most), ties are ranked by the item's order
+    """
+
+    counts = counts[counts > 0].sort_values(ascending=False, kind='stable')
+    ranked_df = counts.rename('shares').reset_index()
+    ranked_df['rank'] = ranked_df.groupby(group_levels, observed=True).cumcount() + 1
+
+    if n > 0:
+        ranked_df = ranked_df[ranked_df['rank'] <= n]
+
+    return ranked_df.sort_values(group_levels + ['rank'], kind='stable').reset_index(drop=True)
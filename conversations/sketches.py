@@ -0,0 +1,256 @@
+import os
+import pickle
+from typing import *
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+
+def hash_values(values: Iterable) -> np.ndarray:
+    """
+    :return: A 64 bit hash of each value, stable across runs
+    """
+
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    # Split into 32 bit halves, as their logarithms are exact in double precision
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+
+    with np.errstate(divide='ignore'):
+        high_length = np.where(high > 0, np.floor(np.log2(np.maximum(high, 1))) + 33, 0)
+        low_length = np.where(low > 0, np.floor(np.log2(np.maximum(low, 1))) + 1, 0)
+
+    return np.where(high_length > 0, high_length, low_length).astype(np.int64)
+
+
+class HyperLogLog:
+    """
+    Estimates the number of distinct values seen using 2 ** precision small registers (~1.6% error at precision 12)
+    """
+
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.registers = np.zeros(2 ** precision, dtype=np.uint8)
+
+    def add(self, values: Iterable):
+        hashes = hash_values(values)
+
+        if hashes.shape[0] == 0:
+            return
+
+        # The first bits choose a register, which keeps the longest run of leading zeros in the remaining bits
+        register_idx = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        remaining_bits = 64 - self.precision
+        remaining = hashes & np.uint64((1 << remaining_bits) - 1)
+        ranks = (remaining_bits - _bit_length(remaining) + 1).astype(np.uint8)
+
+        np.maximum.at(self.registers, register_idx, ranks)
+
+    def merge(self, other: 'HyperLogLog'):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        n_registers = self.registers.shape[0]
+        alpha = 0.7213 / (1 + 1.079 / n_registers)
+        estimate = alpha * n_registers ** 2 / np.sum(2.0 ** -self.registers.astype(np.float64))
+
+        # Small cardinalities are more accurately estimated from the number of empty registers
+        empty_registers = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * n_registers and empty_registers > 0:
+            estimate = n_registers * np.log(n_registers / empty_registers)
+
+        return int(round(estimate))
+
+
+class TDigest:
+    """
+    Approximates the distribution of values seen with a bounded number of weighted centroids. Centroids near the tails
+    hold fewer values, so extreme quantiles stay accurate. Batches of values are merged in with one vectorised pass
+    """
+
+    def __init__(self, compression: int = 200):
+        self.compression = compression
+        self.means = np.array([], dtype=np.float64)
+        self.weights = np.array([], dtype=np.float64)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, values: Iterable[float]):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+
+        if values.shape[0] == 0:
+            return
+
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(values.shape[0])]))
+
+    def merge(self, other: 'TDigest'):
+        if other.weights.shape[0] == 0:
+            return
+
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+
+        # Centroids are grouped by the integer part of the scale function at their quantile, which changes quickly at
+        # the tails and slowly in the middle
+        cumulative = np.cumsum(weights)
+        mid_quantiles = (cumulative - weights / 2) / cumulative[-1]
+        scale = self.compression / np.pi * np.arcsin(2 * mid_quantiles - 1)
+        group_idx = np.floor(scale - scale[0]).astype(np.int64)
+
+        group_weights = np.bincount(group_idx, weights=weights)
+        has_weight = group_weights > 0
+        self.means = (np.bincount(group_idx, weights=weights * means)[has_weight] / group_weights[has_weight])
+        self.weights = group_weights[has_weight]
+
+    @property
+    def count(self) -> int:
+        return int(self.weights.sum())
+
+    def quantile(self, q: Union[float, Iterable[float]]) -> Union[float, np.ndarray]:
+        if self.weights.shape[0] == 0:
+            return np.nan if np.isscalar(q) else np.full(len(q), np.nan)
+
+        # Interpolate between the centroids' centres, anchored by the exact minimum and maximum
+        cumulative = np.cumsum(self.weights)
+        positions = np.concatenate([[0], cumulative - self.weights / 2, [cumulative[-1]]])
+        means = np.concatenate([[self.min], self.means, [self.max]])
+
+        return np.interp(np.asarray(q) * cumulative[-1], positions, means)
+
+
+class HeavyHitters:
+    """
+    Keeps approximate counts of the most frequent items (Misra-Gries summary). Each count is under-estimated by at most
+    the total count / (capacity + 1), so anything more frequent than that is always kept
+    """
+
+    def __init__(self, capacity: int = 500):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.int64)
+        self.total = 0
+
+    def add(self, items: Iterable):
+        batch_counts = pd.Series(np.asarray(items, dtype=object)).value_counts()
+        self.total += int(batch_counts.sum())
+        self._merge_counts(batch_counts)
+
+    def merge(self, other: 'HeavyHitters'):
+        self.total += other.total
+        self._merge_counts(other.counts)
+
+    def _merge_counts(self, counts: pd.Series):
+        combined = self.counts.add(counts, fill_value=0).astype(np.int64)
+
+        # Subtracting the (capacity + 1)th largest count keeps at most capacity items
+        if combined.shape[0] > self.capacity:
+            threshold = np.partition(combined.values, -(self.capacity + 1))[-(self.capacity + 1)]
+            combined = combined - threshold
+            combined = combined[combined > 0]
+
+        self.counts = combined
+
+    def top(self, n: int = 10) -> List[Tuple[str, int]]:
+        top_counts = self.counts.nlargest(n)
+
+        return list(zip(top_counts.index, top_counts.values.tolist()))
+
+
+class OverviewSketches:
+    """
+    Small summaries of every message, maintained as messages are ingested and saved separately to the cache, so an
+    overview of an export can be shown without loading any messages
+    """
+
+    # Words shorter than this, and common English words, aren't interesting enough to count
+    min_word_len = 3
+
+    def __init__(self):
+        self.msg_count = 0
+        self.convo_names = set()
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+        self.senders = HyperLogLog()
+        self.msg_lengths = TDigest()
+        self.reply_latencies = TDigest()
+        self.words = HeavyHitters()
+        self.links = HeavyHitters()
+
+    def add_msgs(self, convo_name: str, msgs_df: pd.DataFrame):
+        """
+        :param msgs_df: Newly ingested messages of a conversation, with derived columns
+        """
+
+        if msgs_df.shape[0] == 0:
+            return
+
+        self.msg_count += msgs_df.shape[0]
+        self.convo_names.add(convo_name)
+        self.first_timestamp = min(self.first_timestamp or msgs_df.index[0], msgs_df.index[0])
+        self.last_timestamp = max(self.last_timestamp or msgs_df.index[-1], msgs_df.index[-1])
+
+        self.senders.add(msgs_df['sender_name'].values)
+
+        # Missing text is read as the string 'nan' (e.g. photos and calls)
+        texts = msgs_df.loc[(msgs_df['text_len'] > 0) & (msgs_df['text'] != 'nan'), ['text', 'text_len']]
+        self.msg_lengths.add(texts['text_len'].values)
+
+        words = texts['text'].str.lower().str.findall(r"[^\W\d_]+").explode().dropna()
+        words = words[(words.str.len() >= self.min_word_len) & ~words.isin(ENGLISH_STOP_WORDS)]
+        self.words.add(words.values)
+
+        if 'share_link' in msgs_df.columns:
+            self.links.add(msgs_df['share_link'].dropna().values)
+
+    def add_reply_latencies(self, latencies_s: Iterable[float]):
+        self.reply_latencies.add(latencies_s)
+
+    def summary(self, n: int = 10) -> Dict[str, Any]:
+        """
+        :param n: The number of top words and links to include
+        :return: A dictionary of approximate statistics
+        """
+
+        quantiles = [0.5, 0.9, 0.99]
+
+        return {
+            'messages': self.msg_count,
+            'conversations': len(self.convo_names),
+            'first_message': self.first_timestamp,
+            'last_message': self.last_timestamp,
+            'distinct_senders': self.senders.count(),
+            'msg_length_quantiles': dict(zip(quantiles, self.msg_lengths.quantile(quantiles))),
+            'reply_latency_quantiles_s': dict(zip(quantiles, self.reply_latencies.quantile(quantiles))),
+            'top_words': self.words.top(n),
+            'top_links': self.links.top(n),
+        }
+
+    def save(self, file_path: str):
+        # Write to a temporary file first, so being killed mid-write can't corrupt the previous sketches
+        with open(file_path + ".tmp", "wb") as file_obj:
+            pickle.dump(self, file_obj)
+        os.replace(file_path + ".tmp", file_path)
+
+    @staticmethod
+    def load(file_path: str) -> Union['OverviewSketches', None]:
+        if not os.path.exists(file_path):
+            return None
+
+        try:
+            with open(file_path, "rb") as file_obj:
+                return pickle.load(file_obj)
+
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
@@ -0,0 +1,199 @@
+import os
+from typing import *
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+
+def build_incidence_matrix(person_codes: np.ndarray, convo_codes: np.ndarray,
+                           shape: Tuple[int, int]) -> scipy.sparse.csr_matrix:
+    """
+    :param person_codes: The person of each (person, conversation) membership
+    :param convo_codes: The conversation of each membership
+    :param shape: (number of people, number of conversations)
+    :return: A sparse people x conversations matrix, with a 1 where the person is a member of the conversation
+    """
+
+    incidence = scipy.sparse.coo_matrix((np.ones(person_codes.shape[0], dtype=np.int32), (person_codes, convo_codes)),
+                                        shape=shape).tocsr()
+    incidence.data[:] = 1
+
+    return incidence
+
+
+def build_co_membership(incidence: scipy.sparse.csr_matrix) -> scipy.sparse.csr_matrix:
+    """
+    :return: A sparse people x people matrix, counting the conversations each pair are both members of. The diagonal
+        (each person with themselves) is removed
+    """
+
+    return remove_loops(incidence @ incidence.T)
+
+
+def symmetrise(directed: scipy.sparse.spmatrix) -> scipy.sparse.csr_matrix:
+    """
+    :return: The undirected version of a directed weight matrix (weights in both directions are summed), without loops
+    """
+
+    return remove_loops(directed + directed.T)
+
+
+def remove_loops(matrix: scipy.sparse.spmatrix) -> scipy.sparse.csr_matrix:
+    matrix = (matrix - scipy.sparse.diags(matrix.diagonal(), dtype=matrix.dtype)).tocsr()
+    matrix.eliminate_zeros()
+
+    return matrix
+
+
+def pagerank(adjacency: scipy.sparse.csr_matrix, damping: float = 0.85, tol: float = 1e-8,
+             max_iter: int = 100) -> np.ndarray:
+    """
+    Weighted PageRank by power iteration, using one sparse matrix-vector product per iteration
+    :param adjacency: A square weight matrix, where rows link to columns
+    :return: The PageRank of each node, summing to 1
+    """
+
+    n_nodes = adjacency.shape[0]
+    if n_nodes == 0:
+        return np.array([])
+
+    out_weights = np.asarray(adjacency.sum(axis=1)).ravel()
+    is_dangling = out_weights == 0
+
+    # Row normalise, so each node shares its rank across its links in proportion to their weight
+    inv_out_weights = np.divide(1.0, out_weights, out=np.zeros(n_nodes), where=~is_dangling)
+    transition_t = (scipy.sparse.diags(inv_out_weights) @ adjacency).T.tocsr()
+
+    ranks = np.full(n_nodes, 1.0 / n_nodes)
+    for _ in range(max_iter):
+        # Nodes without links share their rank with everyone
+        new_ranks = damping * (transition_t @ ranks + ranks[is_dangling].sum() / n_nodes) + (1 - damping) / n_nodes
+
+        if np.abs(new_ranks - ranks).sum() < tol:
+            return new_ranks
+
+        ranks = new_ranks
+
+    return ranks
+
+
+def label_propagation(adjacency: scipy.sparse.csr_matrix, max_iter: int = 100, random_state: int = 0) -> np.ndarray:
+    """
+    Detects communities by repeatedly moving nodes into the community with the most weight among their neighbours.
+    Each iteration sums the weight of every (node, neighbour's community) pair in one vectorised pass over the edges
+    :param adjacency: A symmetric weight matrix
+    :return: A community label for each node, numbered from largest to smallest community
+    """
+
+    # Without any edges (e.g. an account without shared group chats) every node is its own community, all of one size
+    n_nodes = adjacency.shape[0]
+    if adjacency.nnz == 0:
+        return np.arange(n_nodes)
+
+    edges = adjacency.tocoo()
+    rng = np.random.default_rng(random_state)
+    labels = np.arange(n_nodes)
+
+    for _ in range(max_iter):
+        # Sum edge weights into each (node, community) pair, then keep the heaviest community for each node
+        pair_keys, pair_idx = np.unique(edges.row.astype(np.int64) * n_nodes + labels[edges.col], return_inverse=True)
+        pair_weights = np.bincount(pair_idx, weights=edges.data)
+
+        # Sorting by node then weight (ties broken by the lowest community) leaves each node's best community last
+        pair_nodes, pair_labels = pair_keys // n_nodes, pair_keys % n_nodes
+        order = np.lexsort((-pair_labels, pair_weights, pair_nodes))
+        is_last = np.append(pair_nodes[order][1:] != pair_nodes[order][:-1], True)
+        best_nodes, best_labels = pair_nodes[order][is_last], pair_labels[order][is_last]
+
+        # Only a random half of the nodes move each iteration, updating them all at once makes labels oscillate
+        can_move = rng.random(best_nodes.shape[0]) < 0.5
+        new_labels = labels.copy()
+        new_labels[best_nodes[can_move]] = best_labels[can_move]
+
+        if (best_labels == labels[best_nodes]).all():
+            break
+
+        labels = new_labels
+
+    _, labels, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    size_rank = np.empty_like(sizes)
+    size_rank[np.argsort(-sizes, kind='stable')] = np.arange(sizes.shape[0])
+
+    return size_rank[labels]
+
+
+def build_edges_df(people: pd.Index, weight_matrices: Dict[str, scipy.sparse.spmatrix]) -> pd.DataFrame:
+    """
+    :param people: The names labelling both axes of the matrices
+    :param weight_matrices: Symmetric weight matrices, structured: {Column Name: Matrix}
+    :return: A dataframe with a row per linked pair (each pair only once): ['source', 'target', *weight columns]
+    """
+
+    combined = sum(abs(x) for x in weight_matrices.values())
+    upper = scipy.sparse.triu(combined, k=1).tocoo()
+
+    edges_df = pd.DataFrame({'source': people[upper.row], 'target': people[upper.col]})
+    for col, matrix in weight_matrices.items():
+        # Indexing with empty arrays returns a sparse matrix rather than a dense one, so both are densified
+        weights = matrix.tocsr()[upper.row, upper.col]
+        edges_df[col] = np.asarray(weights.todense() if scipy.sparse.issparse(weights) else weights).ravel()
+
+    return edges_df
+
+
+def write_graphml(file_path: str, nodes_df: pd.DataFrame, edges_df: pd.DataFrame):
+    """
+    Writes an undirected graph in GraphML format, for tools such as Gephi, Cytoscape or networkx
+    :param nodes_df: A dataframe indexed by node name, every column is written as a node attribute
+    :param edges_df: A dataframe with 'source' and 'target' columns, other columns are written as edge attributes
+    """
+
+    def attr_type(values: pd.Series) -> str:
+        if values.dtype.kind in 'iub':
+            return 'long'
+        if values.dtype.kind == 'f':
+            return 'double'
+        return 'string'
+
+    node_cols = list(nodes_df.columns)
+    edge_cols = [x for x in edges_df.columns if x not in ('source', 'target')]
+
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">']
+    lines += [f'  <key id="n{ii}" for="node" attr.name="{escape(col)}" attr.type="{attr_type(nodes_df[col])}"/>'
+              for ii, col in enumerate(node_cols)]
+    lines += [f'  <key id="e{ii}" for="edge" attr.name="{escape(col)}" attr.type="{attr_type(edges_df[col])}"/>'
+              for ii, col in enumerate(edge_cols)]
+    lines.append('  <graph id="social" edgedefault="undirected">')
+
+    # Iterate over columns' arrays rather than rows, so each column keeps its own type
+    for name, row in zip(nodes_df.index, zip(*[nodes_df[col].values for col in node_cols])):
+        data = ''.join(f'<data key="n{ii}">{escape(str(x))}</data>' for ii, x in enumerate(row))
+        lines.append(f'    <node id={quoteattr(str(name))}>{data}</node>')
+
+    for source, target, *row in zip(*[edges_df[col].values for col in ['source', 'target'] + edge_cols]):
+        data = ''.join(f'<data key="e{ii}">{escape(str(x))}</data>' for ii, x in enumerate(row))
+        lines.append(f'    <edge source={quoteattr(str(source))} target={quoteattr(str(target))}>{data}</edge>')
+
+    lines += ['  </graph>', '</graphml>']
+
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+
+
+def export_graph(output_dir: str, nodes_df: pd.DataFrame, edges_df: pd.DataFrame) -> List[str]:
+    """
+    Writes the graph as GraphML, and as node and edge CSVs
+    :return: The paths written
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, x) for x in ('social_graph.graphml', 'nodes.csv', 'edges.csv')]
+
+    write_graphml(paths[0], nodes_df, edges_df)
+    nodes_df.to_csv(paths[1], index_label='name')
+    edges_df.to_csv(paths[2], index=False)
+
+    return paths
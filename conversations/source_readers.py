@@ -0,0 +1,567 @@
+import abc
+import json
+import os
+import re
+import time
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+# Every source's messages are standardised to the columns of cleaned Facebook messages, {Column: Default Value}
+standard_cols = {
+    'sender_name': '',
+    'text': np.nan,
+    'major_type': 'Generic',
+    'is_unsent': False,
+    'photos': 0,
+    'share_link': np.nan,
+    'sticker_path': np.nan,
+    'call_duration': np.nan,
+    'videos': 0,
+    'share_text': np.nan,
+    'files': 0,
+    'missed_call': False,
+    'audio_files': 0,
+    'gifs': np.nan,
+    'call': False,
+}
+
+# Columns of per message lists, which have no scalar default, so are only kept from sources that have them
+list_cols = ['reactions']
+
+
+class SourceReader(abc.ABC):
+    """
+    Reads the conversations of one messaging platform's export. Readers only find conversations and stream their
+    messages as batches of standard columns, everything else (cleaning, checkpointing, quarantining, caching and delta
+    ingestion) is shared by every source in ConvoReader
+    """
+
+    # Recorded in each message's source column, and used to pass a source's export path to ConvoReader.read_convos
+    source_name: str
+
+    @abc.abstractmethod
+    def find_convo_paths(self, export_path: str) -> List[str]:
+        """
+        :param export_path: The root folder of the source's export
+        :return: The path of each conversation in the export, in a consistent order
+        """
+
+    @abc.abstractmethod
+    def read_batches(self, convo_path: str, since_ms: int = None) -> Iterator[pd.DataFrame]:
+        """
+        :param since_ms: Optional timestamp (ms), messages before which are skipped
+        :return: Batches of messages in the order they were sent, each with a timezone aware 'timestamp' column and
+            any of standard_cols (missing columns take their default values)
+        """
+
+    @abc.abstractmethod
+    def read_convo_info(self, convo_path: str) -> Tuple[str, Union[bool, None]]:
+        """
+        :return: The conversation title ('' if it has none), and whether the user is still a participant (None when the
+            source doesn't say)
+        """
+
+    def convo_key(self, export_path: str, convo_path: str) -> str:
+        """
+        :return: A key for the conversation that is the same in every export, used to match delta ingestion to it
+        """
+
+        # Single file exports are keyed on the file's name, as its path relative to itself is always '.'
+        if os.path.isfile(export_path):
+            return f"{self.source_name}:{os.path.basename(convo_path)}"
+
+        return f"{self.source_name}:{os.path.relpath(convo_path, export_path)}"
+
+
+def build_msgs_df(batches: Iterable[pd.DataFrame], source_name: str) -> pd.DataFrame:
+    """
+    Combines a reader's batches into cleaned messages, in the same format for every source
+    :return: A dataframe of messages indexed by local timestamp, with every one of standard_cols, any of list_cols the
+        source has (NaN for messages without) and the source
+    """
+
+    batches = [x for x in batches if x.shape[0] > 0] or [pd.DataFrame({'timestamp': pd.Series(
+        dtype='datetime64[ns, UTC]')})]
+    source_list_cols = [col for col in list_cols if any(col in x.columns for x in batches)]
+    col_defaults = {**standard_cols, **{col: np.nan for col in source_list_cols}}
+    batches = [x.assign(**{col: val for col, val in col_defaults.items() if col not in x.columns}) for x in batches]
+
+    # Concatenated column by column, as concatenating frames checks every value of mostly empty object columns
+    msgs_df = pd.DataFrame({col: pd.concat([x[col] for x in batches], ignore_index=True)
+                            for col in ['timestamp'] + list(col_defaults)})
+
+    # Timestamps may only be to the minute, so a stable sort keeps messages sent in the same minute in order
+    msgs_df = msgs_df.set_index('timestamp')
+    if not msgs_df.index.is_monotonic_increasing:
+        msgs_df = msgs_df.sort_index(kind='stable')
+    msgs_df = msgs_df.tz_convert(time.strftime("%z"))
+
+    msgs_df['sender_name'] = msgs_df['sender_name'].astype(str)
+    msgs_df['text'] = msgs_df['text'].astype(str)
+    msgs_df['source'] = source_name
+
+    return msgs_df
+
+
+class MetaExportReader(SourceReader):
+    """
+    Reads the JSON exports of Meta's messaging platforms. Each conversation is a folder of shards numbered from 1 (the
+    newest), with no limit on the number of shards, which each list their messages newest first. Text is written as
+    UTF-8 bytes escaped as latin-1 characters, so is decoded as it is read
+    """
+
+    # Folders of conversation folders, relative to the root of the export
+    inbox_paths: List[str]
+
+    # Uses result of json normalisation, which combines names where nested, {Field Name: Standard Column}
+    field_names: Dict[str, str]
+
+    # Fields listing attached files, which are counted (the nested uris aren't needed)
+    count_cols: List[str]
+
+    file_name_pattern = re.compile(r"message_(\d+)\.json")
+
+    def __init__(self):
+        # The header (title, whether the user is still a participant, and the participants) of the last conversation
+        # read, keyed on its newest shard's path and modification time. It is the same in every shard, so it is kept
+        # while reading the messages, rather than loading the newest shard again to read it
+        self.last_header = (None, None)
+
+    def find_convo_paths(self, export_path: str) -> List[str]:
+        inbox_paths = [os.path.join(export_path, x) for x in self.inbox_paths]
+
+        return [os.path.join(x, convo_dir) for x in inbox_paths if os.path.isdir(x) for convo_dir in
+                sorted(os.listdir(x))]
+
+    def convo_key(self, export_path: str, convo_path: str) -> str:
+        # Conversations keep their folder's name between exports, even when they are archived
+        return os.path.basename(convo_path)
+
+    def find_shard_paths(self, convo_path: str) -> List[str]:
+        """
+        :return: The paths of the conversation's shards, sorted numerically (newest first). Other files are ignored
+        """
+
+        shard_matches = [self.file_name_pattern.fullmatch(x) for x in os.listdir(convo_path)]
+
+        return [os.path.join(convo_path, x[0]) for x in sorted(filter(None, shard_matches), key=lambda x: int(x[1]))]
+
+    @staticmethod
+    def decode_text(text: str) -> str:
+        return text.encode("latin1").decode("utf-8")
+
+    def read_header(self, convo_path: str) -> Tuple[str, Union[bool, None], List[str]]:
+        """
+        :return: The conversation title, whether the user is still a participant and the participants
+        """
+
+        shard_path = self.find_shard_paths(convo_path)[0]
+        shard_key = (shard_path, os.stat(shard_path).st_mtime_ns)
+
+        header_key, header = self.last_header
+        if header_key != shard_key:
+            with open(shard_path) as file_obj:
+                header = self.parse_header(json.load(file_obj))
+            self.last_header = (shard_key, header)
+
+        return header
+
+    def parse_header(self, shard: dict) -> Tuple[str, Union[bool, None], List[str]]:
+        return (self.decode_text(shard["title"]), shard.get("is_still_participant"),
+                [self.decode_text(x["name"]) for x in shard["participants"]])
+
+    def read_convo_info(self, convo_path: str) -> Tuple[str, Union[bool, None]]:
+        title, is_active, _ = self.read_header(convo_path)
+
+        return title, is_active
+
+    def read_participants(self, convo_path: str) -> List[str]:
+        """
+        :return: Everyone in the conversation, including those who never sent a message
+        """
+
+        return self.read_header(convo_path)[2]
+
+    def read_batches(self, convo_path: str, since_ms: int = None) -> Iterator[pd.DataFrame]:
+        batches = []
+
+        for ii, shard_path in enumerate(self.find_shard_paths(convo_path)):
+            shard_key = (shard_path, os.stat(shard_path).st_mtime_ns)
+
+            # Load json as string as its nesting doesn't allow direct normalisation
+            with open(shard_path) as file_obj:
+                shard = json.load(file_obj)
+
+            if ii == 0:
+                self.last_header = (shard_key, self.parse_header(shard))
+
+            shard_msgs = shard["messages"]
+            if since_ms is not None:
+                shard_msgs = [x for x in shard_msgs if x["timestamp_ms"] >= since_ms]
+
+            if shard_msgs:
+                batches.append(self.clean_msgs(pd.json_normalize(shard_msgs)))
+
+            # Remaining shards only contain older messages, which have already been ingested
+            elif since_ms is not None:
+                break
+
+        # Shards are read newest first, so delta ingestion can stop at the first shard that is entirely older
+        yield from reversed(batches)
+
+    def clean_msgs(self, raw_msgs_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Renames fields to standard columns, converts types, and flattens and extracts highly nested fields
+        :param raw_msgs_df: The normalised messages of a shard, newest first
+        :return: The shard's messages in time order. Fields missing from the whole shard are left to their defaults
+        """
+
+        msgs_df = raw_msgs_df[[x for x in self.field_names if x in raw_msgs_df.columns]].rename(
+            columns=self.field_names)
+
+        # Reversing the messages puts them in time order without sorting
+        msgs_df = msgs_df.iloc[::-1].reset_index(drop=True)
+
+        # FIXME: Fix janky hack to convert all timestamps from UTC to local zone, or at least provide an override
+        # Unfortunately Meta gives us insufficient information to infer the tz of the sender for each message
+        msgs_df['timestamp'] = pd.to_datetime(msgs_df['timestamp'], unit='ms', utc=True)
+
+        # Decode fields with potential utf-8 characters
+        for col in ['sender_name', 'text']:
+            if col in msgs_df.columns:
+                msgs_df[col] = msgs_df[col].map(self.decode_text, na_action='ignore')
+
+        # Clean reaction encoding, these are moved into a long format table when the Convo is initialised
+        if 'reactions' in msgs_df.columns:
+            msgs_df['reactions'] = msgs_df['reactions'].map(self.restructure_reactions)
+
+        for col in self.count_cols:
+            if col in msgs_df.columns:
+                msgs_df[col] = [len(x) if type(x) is list else 0 for x in msgs_df[col]]
+
+        # Extract call data
+        if 'call_duration' in msgs_df.columns:
+            msgs_df['missed_call'] = (msgs_df['call_duration'] == 0).values
+            msgs_df['call'] = (msgs_df['call_duration'] > 0).values
+
+        return msgs_df
+
+    def restructure_reactions(self, reactions_list) -> List[Tuple[str, str]]:
+        """
+        Converts the reaction dictionaries of a message into decoded (actor, reaction) pairs, which Convo turns into its
+        long format reactions table
+        :param reactions_list: list of dictionaries containing any users that reacted and their reaction
+        :return: List of users and their corresponding reaction
+        """
+
+        # Empty values are read as floats
+        if type(reactions_list) != list: return []
+
+        return [(self.decode_text(x["actor"]), self.decode_text(x["reaction"])) for x in reactions_list]
+
+
+class FacebookReader(MetaExportReader):
+    """
+    Reads Facebook Messenger conversations, from both the inbox and archived threads
+    """
+
+    source_name = 'Facebook'
+
+    inbox_paths = [os.path.join("your_facebook_activity", "messages", "inbox"),
+                   os.path.join("your_facebook_activity", "messages", "archived_threads")]
+
+    field_names = {
+        "sender_name": "sender_name",
+        "timestamp_ms": "timestamp",
+        "content": "text",
+        "reactions": "reactions",
+        "type": "major_type",
+        "is_unsent": "is_unsent",
+        "photos": "photos",
+        "share.link": "share_link",
+        "sticker.uri": "sticker_path",
+        "call_duration": "call_duration",
+        "videos": "videos",
+        "share.share_text": "share_text",
+        "files": "files",
+        "missed": "missed_call",
+        "audio_files": "audio_files",
+        "gifs": "gifs"
+    }
+
+    count_cols = ["photos", "videos", "audio_files", "files"]
+
+
+class InstagramReader(MetaExportReader):
+    """
+    Reads Instagram direct messages, which have a smaller set of fields than Facebook's (e.g. no message types)
+    """
+
+    source_name = 'Instagram'
+
+    inbox_paths = [os.path.join("your_instagram_activity", "messages", "inbox")]
+
+    field_names = {
+        "sender_name": "sender_name",
+        "timestamp_ms": "timestamp",
+        "content": "text",
+        "reactions": "reactions",
+        "is_unsent": "is_unsent",
+        "photos": "photos",
+        "videos": "videos",
+        "audio_files": "audio_files",
+        "share.link": "share_link",
+        "share.share_text": "share_text",
+        "call_duration": "call_duration",
+    }
+
+    count_cols = ["photos", "videos", "audio_files"]
+
+
+class WhatsAppReader(SourceReader):
+    """
+    Reads WhatsApp's "Export Chat" text files, either in Android's format: '31/12/2020, 21:15 - Name: Message' or
+    iOS's: '[31/12/2020, 21:15:42] Name: Message' (with 12 or 24 hour times). Messages continue onto the following lines
+    until the next timestamped line. Files are read in large chunks, each split into messages by a single pass of one
+    regular expression, so multi-gigabyte logs are read quickly at a steady memory footprint
+    """
+
+    source_name = 'WhatsApp'
+
+    # Android names files "WhatsApp Chat with Name.txt", iOS exports a folder per chat containing "_chat.txt"
+    chat_file_pattern = re.compile(r"^(WhatsApp Chat (with|-) .+|_chat)\.txt$")
+    title_pattern = re.compile(r"^WhatsApp Chat (with|-) ")
+
+    # The date and time starting each message. Spaces may be narrow no-break spaces
+    date_pattern = re.compile(r"(?P<d1>\d{1,2})[/.\-](?P<d2>\d{1,2})[/.\-](?P<year>\d{2,4}),?")
+    time_pattern = re.compile(r"(?P<hour>\d{1,2})[:.](?P<minute>\d{2})(?:[:.](?P<second>\d{2}))?"
+                              r"(?:[^\S\n](?P<ampm>[AaPp]\.?[^\S\n]?[Mm]\.?))?")
+
+    # Messages are split on a line break followed by a timestamp (which iOS may mark with a left-to-right mark),
+    # capturing only its date and time. Starting with a literal line break lets the regex engine skip from line to line
+    header_pattern = re.compile(r"\n\u200e?\[?(" + re.sub(r"\(\?P<\w+>", "(?:", date_pattern.pattern) + r")[^\S\n]("
+                                + re.sub(r"\(\?P<\w+>", "(?:", time_pattern.pattern) + r")\]?(?:[^\S\n]-)?[^\S\n]")
+
+    # Texts WhatsApp writes in place of media (depending on whether media was included in the export), deleted
+    # messages and missed calls. The first matching column is used, so generic attachments are last
+    special_pattern = re.compile(
+        r"(?P<photos>image omitted|<attached: .*-PHOTO-.*>|IMG-\d{8}-WA\d+\.\w+ \(file attached\))"
+        r"|(?P<videos>video omitted|<attached: .*-VIDEO-.*>|VID-\d{8}-WA\d+\.\w+ \(file attached\))"
+        r"|(?P<audio_files>audio omitted|<attached: .*-AUDIO-.*>|(?:PTT|AUD)-\d{8}-WA\d+\.\w+ \(file attached\))"
+        r"|(?P<sticker_path>sticker omitted|<attached: .*-STICKER-.*>|STK-\d{8}-WA\d+\.\w+ \(file attached\))"
+        r"|(?P<gifs>GIF omitted|<attached: .*-GIF-.*>)"
+        r"|(?P<files>document omitted|<Media omitted>|<attached: .*>|.+ \(file attached\))"
+        r"|(?P<is_unsent>(?:This message was deleted|You deleted this message)\.?$)"
+        r"|(?P<missed_call>Missed (?:group )?(?:voice|video) call)")
+    count_cols = ['photos', 'videos', 'audio_files', 'files']
+    link_pattern = re.compile(r"https?://\S+")
+
+    # Direction and isolation marks that WhatsApp wraps around names, phone numbers and system messages
+    format_chars = "\u200e\u200f\u202a\u202c"
+
+    def __init__(self, day_first: bool = None, chunk_chars: int = 32 * 2 ** 20):
+        """
+        :param day_first: Whether dates are day/month or month/day, defaults to inferring it from each file
+        :param chunk_chars: Approximate number of characters parsed at once
+        """
+
+        self.day_first = day_first
+        self.chunk_chars = chunk_chars
+
+    def find_convo_paths(self, export_path: str) -> List[str]:
+        if os.path.isfile(export_path):
+            return [export_path]
+
+        return sorted(os.path.join(dir_path, x) for dir_path, _, file_names in os.walk(export_path)
+                      for x in file_names if self.chat_file_pattern.match(x))
+
+    def read_convo_info(self, convo_path: str) -> Tuple[str, Union[bool, None]]:
+        file_name = os.path.splitext(os.path.basename(convo_path))[0]
+
+        # iOS chats are named after the folder they were exported to
+        if file_name == '_chat':
+            file_name = os.path.basename(os.path.dirname(os.path.abspath(convo_path)))
+
+        return self.title_pattern.sub('', file_name), None
+
+    def convo_key(self, export_path: str, convo_path: str) -> str:
+        # Every iOS chat file is named '_chat.txt', so a single one is keyed on its folder too, as in folder exports
+        if os.path.isfile(export_path) and os.path.basename(convo_path) == '_chat.txt':
+            folder_name = os.path.basename(os.path.dirname(os.path.abspath(convo_path)))
+            return f"{self.source_name}:{os.path.join(folder_name, '_chat.txt')}"
+
+        return super().convo_key(export_path, convo_path)
+
+    def infer_day_first(self, convo_path: str, sample_chars: int = 2 ** 20) -> bool:
+        """
+        :return: Whether the file's dates are day/month, based on which part exceeds 12 near the start of the file
+            (day/month is assumed when neither does)
+        """
+
+        with open(convo_path, encoding='utf-8', errors='replace') as file_obj:
+            sample = file_obj.read(sample_chars)
+
+        dates = [x[0] for x in self.header_pattern.findall('\n' + sample)]
+        date_parts = pd.DataFrame(self.date_pattern.findall('\n'.join(dates)), columns=['d1', 'd2', 'year'],
+                                  dtype=object).astype(np.int64)
+
+        return not ((date_parts['d2'] > 12).any() and not (date_parts['d1'] > 12).any())
+
+    def read_batches(self, convo_path: str, since_ms: int = None) -> Iterator[pd.DataFrame]:
+        day_first = self.day_first if self.day_first is not None else self.infer_day_first(convo_path)
+        since = pd.Timestamp(since_ms, unit='ms', tz='UTC') if since_ms is not None else None
+
+        # The last message of each chunk may continue into the next chunk, so it is carried over
+        carried_text = ''
+
+        with open(convo_path, encoding='utf-8', errors='replace') as file_obj:
+            while True:
+                # Chunks end on a line break, so timestamps are never split
+                new_text = file_obj.read(self.chunk_chars)
+                new_text += file_obj.readline() if new_text else ''
+                text = carried_text + new_text
+
+                if not text:
+                    break
+
+                carried_text = ''
+                if new_text:
+                    split_idx = self.find_last_header(text)
+                    text, carried_text = text[:split_idx], text[split_idx:]
+
+                batch_df = self.parse_text(text, day_first)
+
+                if since is not None:
+                    batch_df = batch_df[batch_df['timestamp'] >= since]
+                if batch_df.shape[0] > 0:
+                    yield batch_df
+
+                if not new_text:
+                    break
+
+    def find_last_header(self, text: str) -> int:
+        """
+        :return: The position of the last line starting a message, or 0 if there isn't one after the first line
+        """
+
+        line_break = len(text)
+        while True:
+            line_break = text.rfind('\n', 0, line_break)
+            if line_break < 0:
+                return 0
+            if self.header_pattern.match(text, line_break):
+                return line_break + 1
+
+    def parse_dates(self, dates: np.ndarray, day_first: bool) -> pd.DatetimeIndex:
+        """
+        :param dates: Dates as written in the file, e.g. '31/12/2020,'
+        :return: The dates (NaT where invalid)
+        """
+
+        parts_df = pd.DataFrame(self.date_pattern.findall('\n'.join(dates)), columns=['d1', 'd2', 'year'],
+                                dtype=object).astype(np.int64)
+
+        return pd.DatetimeIndex(pd.to_datetime(pd.DataFrame({
+            'year': parts_df['year'].where(parts_df['year'] >= 100, parts_df['year'] + 2000),
+            'month': parts_df['d2'] if day_first else parts_df['d1'],
+            'day': parts_df['d1'] if day_first else parts_df['d2'],
+        }), errors='coerce'))
+
+    def parse_times(self, times: np.ndarray) -> pd.TimedeltaIndex:
+        """
+        :param times: Times of day as written in the file, e.g. '9:15:42 PM'
+        :return: The time since midnight (NaT where invalid)
+        """
+
+        # Missing parts (seconds and AM/PM) are empty
+        parts_df = pd.DataFrame(self.time_pattern.findall('\n'.join(times)),
+                                columns=['hour', 'minute', 'second', 'ampm'], dtype=object)
+
+        ampm = parts_df.pop('ampm')
+        parts_df['second'] = parts_df['second'].where(parts_df['second'] != '', '0')
+        parts_df = parts_df.astype(np.int64)
+
+        # 12 hour times are converted to 24 hour times
+        is_pm = ampm.str[:1].str.lower().eq('p').values
+        hours = np.where(ampm != '', parts_df['hour'] % 12 + 12 * is_pm, parts_df['hour'])
+        seconds = hours * 3600 + parts_df['minute'] * 60 + parts_df['second']
+
+        is_valid = (hours < 24) & (parts_df['minute'] < 60) & (parts_df['second'] < 60)
+
+        return pd.TimedeltaIndex(pd.to_timedelta(seconds.where(is_valid), unit='s'))
+
+    def parse_text(self, text: str, day_first: bool) -> pd.DataFrame:
+        """
+        :param text: Whole messages (any text before the first timestamped line is ignored)
+        :return: The messages, with the columns: ['timestamp', 'sender_name', 'text'] and those of special_pattern
+        """
+
+        # Splitting on the timestamps returns the text before the first message, then each date, time and message
+        parts = self.header_pattern.split('\n' + text)
+        if len(parts) < 4:
+            return pd.DataFrame()
+
+        # Chats have many messages each day, and at most a day's worth of distinct times, so each distinct date and
+        # time is only parsed once
+        date_codes, unique_dates = pd.factorize(np.array(parts[1::3], dtype=object))
+        time_codes, unique_times = pd.factorize(np.array(parts[2::3], dtype=object))
+        timestamps = (self.parse_dates(unique_dates, day_first).take(date_codes) +
+                      self.parse_times(unique_times).take(time_codes))
+
+        # Messages are 'Sender: Text', where the text may continue over several lines. System messages have no sender
+        sender_parts = [x.rstrip('\r\n').partition(': ') for x in parts[3::3]]
+        senders = [x[0].strip(self.format_chars + '~\u202f ') if x[1] and '\n' not in x[0] else None
+                   for x in sender_parts]
+        texts = [x[2] for x in sender_parts]
+
+        # Times are written in the phone's local time, assumed to be the same as this computer's
+        batch_df = pd.DataFrame({
+            'timestamp': timestamps.tz_localize(time.strftime("%z")),
+            'sender_name': senders,
+            'text': [x.lstrip('\u200e') for x in texts],
+        })
+
+        special_kinds = pd.Series([x.lastgroup if x else None for x in map(self.special_pattern.match,
+                                                                            batch_df['text'])], dtype=object)
+        for col in self.special_pattern.groupindex:
+            is_kind = (special_kinds == col).values
+            if col in self.count_cols:
+                batch_df[col] = is_kind.astype(np.int64)
+            elif col in ('is_unsent', 'missed_call'):
+                batch_df[col] = is_kind
+            else:
+                batch_df[col] = batch_df['text'].where(is_kind)
+
+        batch_df['share_link'] = [(match[0] if (match := self.link_pattern.search(x)) else None) if '://' in x else None
+                                  for x in batch_df['text']]
+
+        is_special = special_kinds.notna().values
+        batch_df['text'] = batch_df['text'].mask(is_special)
+
+        # System messages (encryption notices, people joining, etc.) have no sender, or are marked (on iOS) as the
+        # chat's own messages starting with a left-to-right mark
+        is_system = batch_df['sender_name'].isna().values | (np.array([x.startswith('\u200e') for x in texts]) &
+                                                              ~is_special)
+
+        return batch_df[~is_system & batch_df['timestamp'].notna().values]
+
+
+# Facebook and Instagram are read from their own export paths, as their conversations are linked after being read
+facebook_reader = FacebookReader()
+instagram_reader = InstagramReader()
+
+# Readers for sources other than Facebook and Instagram, {Source Name: Reader}
+readers: Dict[str, SourceReader] = {}
+
+
+def register_reader(reader: SourceReader):
+    """
+    Makes a reader available to ConvoReader, by its source name
+    """
+
+    readers[reader.source_name] = reader
+
+
+register_reader(WhatsAppReader())
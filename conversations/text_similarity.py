@@ -0,0 +1,136 @@
+from typing import *
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from sklearn.cluster import KMeans
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+
+# Words (and pairs of words) are hashed straight into a fixed number of columns, so no vocabulary has to be built or
+# kept in memory, and vectors from different conversations and ingests always line up
+n_features = 2 ** 20
+vectorizer = HashingVectorizer(n_features=n_features, ngram_range=(1, 2), alternate_sign=False, norm=None,
+                               strip_accents='unicode', dtype=np.float32)
+
+# Messages are vectorised in chunks, to bound the size of the intermediate message x feature matrix
+chunk_size = 50_000
+
+
+def text_mask(msgs_df: pd.DataFrame) -> np.ndarray:
+    # Missing text is read as the string 'nan' (e.g. photos and calls)
+    return ((msgs_df['text_len'] > 0) & (msgs_df['text'] != 'nan')).values
+
+
+def build_count_matrix(texts: np.ndarray, row_codes: np.ndarray, n_rows: int) -> scipy.sparse.csr_matrix:
+    """
+    Sums the hashed term counts of each message into the row its code refers to, in a single pass over the messages
+    :param texts: The text of each message
+    :param row_codes: The row (e.g. sender) each message is summed into
+    :param n_rows: The number of rows in the output
+    :return: A sparse matrix of term counts, with a row per code and n_features columns
+    """
+
+    count_matrix = scipy.sparse.csr_matrix((n_rows, n_features), dtype=np.float32)
+
+    for start in range(0, texts.shape[0], chunk_size):
+        msg_matrix = vectorizer.transform(texts[start:start + chunk_size])
+        chunk_codes = row_codes[start:start + chunk_size]
+
+        # Multiplying by a sparse indicator matrix sums each message's row into its code's row
+        indicator = scipy.sparse.csr_matrix((np.ones(chunk_codes.shape[0], dtype=np.float32),
+                                             (chunk_codes, np.arange(chunk_codes.shape[0]))),
+                                            shape=(n_rows, chunk_codes.shape[0]))
+        count_matrix = count_matrix + indicator @ msg_matrix
+
+    return count_matrix
+
+
+def build_sender_counts(msgs_df: pd.DataFrame) -> Tuple[scipy.sparse.csr_matrix, pd.Index]:
+    """
+    :param msgs_df: A dataframe of cleaned messages, with derived columns
+    :return: A sparse matrix of term counts with a row per sender, and the senders labelling each row
+    """
+
+    text_df = msgs_df.loc[text_mask(msgs_df), ['sender_name', 'text']]
+    sender_codes, senders = pd.factorize(text_df['sender_name'], sort=True)
+
+    return build_count_matrix(text_df['text'].values, sender_codes, len(senders)), senders
+
+
+def add_sender_counts(counts: scipy.sparse.csr_matrix, senders: pd.Index, new_counts: scipy.sparse.csr_matrix,
+                      new_senders: pd.Index) -> Tuple[scipy.sparse.csr_matrix, pd.Index]:
+    """
+    Adds the term counts of newer messages onto existing counts, adding rows for any new senders
+    :return: The combined counts and the senders labelling each row
+    """
+
+    combined_senders = senders.append(new_senders.difference(senders))
+
+    # Pad the existing counts with empty rows for new senders, then add the newer counts into their senders' rows
+    padded_counts = scipy.sparse.vstack([counts, scipy.sparse.csr_matrix((len(combined_senders) - len(senders),
+                                                                          n_features), dtype=np.float32)])
+    new_rows = combined_senders.get_indexer(new_senders)
+    mapping = scipy.sparse.csr_matrix((np.ones(len(new_senders), dtype=np.float32),
+                                       (new_rows, np.arange(len(new_senders)))),
+                                      shape=(len(combined_senders), len(new_senders)))
+
+    return (padded_counts + mapping @ new_counts).tocsr(), combined_senders
+
+
+def weight_vectors(count_matrix: scipy.sparse.csr_matrix) -> scipy.sparse.csr_matrix:
+    """
+    Down-weights terms used everywhere (tf-idf with log scaled counts) and scales each row to unit length, so the dot
+    product of two rows is their cosine similarity
+    """
+
+    return TfidfTransformer(sublinear_tf=True).fit_transform(count_matrix).tocsr()
+
+
+def top_k_similar(vectors: scipy.sparse.csr_matrix, k: int = 5,
+                  block_size: int = 1000) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds each row's most similar other rows, with sparse cosine similarity computed a block of rows at a time so the
+    full similarity matrix never has to be held in memory
+    :param vectors: Unit length rows (see weight_vectors)
+    :param k: The number of neighbours per row
+    :return: Arrays of each row's neighbours' indices and similarities, both shaped (rows, k), most similar first
+    """
+
+    n_rows = vectors.shape[0]
+
+    # Each row can only have as many neighbours as there are other rows (none, without any rows)
+    k = max(min(k, n_rows - 1), 0)
+
+    neighbours = np.zeros((n_rows, k), dtype=np.int64)
+    similarities = np.zeros((n_rows, k), dtype=np.float32)
+
+    if k < 1:
+        return neighbours, similarities
+
+    vectors_t = vectors.T.tocsc()
+    for start in range(0, n_rows, block_size):
+        block_sims = (vectors[start:start + block_size] @ vectors_t).toarray()
+
+        # Exclude each row's similarity with itself
+        block_rows = np.arange(block_sims.shape[0])
+        block_sims[block_rows, block_rows + start] = -1
+
+        top_idx = np.argpartition(-block_sims, k - 1, axis=1)[:, :k]
+        top_sims = np.take_along_axis(block_sims, top_idx, axis=1)
+        order = np.argsort(-top_sims, axis=1)
+
+        neighbours[start:start + block_size] = np.take_along_axis(top_idx, order, axis=1)
+        similarities[start:start + block_size] = np.take_along_axis(top_sims, order, axis=1)
+
+    return neighbours, similarities
+
+
+def cluster_vectors(vectors: scipy.sparse.csr_matrix, n_clusters: int, random_state: int = 0) -> np.ndarray:
+    """
+    Clusters unit length rows with k-means, on which euclidean distance ranks pairs the same way as cosine similarity
+    :return: The cluster label of each row
+    """
+
+    n_clusters = min(n_clusters, vectors.shape[0])
+
+    return KMeans(n_clusters=n_clusters, n_init=10, random_state=random_state).fit_predict(vectors)
@@ -5,9 +5,14 @@ from typing import *
 
 import numpy as np
 import pandas as pd
+import scipy.sparse
 import scipy.stats
 
+from conversations import activity_shifts, hourly_profiles, leaderboard, near_duplicates, reactions, response_times, \
+    sampling, sessions, shares, social_graph, text_similarity
 from conversations.convo import Convo
+from conversations.msg_store import MsgStore
+from conversations.sketches import OverviewSketches
 
 
 class User:
@@ -21,16 +26,50 @@ class User:
         self.ig_path = ig_path
         self.has_ig = ig_path is not None
 
+        # Export paths of other sources (e.g. WhatsApp), by source name
+        self.source_paths: Dict[str, str] = dict()
+
         self.convos: Dict[str, Convo] = dict()
 
         self.ig_2_fb_names: Dict[str, str] = dict()
 
+        # Maps each export folder name (or other source's conversation key) to the conversation it was ingested into, to
+        # support delta ingestion
+        self.source_dirs: Dict[str, str] = dict()
+
+        # Conversations which failed to be read, structured: {Conversation Path: Error}
+        self.quarantined_convos: Dict[str, str] = dict()
+
         self.unknown_people = 0
         self.unknown_convos = 0
 
         self.joined_sma_df: pd.DataFrame
 
         self._affect_df = None
+        self._affect_params = dict()
+
+        self._reply_df = None
+        self._reply_max_latency = None
+
+        self._reactions_df = None
+
+        # Every shared link sorted by domain, with the position each domain's rows start at (see shares)
+        self._shares_df = None
+        self._domain_offsets = None
+
+        # Rankings are served from these summaries, structured: (Source Data, Summary)
+        self._leaderboard = (None, None)
+        self._affect_rankings: Dict[Tuple[bool, bool], Tuple[pd.DataFrame, pd.DataFrame]] = dict()
+
+        # Set on previews (see User.preview), the weight of each sampled conversation: {Conversation Name: Weight}
+        self.sample_weights: Union[pd.Series, None] = None
+        self._previews: Dict[Tuple[float, float, int], Tuple[Dict[str, Convo], 'User']] = dict()
+
+        # Approximate summaries of every ingested message, also saved separately for instant overviews
+        self.sketches = OverviewSketches()
+
+        # On-disk columnar copy of the messages, attached when the cache is built or loaded
+        self.msg_store: Union[MsgStore, None] = None
 
     def get_convos_ranked_by_msg_count(self, n: int = 100, no_groupchats: bool = False) -> List[Tuple[str, int]]:
 
@@ -43,17 +82,155 @@ class User:
         :return: A list of tuples, structured: ('Name', Msg_Count)
         """
 
+        convo_totals_df = self.get_convo_leaderboard_df()
+
         if no_groupchats:
-            counts = [(x.convo_name, x.msg_count) for x in self.convos.values() if x.is_group is False]
-        else:
-            counts = [(x.convo_name, x.msg_count) for x in self.convos.values()]
+            convo_totals_df = convo_totals_df[~convo_totals_df['is_group']]
 
-        counts = sorted(counts, key=lambda x: x[1], reverse=True)
+        counts = zip(convo_totals_df.index, convo_totals_df['msgs'].tolist())
 
-        if n > 1:
-            counts = counts[:n]
+        return leaderboard.top_k(counts, n)
+
+    def get_leaderboard_df(self) -> pd.DataFrame:
+
+        """
+        Combines the per sender totals maintained on each conversation, without rescanning any messages
+        :return: A dataframe indexed by (conversation, sender), with the columns of leaderboard.summary_cols
+        """
+
+        return pd.concat({name: convo.summary_df for name, convo in self.convos.items()},
+                         names=['convo', 'sender_name'])
+
+    def get_convo_leaderboard_df(self) -> pd.DataFrame:
+
+        """
+        Summarises every conversation in one table which all the conversation rankings are served from. It is only
+        rebuilt when the conversations change (they are replaced as they load in the background, or refreshed after
+        newer messages are ingested)
+        :return: A dataframe indexed by conversation name, with the totals of leaderboard.summary_cols and:
+            ['user_msgs', 'user_chars', 'speaker_count', 'has_user', 'is_group', 'engagement', 'sessions',
+            'user_sessions']
+        """
+
+        source, convo_totals_df = self._leaderboard
+        if source is self.convos:
+            return convo_totals_df
+
+        convos = list(self.convos.values())
+        names = pd.Index([x.convo_name for x in convos], name='convo')
+
+        convo_totals_df = pd.DataFrame(0.0, index=names, columns=leaderboard.summary_cols)
+        user_totals_df = convo_totals_df.copy()
+
+        if len(convos) > 0:
+            senders_df = self.get_leaderboard_df()
+            convo_totals_df = senders_df.groupby(level='convo', sort=False).sum().reindex(names)
+
+            user_rows_df = senders_df[senders_df.index.get_level_values('sender_name') == self.name]
+            user_totals_df = user_rows_df.droplevel('sender_name').reindex(names).fillna(0)
+
+        convo_totals_df['msgs'] = [x.msg_count for x in convos]
+        convo_totals_df['user_msgs'] = user_totals_df['msgs'].values
+        convo_totals_df['user_chars'] = user_totals_df['chars'].values
+        convo_totals_df['speaker_count'] = [len(x.speakers) for x in convos]
+        convo_totals_df['has_user'] = [self.name in x.speakers for x in convos]
+        convo_totals_df['is_group'] = [bool(x.is_group) for x in convos]
+        convo_totals_df['engagement'] = [float(x.engagement_df.values.sum()) for x in convos]
+        convo_totals_df['sessions'] = [x.sessions_df.shape[0] for x in convos]
+        convo_totals_df['user_sessions'] = [int((x.sessions_df['initiator'] == self.name).sum()) for x in convos]
+
+        self._leaderboard = (self.convos, convo_totals_df)
+
+        return convo_totals_df
+
+    def get_hour_profiles(self, by_sender: bool = False, no_groupchats: bool = False,
+                          min_msgs: int = 100) -> pd.DataFrame:
+
+        """
+        Counts every conversation's messages per hour of the day, in one pass over all messages
+        :param by_sender: Count each sender in each conversation separately
+        :param no_groupchats: Only include one-to-one conversations
+        :param min_msgs: Conversations with fewer messages are excluded
+        :return: A dataframe with a column per hour, indexed by conversation (or conversation and sender)
+        """
+
+        convos = [x for x in self.convos.values() if x.msg_count >= min_msgs and not (no_groupchats and x.is_group)]
+
+        hours = np.concatenate([x.msgs_df['hour_of_day'].values for x in convos]) if convos else np.array([], int)
+        convo_codes = np.repeat(np.arange(len(convos)), [x.msg_count for x in convos])
+        convo_names = pd.Index([x.convo_name for x in convos], name='convo')
+
+        if by_sender:
+            senders = np.concatenate([x.msgs_df['sender_name'].values for x in convos]) if convos else np.array([])
+            pair_codes, pairs = pd.factorize(pd.MultiIndex.from_arrays([convo_names[convo_codes], senders],
+                                                                        names=['convo', 'sender_name']), sort=True)
+            hour_counts = hourly_profiles.build_hour_counts(hours, pair_codes, len(pairs))
+            return pd.DataFrame(hour_counts, index=pairs, columns=hourly_profiles.hour_labels)
+
+        hour_counts = hourly_profiles.build_hour_counts(hours, convo_codes, len(convos))
+
+        return pd.DataFrame(hour_counts, index=convo_names, columns=hourly_profiles.hour_labels)
+
+    def get_convos_clustered_by_hour(self, n_clusters: int = 5, no_groupchats: bool = False,
+                                     min_msgs: int = 100) -> List[Tuple[str, List[str]]]:
 
-        return counts
+        """
+        Groups conversations by when in the day they happen (e.g. late night chats vs work hours chats), by clustering
+        each conversation's share of messages in each hour
+        :param n_clusters: The number of groups to split the conversations into
+        :param no_groupchats: Only include one-to-one conversations
+        :param min_msgs: Conversations with fewer messages are excluded
+        :return: A list of tuples, structured: ('Description of the group's typical hours', ['Conversation Name', ...]),
+            largest group first
+        """
+
+        hour_counts_df = self.get_hour_profiles(no_groupchats=no_groupchats, min_msgs=min_msgs)
+
+        if hour_counts_df.shape[0] == 0:
+            return []
+
+        profiles = hourly_profiles.normalise_profiles(hour_counts_df.values)
+        labels, centroids = hourly_profiles.cluster_profiles(profiles, n_clusters)
+
+        cluster_order = np.argsort(-np.bincount(labels), kind='stable')
+
+        return [(hourly_profiles.describe_profile(centroids[cluster]), hour_counts_df.index[labels == cluster].tolist())
+                for cluster in cluster_order]
+
+    def get_convos_ranked_by_engagement(self, n: int = 100, no_groupchats: bool = False,
+                                        start_date: Union[dt.datetime, None] = None) -> List[Tuple[str, float]]:
+
+        """
+        Ranks conversations by their engagement score (weighted messages, characters, call time, media and reactions),
+        using the period scores maintained on each conversation rather than the raw messages
+
+        :param n: Number of conversations to return. For n < 1, all results will be returned
+        :param no_groupchats: Optional bool, determining whether to include groupchats
+        :param start_date: Optional date, only periods starting on or after it are included
+        :return: A list of tuples, structured: ('Name', Engagement Score)
+        """
+
+        if not start_date:
+            convo_totals_df = self.get_convo_leaderboard_df()
+
+            if no_groupchats:
+                convo_totals_df = convo_totals_df[~convo_totals_df['is_group']]
+
+            return leaderboard.top_k(zip(convo_totals_df.index, convo_totals_df['engagement'].tolist()), n)
+
+        start_date = pd.to_datetime(start_date).tz_localize(time.strftime("%z"))
+
+        scores = []
+        for convo in self.convos.values():
+
+            if no_groupchats and convo.is_group: continue
+
+            engagement_df = convo.engagement_df
+            engagement_df = engagement_df.iloc[engagement_df.index.searchsorted(start_date):]
+
+            scores.append((convo.convo_name, float(engagement_df.values.sum())))
+
+        return leaderboard.top_k(scores, n)
 
     def get_convos_ranked_by_char_ratio(self, desc: bool, n: int = 100, no_groupchats: bool = True,
                                         min_msgs: int = 200) -> List[Tuple[str, int]]:
@@ -75,42 +252,101 @@ class User:
         :return: A list of tuples, structured: ('Name', Char Ratio)
         """
 
-        ratios_list: List[Tuple[str, int]] = []
+        convo_totals_df = self.get_convo_leaderboard_df()
 
-        for convo in self.convos.values():
+        is_included = (convo_totals_df['has_user'] &
+                       (convo_totals_df['msgs'] > min_msgs * convo_totals_df['speaker_count']))
+        if no_groupchats:
+            is_included &= ~convo_totals_df['is_group']
+        convo_totals_df = convo_totals_df[is_included]
 
-            if no_groupchats and convo.is_group: continue
+        others_char_count = convo_totals_df['chars'] - convo_totals_df['user_chars']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = others_char_count / (convo_totals_df['user_chars'] * (convo_totals_df['speaker_count'] - 1))
+
+        return leaderboard.top_k(zip(ratios.index, ratios.tolist()), n, desc)
+
+    def get_sessions_df(self, no_groupchats: bool = False) -> pd.DataFrame:
+
+        """
+        Combines the sessions materialised for each conversation, without rescanning any messages
+        :param no_groupchats: Optional bool, determining whether to include groupchats
+        :return: A dataframe with one row per session and an additional 'convo' column
+        """
 
-            others_speaker_count = len(convo.speakers) - 1
+        sessions_dfs = [x.sessions_df.assign(convo=x.convo_name) for x in self.convos.values()
+                        if not (no_groupchats and x.is_group)]
 
-            if self.name in convo.speakers and convo.msg_count > (min_msgs * len(convo.speakers)):
-                user_chars = convo.msgs_df[convo.msgs_df["sender_name"] == self.name]["text_len"].sum()
-                others_char_count = convo.msgs_df["text_len"].sum() - user_chars
+        # Users without any included conversations have an empty table, rather than failing
+        if not sessions_dfs:
+            return pd.DataFrame(columns=sessions.session_cols + ['convo'])
 
-                ratio = others_char_count / (user_chars * others_speaker_count)
-                ratios_list.append((convo.convo_name, ratio))
+        return pd.concat(sessions_dfs, ignore_index=True)
 
-        ratios_list = sorted(ratios_list, key=lambda x: x[1], reverse=desc)
+    def get_convos_ranked_by_initiation(self, desc: bool = True, n: int = 100, no_groupchats: bool = True,
+                                        min_sessions: int = 20) -> List[Tuple[str, float, int]]:
 
-        if n > 1:
-            ratios_list = ratios_list[:n]
+        """
+        Calculates the proportion of sessions (bursts of messages) in each conversation that you started
 
-        return ratios_list
+        :param desc: A boolean, determining whether the results should be sorted in a descending manner
+        :param n: Number of conversations to return. For n < 1, all results will be returned
+        :param no_groupchats: Optional bool, determining whether to include groupchats
+        :param min_sessions: The minimum number of sessions, for the conversation to be included
+        :return: A list of tuples, structured: ('Name', Proportion Started By You, Session Count)
+        """
+
+        convo_totals_df = self.get_convo_leaderboard_df()
+
+        is_included = convo_totals_df['sessions'] >= max(min_sessions, 1)
+        if no_groupchats:
+            is_included &= ~convo_totals_df['is_group']
+        convo_totals_df = convo_totals_df[is_included]
+
+        user_started = convo_totals_df['user_sessions'] / convo_totals_df['sessions']
+
+        return leaderboard.top_k(zip(convo_totals_df.index, user_started.tolist(),
+                                     convo_totals_df['sessions'].tolist()), n, desc)
 
     def get_or_create_affect_df(self, force_refresh: bool = False, agg_period: str = '7D', min_period_char: int = 500,
                                 min_periods: int = 5, exclude_txt: bool = True):
 
         if force_refresh or self._affect_df is None:
-            self._affect_df = self._create_convo_affect_df(agg_period=agg_period, min_period_char=min_period_char,
-                                                           min_periods=min_periods, exclude_txt=exclude_txt)
+            self._affect_params = {'agg_period': agg_period, 'min_period_char': min_period_char,
+                                   'min_periods': min_periods, 'exclude_txt': exclude_txt}
+            self._affect_df = self._create_convo_affect_df(**self._affect_params)
 
         return self._affect_df
 
+    def refresh_aggregates(self, changed_convos: List[str]):
+
+        """
+        Incrementally updates derived data after messages have been appended to some conversations (e.g. by delta
+        ingestion), only recomputing the results for the conversations which changed
+        :param changed_convos: Names of the conversations which were created or had messages appended
+        """
+
+        if len(changed_convos) == 0:
+            return
+
+        # Reply times are cheap to rebuild in a single pass, so they are lazily regenerated on next use
+        self._reply_df = None
+        self._reactions_df = None
+        self._shares_df = None
+        self._leaderboard = (None, None)
+
+        # Sentiment periods are calculated independently per conversation, so only the changed ones need to be rebuilt
+        if self._affect_df is not None:
+            unchanged_df = self._affect_df[~self._affect_df['receiver_name'].isin(changed_convos)]
+            changed_df = self._create_convo_affect_df(**self._affect_params, convo_names=changed_convos)
+            self._affect_df = pd.concat([unchanged_df, changed_df]) if changed_df is not None else unchanged_df
+
     def _create_convo_affect_df(self, agg_period: str = '7D', min_period_char: int = 500, min_periods: int = 5,
-                                exclude_txt: bool = True):
+                                exclude_txt: bool = True, convo_names: List[str] = None):
 
         affect_df_list = []
-        filtered_convos = {name: convo for name, convo in self.convos.items() if self.name in convo.speakers}
+        filtered_convos = {name: convo for name, convo in self.convos.items() if self.name in convo.speakers and
+                           (convo_names is None or name in convo_names)}
 
         logging.info("Generating affect data:")
         excluded_convos = 0
@@ -140,6 +376,9 @@ class User:
 
         logging.info(f"{excluded_convos} conversations were excluded from sentiment analysis")
 
+        if len(affect_df_list) == 0:
+            return None
+
         return pd.concat(affect_df_list)
 
     def get_convos_ranked_by_affect(self, filter_user: bool = True, no_groupchat: bool = True) -> pd.DataFrame:
@@ -147,6 +386,11 @@ class User:
         if self._affect_df is None: raise ValueError(
             "First need to generate affect data using User.get_or_create_affect_df()")
 
+        # The KS tests are only rerun once the affect data has changed
+        source, results_df = self._affect_rankings.get((filter_user, no_groupchat), (None, None))
+        if source is self._affect_df:
+            return results_df
+
         if filter_user:
             user_affect_df = self._affect_df[self._affect_df['sender_name'] == self.name]
         else:
@@ -177,29 +421,656 @@ class User:
         cols = [f"{field}_{var}" for field in fields for var in ('weighted_avg', 'ks_p_val', 'ks_stat', 'ks_sign')]
 
         results_df = pd.DataFrame(results_list, columns=['name'] + cols)
+        self._affect_rankings[(filter_user, no_groupchat)] = (self._affect_df, results_df)
 
         return results_df
 
+    def get_or_create_reply_df(self, force_refresh: bool = False,
+                               max_latency: pd.Timedelta = pd.Timedelta(hours=12)) -> pd.DataFrame:
+
+        """
+        Builds the reply latencies for every conversation in one vectorised pass over all messages
+        :param max_latency: Gaps longer than this are treated as restarting the conversation rather than replies
+        :return: A dataframe with one row per reply: ['msg_idx', 'convo', 'sender', 'replied_to', 'latency_s'], where
+            the conversation and sender columns are categorical
+        """
+
+        if force_refresh or self._reply_df is None or self._reply_max_latency != max_latency:
+            convos = list(self.convos.values())
+
+            # Users without any conversations (e.g. an empty preview) have empty results, rather than failing
+            timestamps_ns = np.concatenate([x.msgs_df.index.asi8 for x in convos] or [np.array([], dtype=np.int64)])
+            sender_codes, senders = pd.factorize(np.concatenate([x.msgs_df['sender_name'].values for x in convos] or
+                                                                [np.array([], dtype=object)]))
+            convo_codes = np.repeat(np.arange(len(convos)), [x.msgs_df.shape[0] for x in convos])
+
+            reply_df = response_times.build_reply_df(timestamps_ns, sender_codes, convo_codes, max_latency)
+
+            reply_df['convo'] = pd.Categorical.from_codes(reply_df['convo'], [x.convo_name for x in convos])
+            for col in ('sender', 'replied_to'):
+                reply_df[col] = pd.Categorical.from_codes(reply_df[col], senders)
+
+            self._reply_df = reply_df
+            self._reply_max_latency = max_latency
+
+        return self._reply_df
+
+    def get_reply_times_by_sender(self, min_replies: int = 20) -> pd.DataFrame:
+
+        """
+        :param min_replies: The minimum number of replies for a sender to be included
+        :return: A dataframe of each sender's reply count and median, mean and 90th percentile latencies (seconds),
+            sorted from fastest to slowest median
+        """
+
+        summary_df = response_times.summarise_replies(self.get_or_create_reply_df(), ['sender'])
+        summary_df = summary_df[summary_df['replies'] >= min_replies]
+
+        return summary_df.sort_values('median_s').reset_index(drop=True)
+
+    def get_convos_ranked_by_reply_time(self, n: int = 100, min_replies: int = 20) -> List[Tuple[str, float, float]]:
+
+        """
+        Compares how quickly you and the other person reply to each other in one-to-one conversations, sorted by the
+        other person's median reply time (fastest first)
+
+        :param n: Number of conversations to return. For n < 1, all results will be returned
+        :param min_replies: The minimum number of replies from each speaker, for the conversation to be included
+        :return: A list of tuples, structured: ('Name', Your Median Reply Time (s), Their Median Reply Time (s))
+        """
+
+        summary_df = response_times.summarise_replies(self.get_or_create_reply_df(), ['convo', 'sender'])
+        summary_df = summary_df[summary_df['replies'] >= min_replies]
+
+        one_to_one = [x.convo_name for x in self.convos.values() if not x.is_group and self.name in x.speakers]
+        summary_df = summary_df[summary_df['convo'].isin(one_to_one)]
+
+        is_user = summary_df['sender'] == self.name
+        user_medians = summary_df[is_user].set_index('convo')['median_s']
+        other_medians = summary_df[~is_user].set_index('convo')['median_s']
+
+        joined_df = pd.concat([user_medians.rename('user'), other_medians.rename('other')], axis=1, join='inner')
+        joined_df = joined_df.sort_values('other')
+
+        results = list(zip(joined_df.index.astype(str), joined_df['user'], joined_df['other']))
+
+        if n > 1:
+            results = results[:n]
+
+        return results
+
+    def get_or_create_reactions_df(self, force_refresh: bool = False) -> pd.DataFrame:
+
+        """
+        Combines every conversation's reactions into one long format table, with people (reactors and message senders)
+        and reactions coded against dictionaries shared across all conversations
+        :return: A dataframe indexed by the reacted to message's timestamp, with one row per reaction:
+            ['convo', 'actor', 'recipient', 'reaction'], where every column is categorical
+        """
+
+        if force_refresh or self._reactions_df is None:
+            convos = list(self.convos.values())
+            msg_offsets = np.concatenate([[0], np.cumsum([x.msgs_df.shape[0] for x in convos])])
+
+            # Users without any conversations have an empty table, rather than failing
+            empty_ints, empty_objects = np.array([], dtype=np.int64), np.array([], dtype=object)
+            timestamps_ns = np.concatenate([x.msgs_df.index.asi8 for x in convos] or [empty_ints])
+            senders = np.concatenate([x.msgs_df['sender_name'].values for x in convos] or [empty_objects])
+
+            msg_idx = np.concatenate([x.reactions_df['msg_idx'].values + offset
+                                      for x, offset in zip(convos, msg_offsets)] or [empty_ints]).astype(np.int64)
+            actors = np.concatenate([x.reactions_df['actor'].values.astype(object) for x in convos] or [empty_objects])
+            emojis = np.concatenate([x.reactions_df['reaction'].values.astype(object) for x in convos] or
+                                    [empty_objects])
+            convo_codes = np.repeat(np.arange(len(convos)), [x.reactions_df.shape[0] for x in convos])
+
+            # Reactors and recipients share one dictionary, so they can index the same axes of a matrix
+            people_codes, people = pd.factorize(np.concatenate([actors, senders[msg_idx]]))
+
+            reactions_df = pd.DataFrame({
+                'convo': pd.Categorical.from_codes(convo_codes, [x.convo_name for x in convos]),
+                'actor': pd.Categorical.from_codes(people_codes[:actors.shape[0]], people),
+                'recipient': pd.Categorical.from_codes(people_codes[actors.shape[0]:], people),
+                'reaction': pd.Categorical(emojis)},
+                index=pd.DatetimeIndex(timestamps_ns[msg_idx], tz='UTC').tz_convert(time.strftime("%z")))
+
+            self._reactions_df = reactions_df.sort_index(kind='stable')
+
+        return self._reactions_df
+
+    def get_reaction_network(self, no_groupchats: bool = False) -> Tuple[scipy.sparse.csr_matrix, pd.Index]:
+
+        """
+        :param no_groupchats: Only count reactions in one-to-one conversations
+        :return: A sparse matrix counting how many times each person (rows) reacted to messages from each person
+            (columns), and the names indexing both axes
+        """
+
+        reactions_df = self.get_or_create_reactions_df()
+
+        if no_groupchats:
+            one_to_one = [x.convo_name for x in self.convos.values() if not x.is_group]
+            reactions_df = reactions_df[reactions_df['convo'].isin(one_to_one)]
+
+        people = reactions_df['actor'].cat.categories
+        matrix = reactions.build_coded_matrix(reactions_df['actor'].cat.codes.values,
+                                              reactions_df['recipient'].cat.codes.values,
+                                              (len(people), len(people)))
+
+        return matrix, people
+
+    def get_top_reaction_pairs(self, n: int = 20, no_groupchats: bool = False,
+                               exclude_self: bool = True) -> List[Tuple[str, str, int]]:
+
+        """
+        :param n: Number of pairs to return. For n < 1, all results will be returned
+        :param no_groupchats: Only count reactions in one-to-one conversations
+        :param exclude_self: Exclude people reacting to their own messages
+        :return: A list of tuples, structured: ('Reactor', 'Recipient', Reaction Count), sorted by count
+        """
+
+        matrix, people = self.get_reaction_network(no_groupchats)
+
+        if exclude_self:
+            matrix = matrix - scipy.sparse.diags(matrix.diagonal(), format='csr')
+            matrix.eliminate_zeros()
+
+        return reactions.top_matrix_entries(matrix, people, people, n)
+
+    def get_reaction_distribution(self, actors: Iterable[str] = None) -> pd.DataFrame:
+
+        """
+        :param actors: Names of the reactors to include, defaults to all
+        :return: A dataframe indexed by reactor, counting how many times they used each reaction (columns), sorted with
+            the most used reactions first
+        """
+
+        reactions_df = self.get_or_create_reactions_df()
+
+        people = reactions_df['actor'].cat.categories
+        emojis = reactions_df['reaction'].cat.categories
+        matrix = reactions.build_coded_matrix(reactions_df['actor'].cat.codes.values,
+                                              reactions_df['reaction'].cat.codes.values,
+                                              (len(people), len(emojis)))
+
+        # Rows follow the order of actors, unknown actors are dropped
+        if actors is not None:
+            actor_idx = people.get_indexer(list(actors))
+            actor_idx = actor_idx[actor_idx >= 0]
+            matrix = matrix[actor_idx]
+            people = people[actor_idx]
+
+        # The distribution only has a column per distinct reaction, so it's small enough to be dense
+        emoji_order = np.argsort(np.asarray(matrix.sum(axis=0)).ravel())[::-1]
+        distribution_df = pd.DataFrame(matrix[:, emoji_order].toarray(), index=people, columns=emojis[emoji_order])
+
+        return distribution_df[distribution_df.sum(axis=1) > 0]
+
+    def get_reaction_rates(self, sample_period: str = '30D', senders: Iterable[str] = None) -> pd.DataFrame:
+
+        """
+        :param sample_period: Fixed period to count reactions and messages in
+        :param senders: Only count messages (and reactions to them) from these senders, defaults to all
+        :return: A dataframe indexed by period start: ['msgs', 'reactions', 'reactions_per_msg']
+        """
+
+        msgs_df = self.query(senders=senders, columns=['sender_name'])
+        reactions_df = self.get_or_create_reactions_df()
+
+        if senders is not None:
+            reactions_df = reactions_df[reactions_df['recipient'].isin(senders)]
+
+        msg_counts = pd.Series(1, index=msgs_df.index).resample(sample_period, origin='epoch').sum()
+        reaction_counts = pd.Series(1, index=reactions_df.index).resample(sample_period, origin='epoch').sum()
+
+        rates_df = pd.concat([msg_counts.rename('msgs'), reaction_counts.rename('reactions')], axis=1).fillna(0)
+        rates_df['reactions_per_msg'] = rates_df['reactions'] / rates_df['msgs'].where(rates_df['msgs'] > 0)
+
+        return rates_df
+
+    def get_or_create_shares_df(self, force_refresh: bool = False) -> pd.DataFrame:
+
+        """
+        Combines every conversation's shared links into one table, indexed by domain: rows are sorted by domain then
+        time, so each domain's shares are a contiguous block which User.get_domain_shares finds without scanning
+        :return: A dataframe indexed by timestamp, with one row per shared link: ['convo', 'sender', 'domain', 'url',
+            'path', 'title'], where the conversation, sender, domain and url columns are categorical
+        """
+
+        if force_refresh or self._shares_df is None:
+            convos = list(self.convos.values())
+            shares_dfs = [x.shares_df for x in convos]
+
+            # Users without any conversations have an empty table, rather than failing
+            timestamps_ns = np.concatenate([x.msgs_df.index.asi8[y['msg_idx'].values]
+                                            for x, y in zip(convos, shares_dfs)] or [np.array([], dtype=np.int64)])
+            senders = np.concatenate([x.msgs_df['sender_name'].values[y['msg_idx'].values]
+                                      for x, y in zip(convos, shares_dfs)] or [np.array([], dtype=object)])
+            convo_codes = np.repeat(np.arange(len(convos)), [x.shape[0] for x in shares_dfs])
+
+            combined_df = shares.concat_shares_dfs(shares_dfs or [shares.build_shares_df(pd.DataFrame())])
+            domain_codes = combined_df['domain'].cat.codes.values
+            order = np.lexsort((timestamps_ns, domain_codes))
+
+            shares_df = pd.DataFrame({
+                'convo': pd.Categorical.from_codes(convo_codes, [x.convo_name for x in convos]),
+                'sender': pd.Categorical(senders),
+                'domain': combined_df['domain'].values,
+                'url': combined_df['url'].values,
+                'path': combined_df['path'].values,
+                'title': combined_df['title'].values},
+                index=pd.DatetimeIndex(timestamps_ns, tz='UTC').tz_convert(time.strftime("%z")))
+
+            self._shares_df = shares_df.iloc[order]
+            self._domain_offsets = shares.build_domain_offsets(domain_codes[order],
+                                                               len(shares_df['domain'].cat.categories))
+
+        return self._shares_df
+
+    def get_domain_shares(self, domain: str) -> pd.DataFrame:
+
+        """
+        :param domain: A domain, without the 'www.' prefix (e.g. 'youtube.com')
+        :return: Every share of a link to the domain, in time order (see User.get_or_create_shares_df)
+        """
+
+        shares_df = self.get_or_create_shares_df()
+        code = shares_df['domain'].cat.categories.get_indexer([domain.lower()])[0]
+
+        if code < 0:
+            return shares_df.iloc[:0]
+
+        return shares_df.iloc[self._domain_offsets[code]:self._domain_offsets[code + 1]]
+
+    def get_top_domains(self, sample_period: Union[str, None] = '30D', n: int = 5, senders: Iterable[str] = None,
+                        no_groupchats: bool = False) -> pd.DataFrame:
+
+        """
+        :param sample_period: Fixed period to count shares in, or None to count across all time
+        :param n: Number of domains per person (and period). For n < 1, all results will be returned
+        :param senders: Only count links shared by these senders, defaults to all
+        :param no_groupchats: Only count links shared in one-to-one conversations
+        :return: A dataframe with a row per domain in each person's top domains: ['sender', 'period', 'domain',
+            'shares', 'rank'], sorted by sender, period and rank ('period' is left out when counting across all time)
+        """
+
+        shares_df = self.get_or_create_shares_df()
+
+        if senders is not None:
+            shares_df = shares_df[shares_df['sender'].isin(senders)]
+        if no_groupchats:
+            one_to_one = [x.convo_name for x in self.convos.values() if not x.is_group]
+            shares_df = shares_df[shares_df['convo'].isin(one_to_one)]
+
+        group_levels = ['sender'] if sample_period is None else \
+            ['sender', pd.Grouper(freq=sample_period, origin='epoch')]
+        counts = shares_df.rename_axis('period').groupby(group_levels + ['domain'], observed=True).size()
+
+        return shares.rank_counts(counts, counts.index.names[:-1], n)
+
+    def get_top_shared_links(self, n: int = 20, min_shares: int = 2, no_groupchats: bool = False) -> pd.DataFrame:
+
+        """
+        Finds the links shared most often, across every conversation. Links are matched by their normalised URL, so the
+        same page shared from different apps (or with different tracking parameters) is counted together
+        :param n: Number of links to return. For n < 1, all results will be returned
+        :param min_shares: The minimum number of times a link must be shared
+        :param no_groupchats: Only count links shared in one-to-one conversations
+        :return: A dataframe with a row per link: ['url', 'domain', 'title', 'shares', 'convos', 'senders',
+            'first_sender', 'first_shared', 'last_shared'], sorted by shares then the number of conversations
+        """
+
+        shares_df = self.get_or_create_shares_df()
+
+        if no_groupchats:
+            one_to_one = [x.convo_name for x in self.convos.values() if not x.is_group]
+            shares_df = shares_df[shares_df['convo'].isin(one_to_one)]
+
+        # A link always has the same domain, so each link's rows are already in time order and the first is the earliest
+        links_df = (shares_df.rename_axis('timestamp')
+                    .reset_index()
+                    .groupby('url', observed=True)
+                    .agg(domain=('domain', 'first'), title=('title', 'first'), shares=('convo', 'size'),
+                         convos=('convo', 'nunique'), senders=('sender', 'nunique'), first_sender=('sender', 'first'),
+                         first_shared=('timestamp', 'first'), last_shared=('timestamp', 'last')))
+
+        links_df = links_df[links_df['shares'] >= min_shares]
+        links_df = links_df.sort_values(['shares', 'convos'], ascending=False, kind='stable').reset_index()
+
+        return links_df.head(n) if n > 0 else links_df
+
+    def get_text_vectors(self, by: str = 'convo', no_groupchats: bool = False,
+                         min_msgs: int = 100) -> Tuple[scipy.sparse.csr_matrix, pd.Index]:
+
+        """
+        Combines the hashed term counts stored on each conversation into tf-idf weighted, unit length vectors
+        :param by: 'convo' for a vector per conversation, or 'sender' for a vector per person across all conversations
+        :param no_groupchats: Only include one-to-one conversations
+        :param min_msgs: Conversations with fewer messages are excluded
+        :return: A sparse matrix with a row per conversation or sender, and the names labelling each row
+        """
+
+        if by not in ('convo', 'sender'):
+            raise ValueError("by must be 'convo' or 'sender'")
+
+        convos = [x for x in self.convos.values() if x.msg_count >= min_msgs and not (no_groupchats and x.is_group)]
+        empty_vectors = scipy.sparse.csr_matrix((0, text_similarity.n_features), dtype=np.float32), pd.Index([])
+
+        if len(convos) == 0:
+            return empty_vectors
+
+        # Each conversation stores a row per sender, which are summed into a row per conversation or per sender
+        counts = scipy.sparse.vstack([x.text_counts for x in convos]).tocsr()
+
+        if by == 'convo':
+            row_codes = np.repeat(np.arange(len(convos)), [x.text_counts.shape[0] for x in convos])
+            labels = pd.Index([x.convo_name for x in convos])
+        else:
+            row_codes, labels = pd.factorize(np.concatenate([x.text_senders.values for x in convos]), sort=True)
+            labels = pd.Index(labels)
+
+        grouping = reactions.build_coded_matrix(row_codes, np.arange(row_codes.shape[0]),
+                                                (len(labels), row_codes.shape[0]))
+        counts = grouping @ counts
+
+        # Drop anything without any text (e.g. people who only sent photos)
+        has_text = counts.getnnz(axis=1) > 0
+        if not has_text.any():
+            return empty_vectors
+
+        return text_similarity.weight_vectors(counts[has_text]), labels[has_text]
+
+    def get_similar_texts(self, k: int = 5, by: str = 'convo', no_groupchats: bool = False) -> pd.DataFrame:
+
+        """
+        Finds the conversations (or senders) which use the most similar words and phrases to each other
+        :param k: The number of most similar conversations (or senders) to find for each one
+        :param by: 'convo' to compare conversations, or 'sender' to compare people across all their conversations
+        :param no_groupchats: Only include one-to-one conversations
+        :return: A dataframe with a row per pair: ['name', 'rank', 'similar_name', 'similarity'] (cosine similarity)
+        """
+
+        vectors, labels = self.get_text_vectors(by, no_groupchats)
+        neighbours, similarities = text_similarity.top_k_similar(vectors, k)
+
+        return pd.DataFrame({'name': np.repeat(labels.values, neighbours.shape[1]),
+                             'rank': np.tile(np.arange(1, neighbours.shape[1] + 1), neighbours.shape[0]),
+                             'similar_name': labels.values[neighbours.ravel()],
+                             'similarity': similarities.ravel()})
+
+    def get_text_clusters(self, n_clusters: int = 10, by: str = 'convo',
+                          no_groupchats: bool = False) -> Dict[int, List[str]]:
+
+        """
+        Groups conversations (or senders) which use similar words and phrases
+        :param n_clusters: The number of groups to split them into
+        :param by: 'convo' to cluster conversations, or 'sender' to cluster people across all their conversations
+        :param no_groupchats: Only include one-to-one conversations
+        :return: A dictionary of each cluster's names, structured: {Cluster Number: ['Name', ...]}, largest first
+        """
+
+        vectors, labels = self.get_text_vectors(by, no_groupchats)
+
+        if vectors.shape[0] == 0:
+            return dict()
+
+        cluster_labels = text_similarity.cluster_vectors(vectors, n_clusters)
+        cluster_order = np.argsort(-np.bincount(cluster_labels), kind='stable')
+
+        return {ii + 1: labels[cluster_labels == cluster].tolist() for ii, cluster in enumerate(cluster_order)}
+
+    def get_near_duplicate_msgs(self, min_similarity: float = 0.8, min_convos: int = 2) -> pd.DataFrame:
+
+        """
+        Finds groups of near-identical messages (e.g. chain messages, copy-pasted text and forwarded links) across all
+        conversations, using the MinHash signatures stored on each conversation
+        :param min_similarity: The minimum estimated share of text (Jaccard similarity of shingles) to be linked
+        :param min_convos: The minimum number of conversations a group must appear in
+        :return: A dataframe with a row per message in each group: ['group', 'convo', 'sender_name', 'text'], indexed by
+            timestamp and sorted by group (largest first) then time
+        """
+
+        result_cols = ['group', 'convo', 'sender_name', 'text']
+        convos = [x for x in self.convos.values() if x.signed_msg_idx.shape[0] > 0]
+
+        if len(convos) == 0:
+            return pd.DataFrame(columns=result_cols)
+
+        signatures = np.concatenate([x.msg_signatures for x in convos])
+        convo_codes = np.repeat(np.arange(len(convos)), [x.signed_msg_idx.shape[0] for x in convos])
+        groups = near_duplicates.find_duplicate_groups(signatures, min_similarity)
+
+        # Only the grouped messages are looked up
+        is_grouped = groups >= 0
+        if not is_grouped.any():
+            return pd.DataFrame(columns=result_cols)
+
+        msg_idx = np.concatenate([x.signed_msg_idx for x in convos])[is_grouped]
+        convo_codes = convo_codes[is_grouped]
+        groups = groups[is_grouped]
+
+        duplicates_df = pd.concat([convos[code].msgs_df.iloc[msg_idx[convo_codes == code]][['sender_name', 'text']]
+                                   .assign(convo=convos[code].convo_name, group=groups[convo_codes == code])
+                                   for code in np.unique(convo_codes)])
+
+        convo_counts = duplicates_df.groupby('group')['convo'].nunique()
+        duplicates_df = duplicates_df[duplicates_df['group'].isin(convo_counts.index[convo_counts >= min_convos])]
+
+        # Renumber the groups from largest to smallest
+        group_sizes = duplicates_df['group'].value_counts(sort=True)
+        duplicates_df['group'] = duplicates_df['group'].map(pd.Series(np.arange(1, len(group_sizes) + 1),
+                                                                      index=group_sizes.index))
+        duplicates_df = duplicates_df.rename_axis('timestamp').sort_values(['group', 'timestamp'])
+
+        return duplicates_df[result_cols]
+
+    def get_social_graph(self, exclude_user: bool = True) -> Tuple[pd.DataFrame, pd.DataFrame]:
+
+        """
+        Builds the graph of people linked by shared group chats and by interactions (replies and reactions exchanged),
+        with centrality and communities. Everything is computed with sparse matrices over all conversations at once
+        :param exclude_user: Exclude yourself, as you are linked to everyone
+        :return: A dataframe of nodes indexed by name: ['group_chats', 'co_members', 'interactions', 'pagerank',
+            'community'], and a dataframe of edges: ['source', 'target', 'co_membership', 'replies', 'reactions']
+        """
+
+        convos = list(self.convos.values())
+        reply_df = self.get_or_create_reply_df()
+        reactions_df = self.get_or_create_reactions_df()
+
+        speakers = np.array([x for convo in convos for x in convo.speakers], dtype=object)
+        people = pd.Index(pd.unique(np.concatenate([speakers, reply_df['sender'].cat.categories.values.astype(object),
+                                                    reactions_df['actor'].cat.categories.values.astype(object)])))
+
+        def person_codes(values: pd.Series) -> np.ndarray:
+            # Maps categorical codes onto the shared people index, without looking up each row
+            return people.get_indexer(values.cat.categories)[values.cat.codes.values]
+
+        # Membership of group chats, each conversation's speakers are flattened into (person, conversation) pairs
+        convo_codes = np.repeat(np.arange(len(convos)), [len(x.speakers) for x in convos])
+        is_group_member = np.repeat([x.is_group for x in convos], [len(x.speakers) for x in convos])
+        incidence = social_graph.build_incidence_matrix(people.get_indexer(speakers[is_group_member]),
+                                                        convo_codes[is_group_member], (len(people), len(convos)))
+
+        shape = (len(people), len(people))
+        weight_matrices = {
+            'co_membership': social_graph.build_co_membership(incidence),
+            'replies': social_graph.symmetrise(reactions.build_coded_matrix(person_codes(reply_df['sender']),
+                                                                            person_codes(reply_df['replied_to']),
+                                                                            shape)),
+            'reactions': social_graph.symmetrise(reactions.build_coded_matrix(person_codes(reactions_df['actor']),
+                                                                              person_codes(reactions_df['recipient']),
+                                                                              shape)),
+        }
+
+        if exclude_user and self.name in people:
+            keep = people != self.name
+            people = people[keep]
+            incidence = incidence[keep]
+            weight_matrices = {col: matrix[keep][:, keep] for col, matrix in weight_matrices.items()}
+
+        # Each shared group chat counts as much as a reply or reaction exchanged
+        interactions = weight_matrices['replies'] + weight_matrices['reactions']
+        adjacency = (interactions + weight_matrices['co_membership']).astype(float).tocsr()
+
+        nodes_df = pd.DataFrame({
+            'group_chats': np.asarray(incidence.sum(axis=1)).ravel(),
+            'co_members': weight_matrices['co_membership'].getnnz(axis=1),
+            'interactions': np.asarray(interactions.sum(axis=1)).ravel(),
+            'pagerank': social_graph.pagerank(adjacency),
+            'community': social_graph.label_propagation(adjacency),
+        }, index=people)
+
+        return nodes_df.sort_values('pagerank', ascending=False), social_graph.build_edges_df(people, weight_matrices)
+
+    def export_social_graph(self, output_dir: str, exclude_user: bool = True) -> List[str]:
+
+        """
+        Writes the social graph (see get_social_graph) as GraphML and as node and edge CSVs
+        :return: The paths written
+        """
+
+        return social_graph.export_graph(output_dir, *self.get_social_graph(exclude_user))
+
+    def get_convo_strata(self) -> pd.Series:
+
+        """
+        :return: The sampling stratum of each conversation (message count range, group vs one-to-one and source),
+            indexed by conversation name
+        """
+
+        convos = list(self.convos.values())
+        names = [x.convo_name for x in convos]
+
+        msg_counts = pd.Series([x.msg_count for x in convos], index=names)
+        is_group = pd.Series([bool(x.is_group) for x in convos], index=names)
+        sources = pd.Series([' + '.join(sorted(x.msgs_df['source'].astype(str).unique()))
+                             if 'source' in x.msgs_df.columns else 'Unknown' for x in convos], index=names)
+
+        return sampling.assign_strata(msg_counts, is_group, sources)
+
+    def preview(self, fraction: float = 0.1, msg_fraction: float = 1.0, seed: int = 0) -> 'User':
+
+        """
+        Creates a smaller User holding a deterministic, stratified sample of the conversations (and optionally of their
+        messages), which every analysis can be run on in a fraction of the time. The same arguments always give the
+        same sample
+        :param fraction: The fraction of conversations to sample from each stratum (at least one per stratum)
+        :param msg_fraction: The fraction of messages to sample from each sampled conversation
+        :param seed: Different seeds give different (independent) samples
+        :return: A User with the sampled conversations, and sample_weights to scale any totals up to the full dataset
+        """
+
+        source, preview_user = self._previews.get((fraction, msg_fraction, seed), (None, None))
+        if source is self.convos:
+            return preview_user
+
+        weights = sampling.sample_strata(self.get_convo_strata(), fraction, seed)
+
+        preview_user = User(self.name, self.fb_path, self.ig_path)
+        preview_user._affect_params = dict(self._affect_params)
+
+        for convo_name in weights.index:
+            convo = self.convos[convo_name]
+            convo = convo.sample_msgs(msg_fraction, seed) if msg_fraction < 1 else convo
+
+            if convo is not None:
+                preview_user.convos[convo_name] = convo
+
+        preview_user.sample_weights = weights[weights.index.isin(preview_user.convos.keys())] / msg_fraction
+        self._previews[(fraction, msg_fraction, seed)] = (self.convos, preview_user)
+
+        return preview_user
+
+    def preview_analysis(self, analysis: Callable[['User'], Any], fraction: float = 0.1, msg_fraction: float = 1.0,
+                         replicates: int = 5, seed: int = 0, compare_full: bool = False,
+                         totals: bool = False) -> pd.DataFrame:
+
+        """
+        Runs an analysis on several independent previews (see User.preview), estimating each value with error bars
+        from the spread between them, e.g. preview_analysis(lambda x: x.get_convos_ranked_by_char_ratio(True, -1))
+        :param analysis: A function taking a User, returning a number, series, dataframe or list of ('Name', Value)
+        :param replicates: The number of independent samples to run the analysis on
+        :param seed: The seed of the first sample, the others use the following seeds
+        :param compare_full: Also run the analysis on the full dataset, reporting the error of the estimates
+        :param totals: Whether the analysis returns totals which add up across conversations (e.g. message counts).
+            These are scaled up by the sample weights, by running the analysis on each group of equally weighted
+            conversations. Otherwise values are assumed to be ratios, averages or per conversation values, which the
+            sample estimates without scaling
+        :return: A dataframe with a row per value: ['estimate', 'std_err', 'ci_low', 'ci_high', 'samples'], plus
+            ['full', 'error', 'within_ci'] when compared to the full dataset
+        """
+
+        results = []
+        for ii in range(replicates):
+            preview_user = self.preview(fraction, msg_fraction, seed + ii)
+
+            if not totals:
+                results.append(sampling.to_numeric_result(analysis(preview_user)))
+                continue
+
+            # Conversations in the same stratum share a weight, so the analysis only runs once per distinct weight
+            weighted_results = []
+            for weight, convo_names in preview_user.sample_weights.groupby(preview_user.sample_weights).groups.items():
+                group_user = User(self.name, self.fb_path, self.ig_path)
+                group_user._affect_params = dict(self._affect_params)
+                group_user.convos = {x: preview_user.convos[x] for x in convo_names}
+
+                weighted_results.append(sampling.to_numeric_result(analysis(group_user)) * weight)
+
+            results.append(pd.concat(weighted_results, axis=1).sum(axis=1))
+
+        full_result = sampling.to_numeric_result(analysis(self)) if compare_full else None
+
+        return sampling.summarise_replicates(results, full_result)
+
+    def query(self, convos: Iterable[str] = None, senders: Iterable[str] = None, sources: Iterable[str] = None,
+              start_date: Union[dt.datetime, str, None] = None, end_date: Union[dt.datetime, str, None] = None,
+              msg_types: Iterable[str] = None, columns: Iterable[str] = None) -> pd.DataFrame:
+
+        """
+        Retrieves messages matching all the provided filters. Where the on-disk message store exists, the filters are
+        pushed down to it, so only the columns and row ranges needed are read. Otherwise the loaded conversations are
+        sliced using their sorted time index
+        :param convos: Names of conversations to include, defaults to all
+        :param senders: Names of senders to include, defaults to all
+        :param sources: Sources to include (e.g. 'Facebook', 'Instagram'), defaults to all
+        :param start_date: Optional start date, messages before it are excluded (naive dates use the machine timezone)
+        :param end_date: Optional end date, messages after it are excluded (naive dates use the machine timezone)
+        :param msg_types: Message types to include (any of MsgStore.msg_types, e.g. 'text', 'photo', 'call')
+        :param columns: Columns to return, defaults to all
+        :return: A dataframe of the matching messages indexed by timestamp, with an additional 'convo' column
+        """
+
+        start_date = User._localise_date(start_date)
+        end_date = User._localise_date(end_date)
+
+        if self.msg_store is not None:
+            return self.msg_store.query(convos, senders, sources, start_date, end_date, msg_types, columns)
+
+        msgs_dfs = {name: convo.msgs_df for name, convo in self.convos.items()}
+        return MsgStore.query_in_memory(msgs_dfs, convos, senders, sources, start_date, end_date, msg_types, columns)
+
+    @staticmethod
+    def _localise_date(date: Union[dt.datetime, str, None]) -> Union[pd.Timestamp, None]:
+        if date is None:
+            return None
+
+        date = pd.to_datetime(date)
+
+        return date.tz_localize(time.strftime("%z")) if date.tz is None else date
+
     def build_sma_df(self, sample_period='14D', start_date: Union[dt.datetime, None] = None,
                      end_date: Union[dt.datetime, None] = None) -> pd.DataFrame:
 
-        machine_tz = time.strftime("%z")
-        if start_date:
-            start_date = pd.to_datetime(start_date).tz_localize(machine_tz)
-
-        if end_date:
-            end_date = pd.to_datetime(end_date).tz_localize(machine_tz)
+        start_date = User._localise_date(start_date)
+        end_date = User._localise_date(end_date)
 
         cols_to_combine = []
-        for c_name, convo in self.convos.items():
+        for c_name in self.convos.keys():
 
-            df = convo.msgs_df.copy()
-            df['timestamp'] = df.index
-            if start_date:
-                df = df[df.timestamp >= start_date]
-
-            if end_date:
-                df = df[df.timestamp <= end_date]
+            # Only the character counts within the date range are read
+            df = self.query([c_name], start_date=start_date, end_date=end_date, columns=['text_len'])
 
             # Hacky time saving manoeuvre skipping conversations with less than 100 messages
             if df.shape[0] < 100:
@@ -210,7 +1081,7 @@ class User:
 
             # Aggregate text counts into periods and then apply a simple moving average
             sma_df = pd.DataFrame()
-            sma_df[c_name] = df.resample(sample_period, on='timestamp', label='right', origin='epoch').text_len.sum()
+            sma_df[c_name] = df.resample(sample_period, label='right', origin='epoch').text_len.sum()
 
             if sma_df.shape[0] > 0:
                 if start_date:
@@ -220,7 +1091,98 @@ class User:
 
                 cols_to_combine.append(sma_df)
 
-        # Concatenate and fill missing values with zeroes
-        result_df = pd.concat(cols_to_combine, axis=1).fillna(0)  # .drop_duplicates()
+        # Concatenate and fill missing values with zeroes (small exports may have no conversations long enough)
+        result_df = pd.concat(cols_to_combine, axis=1).fillna(0) if cols_to_combine else pd.DataFrame()
 
         return result_df
+
+    def get_activity_matrix(self, sample_period: str = '7D', measure: str = 'msgs', no_groupchats: bool = False,
+                            min_msgs: int = 0) -> Tuple[np.ndarray, List[str], pd.DatetimeIndex]:
+
+        """
+        Builds every conversation's activity per period as one array, in a single pass over all messages
+        :param sample_period: Fixed period to count activity in (e.g. '7D'), anchored to the epoch
+        :param measure: 'msgs' to count messages, or 'chars' to count characters
+        :param no_groupchats: Only include one-to-one conversations
+        :param min_msgs: The minimum number of messages for a conversation to be included
+        :return: An array shaped (conversations, periods), the conversation names of its rows and the start of each
+            period (its columns)
+        """
+
+        if measure not in ('msgs', 'chars'):
+            raise ValueError(f"Activity is measured by 'msgs' or 'chars', not: {measure}")
+
+        convos = [x for x in self.convos.values() if x.msg_count >= min_msgs and not (no_groupchats and x.is_group)]
+
+        timestamps_ns = np.concatenate([x.msgs_df.index.asi8 for x in convos] or [np.array([], dtype=np.int64)])
+        convo_codes = np.repeat(np.arange(len(convos)), [x.msgs_df.shape[0] for x in convos])
+        weights = np.concatenate([x.msgs_df['text_len'].values for x in convos]) if measure == 'chars' else None
+
+        matrix, period_starts = activity_shifts.build_period_matrix(timestamps_ns, convo_codes, len(convos),
+                                                                    sample_period, weights)
+
+        return matrix, [x.convo_name for x in convos], period_starts.tz_convert(time.strftime("%z"))
+
+    def get_activity_shifts(self, sample_period: str = '7D', measure: str = 'msgs', n: int = 20,
+                            no_groupchats: bool = False, min_msgs: int = 100, min_score: float = 5.0) -> pd.DataFrame:
+
+        """
+        Finds lasting changes in how active each conversation is (e.g. a friendship fading or reviving), detected in
+        every conversation at once (see activity_shifts.detect_shifts)
+        :param sample_period: Fixed period to count activity in (e.g. '7D'), anchored to the epoch
+        :param measure: 'msgs' to count messages, or 'chars' to count characters
+        :param n: Number of shifts to return. For n < 1, all results will be returned
+        :param min_msgs: The minimum number of messages for a conversation to be included
+        :param min_score: The minimum significance of a shift (in units of the conversation's noise)
+        :return: A dataframe with a row per shift: ['convo', 'period', 'direction', 'before', 'after', 'score'], where
+            before and after are the average activity per period either side of it, sorted from the biggest shift
+        """
+
+        matrix, convo_names, period_starts = self.get_activity_matrix(sample_period, measure, no_groupchats, min_msgs)
+        if matrix.size == 0:
+            return pd.DataFrame(columns=['convo', 'period', 'direction', 'before', 'after', 'score'])
+
+        shifts_df = activity_shifts.detect_shifts(matrix, min_score)
+
+        results_df = pd.DataFrame({'convo': np.array(convo_names, dtype=object)[shifts_df['row'].values],
+                                   'period': period_starts[shifts_df['period_idx'].values],
+                                   'direction': np.where(shifts_df['after'] > shifts_df['before'], 'Reviving',
+                                                         'Fading'),
+                                   'before': shifts_df['before'].values,
+                                   'after': shifts_df['after'].values,
+                                   'score': shifts_df['score'].values})
+        results_df = results_df.sort_values('score', ascending=False, kind='stable').reset_index(drop=True)
+
+        return results_df.head(n) if n > 0 else results_df
+
+    def get_activity_spikes(self, sample_period: str = '1D', measure: str = 'msgs', n: int = 20,
+                            no_groupchats: bool = False, min_msgs: int = 100, min_z: float = 4.0,
+                            min_value: float = 10) -> pd.DataFrame:
+
+        """
+        Finds periods of unusually high activity in each conversation, compared to the periods before them, detected in
+        every conversation at once (see activity_shifts.detect_spikes)
+        :param sample_period: Fixed period to count activity in (e.g. '1D'), anchored to the epoch
+        :param measure: 'msgs' to count messages, or 'chars' to count characters
+        :param n: Number of spikes to return. For n < 1, all results will be returned
+        :param min_msgs: The minimum number of messages for a conversation to be included
+        :param min_z: The minimum number of standard deviations above the conversation's recent activity
+        :param min_value: The minimum activity of a spike (messages or characters, depending on the measure)
+        :return: A dataframe with a row per spike: ['convo', 'period', 'value', 'baseline', 'z'], sorted from the
+            largest spike
+        """
+
+        matrix, convo_names, period_starts = self.get_activity_matrix(sample_period, measure, no_groupchats, min_msgs)
+        if matrix.size == 0:
+            return pd.DataFrame(columns=['convo', 'period', 'value', 'baseline', 'z'])
+
+        spikes_df = activity_shifts.detect_spikes(matrix, min_z=min_z, min_value=min_value)
+
+        results_df = pd.DataFrame({'convo': np.array(convo_names, dtype=object)[spikes_df['row'].values],
+                                   'period': period_starts[spikes_df['period_idx'].values],
+                                   'value': spikes_df['value'].values,
+                                   'baseline': spikes_df['baseline'].values,
+                                   'z': spikes_df['z'].values})
+        results_df = results_df.sort_values('z', ascending=False, kind='stable').reset_index(drop=True)
+
+        return results_df.head(n) if n > 0 else results_df
@@ -14,7 +14,11 @@ use('TkAgg')
 import matplotlib.pyplot as plt
 
 from conversations import convo_visualisation
+from conversations.api_server import AnalyticsServer
+from conversations.background_loader import BackgroundLoader
 from conversations.convo_reader import ConvoReader
+from conversations.output_sink import OutputSink
+from conversations.sketches import OverviewSketches
 
 # logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
 logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(asctime)s - %(message)s')
@@ -29,39 +33,22 @@ sys.path.append("conversations")
 # Custom Inputs, Replace with questions
 fb_root_path = os.path.join("raw_data", "facebook", "fb-27_04_2024-msgs")
 ig_root_path = os.path.join("raw_data", "instagram")
+whatsapp_root_path = os.path.join("raw_data", "whatsapp")
 output_root = "output"
 cache_root = "cache"
 user_name = "Raine Bianchini"
 min_msgs = 50
 
+# Graphs are written as loose files ("files"), or into one "zip", "tar" or multipage "pdf" per run (see OutputSink)
+output_mode = "files"
+image_format = "jpeg"
+
 manual_match_file_path = os.path.join("raw_data", "ig_fb_mapping.csv")
 
 
 # TODO: add input for timezone
 # TODO: add options for create_files?
 # TODO: add min messages cut off for conversations of interest and reduce wasted compute on tiny conversations
-# TODO: add enagement score (including call times and add logarithmic points for high char, GIFs etc)
-
-def save_graph_catch_errs(fig, filepath, convo_name):
-    # Bad practice catchall, but program shouldn't halt because of any file I/O error
-    # FIXME: Check for collisions ahead of time and add custom suffix
-    try:
-        fig.savefig(filepath)
-
-    except Exception as err:
-        logging.warning(f"Failed to save graph for Convo: {convo_name}, due to the following: {err}")
-        
-
-def ensure_output_dir(output_root: str, folder: str) -> str:
-    output_dir = os.path.join(os.path.abspath(output_root), folder)
-    
-    # On windows, use file prefix to bypass 260 filepath char limit, needs to be outside os.path.join to work
-    if sys.platform == 'win32':
-        output_dir = r'//?/' + output_dir
-    pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
-    
-    return output_dir
-
 
 # STARTUP
 print("\nAnalysis of FaceBook Data by Raine Bianchini")
@@ -71,27 +58,52 @@ matching_df = None
 if os.path.isfile(manual_match_file_path):
     matching_df = pd.read_csv(manual_match_file_path)
 
-cached_data = ConvoReader.load_or_create_cache(fb_root_path, cache_root, user_name,
-                                               ig_path=ig_root_path, ig_fb_match_df=matching_df)
+# Exports of other sources are read when present, structured: {Source Name: Export Path}
+source_paths = {'WhatsApp': whatsapp_root_path} if os.path.exists(whatsapp_root_path) else {}
+
+# Load or build the cache in the background, so the menu is available straight away
+loader = BackgroundLoader(user_name, fb_root_path, ig_root_path)
+loader.start(ConvoReader.load_or_create_cache, fb_root_path, cache_root, user_name, ig_path=ig_root_path,
+             ig_fb_match_df=matching_df, source_paths=source_paths)
 
 choice_main = " "
-if not cached_data:
-    print("Aborting as cached data cannot be built")
-    choice_main = "0"
+
+# In preview mode, lists and graphs use a stratified sample of the conversations (see User.preview)
+preview_fraction = None
 
 # TODO: create output file if it doesn't exist?
 
 
 while choice_main[0] != "0":
+    cached_data = loader.user
+
     print("\nFacebook Analysis Main Menu:")
     print("==============================")
+    print(f"Data: {loader.status()}")
+    if preview_fraction:
+        print(f"Preview Mode: {preview_fraction:.0%} sample of conversations")
     print("(1)\tList Top Conversations")
     print("(2)\tGenerate Graphs")
     print("(3)\tSearch Specific Conversation")
     print("(4)\tRebuild Cache")
+    print("(5)\tIngest Newer Export")
+    print("(6)\tQuick Overview (Approximate)")
+    print("(7)\tToggle Preview Mode (10% Sample)")
+    print("(8)\tStart Local API Server")
     print("(0)\tQuit\n")
     choice_main = input("")
 
+    # Everything except searching for a specific conversation needs the full dataset
+    if choice_main[0] in ("1", "2", "4", "5", "8"):
+        cached_data = loader.wait_until_ready()
+
+        if cached_data is None and choice_main[0] in ("1", "2", "8"):
+            print("Conversations could not be loaded, try rebuilding the cache")
+            continue
+
+        if preview_fraction and choice_main[0] in ("1", "2"):
+            cached_data = cached_data.preview(preview_fraction)
+
     # LIST CONVERSATIONS
     if choice_main[0] == "1":
 
@@ -101,6 +113,12 @@ while choice_main[0] != "0":
             print("\nConversation List Menu:")
             print("(1)\tList by Message Counts")
             print("(2)\tList by Character Ratio")
+            print("(3)\tList by Reply Speed")
+            print("(4)\tList by Who Starts Conversations")
+            print("(5)\tList by Engagement Score")
+            print("(6)\tList by Who Reacts to Whom")
+            print("(7)\tGroup by Similar Language")
+            print("(8)\tGroup by Time of Day")
             print("(0)\tEscape to Top Menu\n")
             choice_convo_list = input("")
 
@@ -135,6 +153,62 @@ while choice_main[0] != "0":
                     name, count = convo
                     print(f" {index}) {name} : {count}")
 
+            elif choice_convo_list[0] == "3":
+
+                print("Median reply times in one-to-one conversations (replies after a 12 hour gap are excluded)")
+                print("Sorted by how quickly your friends reply to you\n")
+
+                reply_times = cached_data.get_convos_ranked_by_reply_time(n=50)
+
+                for ii, (name, user_median, other_median) in enumerate(reply_times):
+                    print(f" {ii + 1}) {name} : {dt.timedelta(seconds=round(other_median))} "
+                          f"(You: {dt.timedelta(seconds=round(user_median))})")
+
+            elif choice_convo_list[0] == "4":
+
+                print("Proportion of sessions (bursts of messages separated by 30+ minutes) that you started\n")
+
+                initiations = cached_data.get_convos_ranked_by_initiation(n=50)
+
+                for ii, (name, user_started, session_count) in enumerate(initiations):
+                    print(f" {ii + 1}) {name} : {user_started:.0%} of {session_count} sessions")
+
+            elif choice_convo_list[0] == "5":
+
+                print("Engagement: messages, log-scaled characters and call time, media, links and reactions\n")
+
+                engagement_scores = cached_data.get_convos_ranked_by_engagement(n=50)
+
+                for ii, (name, score) in enumerate(engagement_scores):
+                    print(f" {ii + 1}) {name} : {score:,.0f}")
+
+            elif choice_convo_list[0] == "6":
+
+                print("Number of messages each person has reacted to, from each other person (across all conversations)\n")
+
+                reaction_pairs = cached_data.get_top_reaction_pairs(n=50)
+
+                for ii, (actor, recipient, count) in enumerate(reaction_pairs):
+                    print(f" {ii + 1}) {actor} -> {recipient} : {count:,}")
+
+            elif choice_convo_list[0] == "7":
+
+                print("Conversations grouped by the words and phrases used in them (conversations with 100+ messages)\n")
+
+                text_clusters = cached_data.get_text_clusters(n_clusters=10)
+
+                for cluster, names in text_clusters.items():
+                    print(f" Group {cluster} ({len(names)}): {', '.join(names)}")
+
+            elif choice_convo_list[0] == "8":
+
+                print("Conversations grouped by the hours of the day they happen in (conversations with 100+ messages)\n")
+
+                hour_clusters = cached_data.get_convos_clustered_by_hour()
+
+                for ii, (description, names) in enumerate(hour_clusters):
+                    print(f" {ii + 1}) {description} ({len(names)}): {', '.join(names)}")
+
             elif choice_convo_list[0] != "0":
                 print("Incorrect command, please try again")
 
@@ -150,6 +224,7 @@ while choice_main[0] != "0":
             print("(3)\tRacing Bar Chart Animation")
             print("(4)\tSentiment Distribution Comparison Graphs")
             print("(5)\tSentiment Quadrant Interactive Graphs")
+            print("(6)\tSocial Graph Export (GraphML + CSV)")
             print("(0)\tEscape to Top Menu\n")
             choice_graph_list = input("")
 
@@ -157,7 +232,8 @@ while choice_main[0] != "0":
             if choice_graph_list[0] == "1":
 
                 print("\nGenerating Time of Day Histograms")
-                pathlib.Path(output_root).mkdir(parents=True, exist_ok=True)
+                sink = OutputSink(output_root, "Time of Day Histograms", output_mode, image_format)
+                templates = convo_visualisation.FigureTemplates()
 
                 for ii, convo in enumerate(cached_data.convos.values()):
 
@@ -168,17 +244,18 @@ while choice_main[0] != "0":
                     if convo.msg_count < min_msgs or len(convo.speakers) < 2: continue
 
                     hist_dataset = convo.get_char_counts_by_hour()
-                    hist_obj = convo_visualisation.create_msg_time_hist(hist_dataset, convo.convo_name)
+                    hist_obj = convo_visualisation.create_msg_time_hist(hist_dataset, convo.convo_name, templates)
 
-                    output_dir = ensure_output_dir(output_root, convo.cleaned_name)
-                    save_graph_catch_errs(hist_obj, os.path.join(output_dir, "Time of Day Histogram.jpeg"),
-                                          convo.convo_name)
+                    sink.add_figure(hist_obj, convo.cleaned_name, "Time of Day Histogram", convo.convo_name)
+
+                print(f"Written: {', '.join(sink.close())}")
 
             # GENERATE CONVERSATION MSG COUNT TIMELINE
             elif choice_graph_list[0] == "2":
 
                 print("\nGenerating Conversation Timeline Graphs")
-                pathlib.Path(output_root).mkdir(parents=True, exist_ok=True)
+                sink = OutputSink(output_root, "Conversation Timelines", output_mode, image_format)
+                templates = convo_visualisation.FigureTemplates()
 
                 for ii, convo in enumerate(cached_data.convos.values()):
                     
@@ -188,10 +265,11 @@ while choice_main[0] != "0":
                     # Skip empty convos
                     if convo.msg_count < min_msgs or len(convo.speakers) < 2: continue
 
-                    hist_obj = convo_visualisation.create_timeline_hist(convo.convo_name, convo.msgs_df, convo.speakers)
-                    output_dir = ensure_output_dir(output_root, convo.cleaned_name)
-                    save_graph_catch_errs(hist_obj, os.path.join(output_dir, "Conversation Timeline.jpeg"),
-                                          convo.convo_name)
+                    hist_obj = convo_visualisation.create_timeline_hist(convo.convo_name, convo.msgs_df, convo.speakers,
+                                                                        templates)
+                    sink.add_figure(hist_obj, convo.cleaned_name, "Conversation Timeline", convo.convo_name)
+
+                print(f"Written: {', '.join(sink.close())}")
 
             # GENERATE RACING BAR CHART ANIMATION
             elif choice_graph_list[0] == "3":
@@ -329,7 +407,8 @@ while choice_main[0] != "0":
                     user_df = full_df[user_receiver_mask].copy().reset_index()
                     receiver_df = full_df[~user_receiver_mask].copy().reset_index()
 
-                    pathlib.Path(output_root).mkdir(parents=True, exist_ok=True)
+                    sink = OutputSink(output_root, "Sentiment Distributions", output_mode, image_format)
+                    templates = convo_visualisation.FigureTemplates()
 
                     print("Generating distribution graphs ...")
 
@@ -350,20 +429,19 @@ while choice_main[0] != "0":
                         signs_dist_obj = convo_visualisation.create_sentiment_dist_comparison(user_df, receiver_df,
                                                                                               convo_name,
                                                                                               cached_data.name,
-                                                                                              ["pos", "neg"])
+                                                                                              ["pos", "neg"], templates)
                         compound_dist_obj = convo_visualisation.create_sentiment_dist_comparison(user_df, receiver_df,
                                                                                                  convo_name,
                                                                                                  cached_data.name,
-                                                                                                 ["compound"])
+                                                                                                 ["compound"],
+                                                                                                 templates)
 
-                        output_dir = ensure_output_dir(output_root, convo.cleaned_name)
-                        save_graph_catch_errs(signs_dist_obj,
-                                              os.path.join(output_dir, "Sentiment Distribution Raw Comparison.jpeg"),
-                                              convo.convo_name)
-                        save_graph_catch_errs(compound_dist_obj,
-                                              os.path.join(output_dir,
-                                                           "Sentiment Distribution Compound Comparison.jpeg"),
-                                              convo.convo_name)
+                        sink.add_figure(signs_dist_obj, convo.cleaned_name, "Sentiment Distribution Raw Comparison",
+                                        convo.convo_name)
+                        sink.add_figure(compound_dist_obj, convo.cleaned_name,
+                                        "Sentiment Distribution Compound Comparison", convo.convo_name)
+
+                    print(f"Written: {', '.join(sink.close())}")
 
             # GENERATE SENTIMENT QUADRANT INTERACTIVE GRAPHS
 
@@ -398,6 +476,16 @@ while choice_main[0] != "0":
                 plt.show(block=True)
                 plt.ioff()
 
+            # EXPORT SOCIAL GRAPH
+            elif choice_graph_list[0] == "6":
+
+                print("\nBuilding social graph (shared group chats, replies and reactions)")
+                graph_paths = cached_data.export_social_graph(os.path.join(output_root, "Social Graph"))
+
+                print("Written (open the GraphML file with Gephi, Cytoscape or networkx):")
+                for graph_path in graph_paths:
+                    print(f"\t{graph_path}")
+
             elif choice_graph_list[0] != "0":
                 print("Incorrect command, please try again")
 
@@ -412,25 +500,93 @@ while choice_main[0] != "0":
         while choice_ind_convo != "QUIT":
             choice_ind_convo = input("\nConvo to Search For (Type QUIT to exit):")
             # TODO: allow some similarity based suggestions upon failure
+            cached_data = loader.user
             user_found = choice_ind_convo in cached_data.convos.keys()
 
             if not user_found and choice_ind_convo != "QUIT":
                 print("Conversation was not found, please try again\n")
 
+                if not loader.ready.is_set():
+                    print(f"Not all conversations are available yet: {loader.status()}")
+
             elif user_found:
                 print("\n", str(cached_data.convos[choice_ind_convo]))
 
 
     # REBUILD CACHE
     elif choice_main[0] == "4":
-        shutil.rmtree(cache_root)
+        shutil.rmtree(cache_root, ignore_errors=True)
         logging.info("Previous Cache Deleted")
 
         matching_df = None
         if os.path.isfile(manual_match_file_path):
             matching_df = pd.read_csv(manual_match_file_path)
-        cached_data = ConvoReader.build_cache(fb_root_path, cache_root, user_name, ig_path=ig_root_path,
-                                              ig_fb_matches=matching_df)
+        loader.start(ConvoReader.build_cache, fb_root_path, cache_root, user_name, ig_path=ig_root_path,
+                     ig_fb_matches=matching_df, source_paths=source_paths)
+
+    # INGEST ONLY THE NEW MESSAGES FROM A NEWER EXPORT
+    elif choice_main[0] == "5":
+        print("\nPaths to the newer exports (leave blank to skip a platform)")
+        new_fb_root_path = input("Facebook Export Path: ") or None
+        new_ig_root_path = input("Instagram Export Path: ") or None
+        new_whatsapp_root_path = input("WhatsApp Export Path: ") or None
+        new_source_paths = {'WhatsApp': new_whatsapp_root_path} if new_whatsapp_root_path else {}
+
+        matching_df = None
+        if os.path.isfile(manual_match_file_path):
+            matching_df = pd.read_csv(manual_match_file_path)
+
+        try:
+            updated_data = ConvoReader.update_cache(new_fb_root_path, cache_root, user_name, ig_path=new_ig_root_path,
+                                                    ig_fb_matches=matching_df, source_paths=new_source_paths)
+        except ValueError as err:
+            print(err)
+        else:
+            if updated_data:
+                loader.replace_user(updated_data)
+            fb_root_path = new_fb_root_path or fb_root_path
+            ig_root_path = new_ig_root_path or ig_root_path
+            source_paths.update(new_source_paths)
+
+    # QUICK OVERVIEW, ONLY READS THE SKETCH FILE SO IT DOESN'T WAIT FOR THE CACHE TO LOAD
+    elif choice_main[0] == "6":
+        overview = OverviewSketches.load(os.path.join(cache_root, ConvoReader.sketch_file_name))
+
+        if overview is None:
+            print("No overview is available until the cache has been built")
+            continue
+
+        summary = overview.summary()
+        print("\nOverview (approximate)")
+        print("==============================")
+        print(f"Messages: {summary['messages']:,} across {summary['conversations']:,} conversations")
+        # Sketches are saved even when no messages have been ingested yet, in which case there are no dates
+        first_date, last_date = (f"{summary[x]:%Y-%m-%d}" if summary[x] is not None else "n/a"
+                                 for x in ['first_message', 'last_message'])
+        print(f"Dates: {first_date} to {last_date}")
+        print(f"Distinct senders: ~{summary['distinct_senders']:,}")
+
+        lengths = summary['msg_length_quantiles']
+        print(f"Message length (chars): median {lengths[0.5]:.0f}, 90% {lengths[0.9]:.0f}, 99% {lengths[0.99]:.0f}")
+
+        latencies = summary['reply_latency_quantiles_s']
+        if not np.isnan(latencies[0.5]):
+            print(f"Reply time: median {dt.timedelta(seconds=round(latencies[0.5]))}, "
+                  f"90% {dt.timedelta(seconds=round(latencies[0.9]))}")
+
+        print(f"Top words: {', '.join(f'{word} ({count:,})' for word, count in summary['top_words'])}")
+        print("Top links:")
+        for link, count in summary['top_links']:
+            print(f"\t{link} ({count:,})")
+
+    elif choice_main[0] == "7":
+        preview_fraction = None if preview_fraction else 0.1
+        print(f"Preview mode {'on' if preview_fraction else 'off'}")
+
+    # SERVE THE DATA TO A LOCAL FRONT END, UNTIL INTERRUPTED
+    elif choice_main[0] == "8":
+        print("\nServing at http://127.0.0.1:8765/ (press Ctrl+C to return to the menu)")
+        AnalyticsServer(cached_data).run()
 
     elif choice_main[0] != "0":
         print("Incorrect command, please try again")
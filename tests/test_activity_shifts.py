@@ -0,0 +1,75 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import activity_shifts
+from activity_shifts import build_period_matrix, detect_shifts, detect_spikes
+
+
+class TestActivityShifts(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+
+        # Row 0 steps from about 50 to 5 messages a period at period 30, row 1 is steady and row 2 starts late
+        self.matrix = np.vstack([
+            np.concatenate([rng.poisson(50, 30), rng.poisson(5, 30)]),
+            rng.poisson(20, 60),
+            np.concatenate([np.zeros(20), rng.poisson(20, 40)]),
+        ]).astype(float)
+
+    def test_step_gives_exactly_one_shift(self):
+        shifts_df = detect_shifts(self.matrix)
+
+        self.assertListEqual(shifts_df['row'].tolist(), [0])
+        self.assertListEqual(shifts_df['period_idx'].tolist(), [30])
+        self.assertAlmostEqual(shifts_df['before'].iloc[0], self.matrix[0, :30].mean())
+        self.assertAlmostEqual(shifts_df['after'].iloc[0], self.matrix[0, 30:].mean())
+
+    def test_constant_and_empty_rows_have_no_shifts(self):
+        shifts_df = detect_shifts(np.vstack([np.full(40, 7.0), np.zeros(40)]))
+
+        self.assertEqual(shifts_df.shape[0], 0)
+        self.assertListEqual(shifts_df.columns.tolist(), activity_shifts.shift_cols)
+
+    def test_chunked_search_matches(self):
+        with mock.patch.object(activity_shifts, "max_chunk_cells", 1):
+            chunked_df = detect_shifts(self.matrix)
+
+        pd.testing.assert_frame_equal(chunked_df, detect_shifts(self.matrix))
+
+    def test_spike_is_detected(self):
+        matrix = self.matrix.copy()
+        matrix[1, 45] = 400
+
+        spikes_df = detect_spikes(matrix)
+
+        self.assertListEqual(spikes_df[['row', 'period_idx']].values.tolist(), [[1, 45]])
+        self.assertEqual(spikes_df['value'].iloc[0], 400)
+
+    def test_small_bursts_are_not_spikes(self):
+        # A few messages in an otherwise silent conversation are below min_value
+        matrix = np.zeros((1, 30))
+        matrix[0, [0, 20]] = [1, 6]
+
+        self.assertEqual(detect_spikes(matrix).shape[0], 0)
+
+    def test_period_matrix_counts_each_row(self):
+        day_ns = pd.Timedelta('1D').value
+        timestamps_ns = np.array([0, 1, day_ns * 7, day_ns * 15, day_ns * 15]) + day_ns * 700
+
+        matrix, period_starts = build_period_matrix(timestamps_ns, np.array([0, 1, 0, 1, 1]), 2, '7D')
+
+        self.assertListEqual(matrix.tolist(), [[1, 1, 0], [1, 0, 2]])
+        self.assertEqual(len(period_starts), 3)
+        self.assertEqual(period_starts[1] - period_starts[0], pd.Timedelta('7D'))
+
+    def test_calendar_periods_are_rejected(self):
+        with self.assertRaises(ValueError):
+            build_period_matrix(np.array([0]), np.array([0]), 1, 'MS')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import unittest
+from typing import *
+from unittest import mock
+
+import pandas as pd
+
+from api_server import AnalyticsServer
+from convo import Convo
+from conversations.user import User
+
+
+def build_convo(name: str, days: int = 20) -> Convo:
+    index = pd.date_range("2021-01-01", periods=days * 2, freq="12h", tz="UTC").rename("timestamp")
+    msgs_df = pd.DataFrame({"sender_name": ["Raine", name] * days, "text": ["hello there", "hi"] * days}, index=index)
+
+    return Convo(name, ["Raine", name], True, False, msgs_df)
+
+
+def parse_response(response: bytes) -> Tuple[int, Dict[str, str], bytes]:
+    head, _, body = response.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    headers = {key.lower(): val.strip() for key, _, val in (x.partition(":") for x in header_lines)}
+
+    return int(status_line.split(" ")[1]), headers, body
+
+
+class TestAnalyticsServer(unittest.TestCase):
+
+    def setUp(self):
+        self.curr_user = User("Raine")
+        self.curr_user.convos = {"Ben": build_convo("Ben"), "Cat": build_convo("Cat", 10)}
+        self.server = AnalyticsServer(self.curr_user, cache_size=2)
+        self.addCleanup(self.server._executor.shutdown)
+
+    def request(self, target: str, method: str = "GET", headers: Dict[str, str] = None):
+        return parse_response(asyncio.run(self.server.handle_request(method, target, headers or {})))
+
+    def test_routes_to_convo(self):
+        status, headers, body = self.request("/convos/Ben")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["content-type"], "application/json; charset=utf-8")
+        self.assertListEqual(sorted(x["sender_name"] for x in json.loads(body)), ["Ben", "Raine"])
+
+    def test_errors(self):
+        self.assertEqual(self.request("/nothing/here")[0], 404)
+        self.assertEqual(self.request("/convos/Nobody")[0], 404)
+        self.assertEqual(self.request("/rankings/popularity")[0], 404)
+        self.assertEqual(self.request("/convos/Ben/timeseries?period=often")[0], 400)
+        self.assertEqual(self.request("/rankings/msg_count?n=many")[0], 400)
+
+        status, headers, body = self.request("/convos", method="POST")
+        self.assertEqual(status, 405)
+        self.assertEqual(headers["allow"], "GET, HEAD")
+        self.assertIn("error", json.loads(body))
+
+    def test_etag_revalidation(self):
+        _, headers, body = self.request("/convos")
+
+        status, revalidated_headers, revalidated_body = self.request("/convos",
+                                                                     headers={"if-none-match": headers["etag"]})
+        self.assertEqual(status, 304)
+        self.assertEqual(revalidated_body, b"")
+        self.assertEqual(revalidated_headers["etag"], headers["etag"])
+
+        self.assertEqual(self.request("/convos", headers={"if-none-match": '"stale"'})[2], body)
+
+    def test_head_has_no_body(self):
+        _, _, get_body = self.request("/convos/Cat")
+        status, headers, body = self.request("/convos/Cat", method="HEAD")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b"")
+        self.assertEqual(headers["content-length"], str(len(get_body)))
+
+    def test_lru_eviction(self):
+        with mock.patch.object(self.server, "compute_response", wraps=self.server.compute_response) as compute:
+            for target in ["/convos/Ben", "/convos/Cat", "/convos/Ben", "/convos", "/convos/Ben", "/convos/Cat"]:
+                self.request(target)
+
+        # Ben was used most recently when /convos was added, so Cat was evicted and has to be computed again
+        self.assertListEqual([x.args[0] for x in compute.call_args_list],
+                             ["/convos/Ben", "/convos/Cat", "/convos", "/convos/Cat"])
+
+    def test_cache_cleared_when_convos_replaced(self):
+        _, headers, _ = self.request("/convos")
+
+        self.curr_user.convos = {"Ben": build_convo("Ben", 30)}
+        status, new_headers, body = self.request("/convos", headers={"if-none-match": headers["etag"]})
+
+        self.assertEqual(status, 200)
+        self.assertNotEqual(new_headers["etag"], headers["etag"])
+        self.assertListEqual([x["convo"] for x in json.loads(body)], ["Ben"])
+
+    def test_convo_timeseries_matches_messages(self):
+        msgs_df = self.curr_user.convos["Ben"].msgs_df
+
+        for period in ["7D", "1D", "12h", "MS"]:
+            status, _, body = self.request(f"/convos/Ben/timeseries?period={period}")
+            expected_df = AnalyticsServer.resample_totals(msgs_df, period)
+
+            self.assertEqual(status, 200)
+            self.assertListEqual([x["msgs"] for x in json.loads(body)], expected_df["msgs"].tolist())
+            self.assertListEqual([x["chars"] for x in json.loads(body)], expected_df["chars"].tolist())
+
+        # Daily totals are built once, and reused for every period of whole days
+        self.assertListEqual(list(self.server._daily_totals), ["Ben"])
+
+    def test_sentiment_builds_affect_data(self):
+        with mock.patch.object(User, "get_or_create_affect_df", return_value=None) as get_affect:
+            status, _, _ = self.request("/sentiment")
+
+        get_affect.assert_called_once()
+        self.assertEqual(status, 409)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from background_loader import BackgroundLoader
+from convo import Convo
+from test_convo import write_fb_export
+from conversations.convo_reader import ConvoReader
+from conversations.user import User
+
+
+def build_small_convo(name: str) -> Convo:
+    index = pd.to_datetime([1000, 2000], unit="ms", utc=True).rename("timestamp")
+    msgs_df = pd.DataFrame({"sender_name": ["Raine", name], "text": ["hi", "hello"]}, index=index)
+
+    return Convo(name, ["Raine", name], True, False, msgs_df)
+
+
+class TestBackgroundLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.loader = BackgroundLoader("Raine")
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def fake_load(self, curr_user: User = None, progress_callback=None, fail: bool = False):
+        # Publishes one of three conversations, then blocks until released
+        curr_user.convos = {"Ben": build_small_convo("Ben")}
+        progress_callback(1, 3)
+        self.started.set()
+        self.release.wait(5)
+
+        if fail:
+            raise IOError("Export not found")
+
+        curr_user.convos = {x: build_small_convo(x) for x in ["Ben", "Cat", "Dan"]}
+        curr_user.quarantined_convos["eve_1"] = "ValueError: bad json"
+
+        return curr_user
+
+    def test_partial_results_are_available_while_loading(self):
+        self.assertEqual(self.loader.status(), "Loading ...")
+
+        self.loader.start(self.fake_load)
+        self.assertTrue(self.started.wait(5))
+
+        self.assertEqual(self.loader.status(), "Loading (1 / 3 conversations processed, 1 available)")
+        self.assertListEqual(list(self.loader.user.convos), ["Ben"])
+        self.assertFalse(self.loader.ready.is_set())
+
+        # A second load can't start while one is running
+        with self.assertRaises(RuntimeError):
+            self.loader.start(self.fake_load)
+
+        self.release.set()
+        with mock.patch("builtins.print"):
+            curr_user = self.loader.wait_until_ready()
+
+        self.assertListEqual(sorted(curr_user.convos), ["Ben", "Cat", "Dan"])
+        self.assertEqual(self.loader.status(), "Ready (3 conversations, 1 could not be read (see log))")
+
+    def test_wait_blocks_until_ready(self):
+        self.loader.start(self.fake_load)
+        self.assertTrue(self.started.wait(5))
+
+        waited_users = []
+        waiter = threading.Thread(target=lambda: waited_users.append(self.loader.wait_until_ready()))
+        with mock.patch("builtins.print") as print_mock:
+            waiter.start()
+            waiter.join(0.2)
+            self.assertTrue(waiter.is_alive())
+
+            self.release.set()
+            waiter.join(5)
+
+        self.assertFalse(waiter.is_alive())
+        self.assertIs(waited_users[0], self.loader.user)
+        print_mock.assert_called_once()
+
+    def test_failed_load(self):
+        self.release.set()
+        self.loader.start(self.fake_load, fail=True)
+
+        self.assertIsNone(self.loader.wait_until_ready())
+        self.assertEqual(self.loader.status(), "Loading failed")
+
+        # A user loaded elsewhere (e.g. after ingesting a newer export) replaces the failed load
+        curr_user = User("Raine")
+        curr_user.convos = {"Ben": build_small_convo("Ben")}
+        self.loader.replace_user(curr_user)
+
+        self.assertIs(self.loader.wait_until_ready(), curr_user)
+        self.assertEqual(self.loader.status(), "Ready (1 conversations)")
+
+
+class TestPartialPublication(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        # Name genders need the model, which isn't what's being tested
+        patcher = mock.patch.object(ConvoReader, "assign_name_genders")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_convos_are_published_every_50(self):
+        export_path = os.path.join(self.temp_dir.name, "export")
+        for ii in range(101):
+            write_fb_export(export_path, f"person{ii:03d}_1", ["Raine", f"Person {ii:03d}"], title=f"Person {ii:03d}")
+
+        curr_user = User("Raine")
+        published = []
+        ConvoReader.read_convos("Raine", export_path, curr_user=curr_user,
+                                progress_callback=lambda x, y: published.append((x, y, len(curr_user.convos))))
+
+        self.assertListEqual(published, [(0, 101, 0), (50, 101, 50), (100, 101, 100), (101, 101, 101)])
+
+
+if __name__ == "__main__":
+    unittest.main()
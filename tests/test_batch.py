@@ -0,0 +1,86 @@
+import concurrent.futures
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+import batch
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def write_file(self, relative_path: str, content: str) -> str:
+        file_path = os.path.join(self.temp_dir.name, relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w") as file_obj:
+            file_obj.write(content)
+
+        return file_path
+
+    def test_manifest_fills_optional_columns(self):
+        manifest_path = self.write_file("manifest.csv", "user_name,ig_path,fb_path\n Raine ,,/fb \nBen,/ig,\n")
+        manifest_df = batch.read_manifest(manifest_path)
+
+        self.assertListEqual(manifest_df.columns.tolist(), batch.manifest_cols)
+        self.assertListEqual(manifest_df['user_name'].tolist(), ["Raine", "Ben"])
+        self.assertListEqual(manifest_df['fb_path'].tolist(), ["/fb", None])
+        self.assertTrue(manifest_df['whatsapp_path'].isna().all())
+
+    def test_invalid_manifests_are_rejected(self):
+        # No user_name column, a row without a user name, and a row without any export
+        for content in ["name,fb_path\nRaine,/fb\n", "user_name,fb_path\n,/fb\n",
+                        "user_name,fb_path,ig_path\nRaine,,\n"]:
+            with self.assertRaises(ValueError):
+                batch.read_manifest(self.write_file("manifest.csv", content))
+
+    def test_export_size_counts_every_file(self):
+        self.write_file("fb/inbox/ben_1/message_1.json", "x" * 100)
+        self.write_file("fb/inbox/cat_1/message_1.json", "x" * 50)
+        self.write_file("ig/inbox/ben_1/message_1.json", "x" * 10)
+
+        self.assertEqual(batch.export_size(os.path.join(self.temp_dir.name, "fb"),
+                                           os.path.join(self.temp_dir.name, "ig"), None, "/missing"), 160)
+
+    def test_run_batch_starts_largest_first_and_captures_errors(self):
+        self.write_file("small/message_1.json", "x" * 10)
+        self.write_file("large/message_1.json", "x" * 1000)
+        manifest_path = self.write_file("manifest.csv", f"user_name,fb_path\n"
+                                                        f"Small,{os.path.join(self.temp_dir.name, 'small')}\n"
+                                                        f"Large,{os.path.join(self.temp_dir.name, 'large')}\n"
+                                                        f"Broken,/missing\n")
+
+        def fake_process_export(batch_root, user_name, **kwargs):
+            if user_name == "Broken":
+                raise FileNotFoundError("/missing")
+
+            return {'user_name': user_name, 'conversations': 1, 'quarantined': 0, 'duration_s': 0.1,
+                    'output_dir': batch.user_dirs(batch_root, user_name)[1]}
+
+        batch_root = os.path.join(self.temp_dir.name, "batch")
+
+        # Threads share the patched functions, unlike worker processes
+        with mock.patch.object(batch, "process_export", side_effect=fake_process_export) as process_export, \
+                mock.patch.object(batch, "init_worker"), \
+                mock.patch.object(concurrent.futures, "ProcessPoolExecutor", concurrent.futures.ThreadPoolExecutor):
+            summary_df = batch.run_batch(manifest_path, batch_root, max_workers=1)
+
+        self.assertListEqual([x.kwargs["user_name"] for x in process_export.call_args_list],
+                             ["Large", "Small", "Broken"])
+
+        summary_df = summary_df.set_index('user_name')
+        self.assertEqual(summary_df.loc["Broken", 'error'], "FileNotFoundError: /missing")
+        self.assertTrue(summary_df.loc[["Large", "Small"], 'error'].isna().all())
+        self.assertListEqual(summary_df.loc[["Large", "Small"], 'conversations'].tolist(), [1, 1])
+
+        saved_df = pd.read_csv(os.path.join(batch_root, batch.summary_file_name))
+        self.assertListEqual(sorted(saved_df['user_name']), ["Broken", "Large", "Small"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,320 @@
+import json
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+from convo import *
+from conversations.checkpoints import BuildCheckpoints
+from conversations.convo_reader import ConvoReader
+from conversations.user import User
+
+
+def build_msgs_df(senders: List[str], timestamps_ms: List[int], texts: List[str]) -> pd.DataFrame:
+    index = pd.to_datetime(timestamps_ms, unit="ms", utc=True).rename("timestamp")
+    return pd.DataFrame({"sender_name": senders, "text": texts}, index=index)
+
+
+class TestConvo(unittest.TestCase):
+
+    def setUp(self):
+        msgs_df = build_msgs_df(["Raine", "Ben", "Raine"], [1000, 2000, 3000], ["hi", "hello", "bye"])
+        self.convo = Convo("Ben", ["Raine", "Ben"], True, False, msgs_df)
+
+    def test_append_skips_duplicate_msgs(self):
+        # Newer exports repeat the last stored message, only the genuinely new ones should be added
+        new_df = build_msgs_df(["Raine", "Ben", "Ben", "Ben"], [3000, 3000, 4000, 4000],
+                               ["bye", "bye", "later", "later"])
+
+        self.assertEqual(self.convo.append_msgs(new_df), 2)
+        self.assertEqual(self.convo.msg_count, 5)
+        self.assertEqual(self.convo.last_timestamp_ms, 4000)
+        self.assertTrue(self.convo.msgs_df.index.is_monotonic_increasing)
+        self.assertEqual(self.convo.msgs_df["text_len"].iloc[-1], 5)
+
+    def test_append_same_msgs_is_noop(self):
+        new_df = build_msgs_df(["Raine"], [3000], ["bye"])
+
+        self.assertEqual(self.convo.append_msgs(new_df), 0)
+        self.assertEqual(self.convo.msg_count, 3)
+
+    def test_append_adds_new_speakers(self):
+        new_df = build_msgs_df(["Alice"], [5000], ["hey all"])
+        self.convo.append_msgs(new_df)
+
+        self.assertIn("Alice", self.convo.speakers)
+        self.assertTrue(self.convo.is_group)
+
+    def test_sessions_split_on_gap(self):
+        # All three messages are within seconds of each other
+        self.assertEqual(self.convo.sessions_df.shape[0], 1)
+        self.assertEqual(self.convo.sessions_df['initiator'].iloc[0], "Raine")
+        self.assertTupleEqual(self.convo.sessions_df['participants'].iloc[0], ("Ben", "Raine"))
+
+        sessions_df = self.convo.build_sessions(pd.Timedelta(milliseconds=500))
+        self.assertListEqual(sessions_df['msg_count'].tolist(), [1, 1, 1])
+
+    def test_append_extends_last_session(self):
+        gap_ms = Convo.session_gap.value // 10 ** 6
+        new_df = build_msgs_df(["Ben", "Ben"], [4000, 4000 + 2 * gap_ms], ["again", "much later"])
+        self.convo.append_msgs(new_df)
+
+        self.assertListEqual(self.convo.sessions_df['msg_count'].tolist(), [4, 1])
+        self.assertListEqual(self.convo.sessions_df['char_count'].tolist(), [15, 10])
+
+
+class TestUserSessions(unittest.TestCase):
+
+    def test_sessions_are_combined(self):
+        curr_user = User("Raine")
+        curr_user.convos["Ben"] = Convo("Ben", ["Raine", "Ben"], True, False,
+                                        build_msgs_df(["Raine", "Ben"], [1000, 2000], ["hi", "hello"]))
+        curr_user.convos["Group"] = Convo("Group", ["Raine", "Ben", "Cat"], True, True,
+                                          build_msgs_df(["Cat", "Ben", "Raine"], [1000, 2000, 3000], ["a", "b", "c"]))
+
+        self.assertListEqual(curr_user.get_sessions_df()["convo"].tolist(), ["Ben", "Group"])
+        self.assertListEqual(curr_user.get_sessions_df(no_groupchats=True)["msg_count"].tolist(), [2])
+
+    def test_no_included_convos(self):
+        # Users without conversations, or whose conversations are all excluded, have no sessions
+        curr_user = User("Raine")
+        self.assertEqual(curr_user.get_sessions_df().shape[0], 0)
+
+        curr_user.convos["Group"] = Convo("Group", ["Raine", "Ben", "Cat"], True, True,
+                                          build_msgs_df(["Cat", "Ben", "Raine"], [1000, 2000, 3000], ["a", "b", "c"]))
+        sessions_df = curr_user.get_sessions_df(no_groupchats=True)
+
+        self.assertEqual(sessions_df.shape[0], 0)
+        self.assertListEqual(sessions_df.columns.tolist(), curr_user.get_sessions_df().columns.tolist())
+
+
+def write_fb_export(export_path: str, folder: str, senders: List[str], title: str = "Group"):
+    # One message per sender, a minute apart, written newest first as Facebook does
+    msgs = [{"sender_name": x, "timestamp_ms": 60_000 * (ii + 1), "content": f"m{ii}"} for ii, x in enumerate(senders)]
+    convo_path = os.path.join(export_path, ConvoReader.fb_inbox_path, folder)
+    os.makedirs(convo_path)
+    os.makedirs(os.path.join(export_path, ConvoReader.fb_archive_path), exist_ok=True)
+
+    with open(os.path.join(convo_path, "message_1.json"), "w") as file_obj:
+        json.dump({"participants": [{"name": x} for x in set(senders) if x], "messages": msgs[::-1], "title": title,
+                   "is_still_participant": True}, file_obj)
+
+    return convo_path
+
+
+class TestDeltaIngestion(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        # Name genders need the model, which isn't what's being tested
+        patcher = mock.patch.object(ConvoReader, "assign_name_genders")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unknown_person_keeps_label_across_exports(self):
+        # The sender with an empty name has deleted their account
+        senders = ["Raine", "", "Ben", "", "Raine", "", "Ben", "", "Raine", ""]
+        old_path = write_fb_export(os.path.join(self.temp_dir.name, "old"), "group_1", senders[:6])
+        write_fb_export(os.path.join(self.temp_dir.name, "new"), "group_1", senders)
+
+        curr_user = User("Raine")
+        curr_convo = ConvoReader.extract_single_convo(curr_user, old_path)
+        curr_user.convos[curr_convo.convo_name] = curr_convo
+        curr_user.source_dirs["group_1"] = curr_convo.convo_name
+
+        changed = ConvoReader.read_new_convo_msgs(curr_user, os.path.join(self.temp_dir.name, "new"))
+
+        self.assertListEqual(changed, ["Group"])
+        self.assertEqual(curr_convo.msg_count, 10)
+        self.assertEqual((curr_convo.msgs_df["text"] == "m5").sum(), 1)
+        self.assertListEqual(sorted(curr_convo.speakers), ["Ben", "Raine", "Unknown Person #1"])
+        self.assertEqual(curr_user.unknown_people, 1)
+
+    def test_unknown_person_threshold_counts_stored_msgs(self):
+        # Two messages alone are too few to label an unknown person, but not once the stored messages are included
+        old_path = write_fb_export(os.path.join(self.temp_dir.name, "old"), "group_1", ["Raine", "Ben"])
+        write_fb_export(os.path.join(self.temp_dir.name, "new"), "group_1", ["Raine", "Ben", ""])
+
+        curr_user = User("Raine")
+        curr_convo = ConvoReader.extract_single_convo(curr_user, old_path)
+        curr_user.convos[curr_convo.convo_name] = curr_convo
+        curr_user.source_dirs["group_1"] = curr_convo.convo_name
+
+        ConvoReader.read_new_convo_msgs(curr_user, os.path.join(self.temp_dir.name, "new"))
+
+        self.assertEqual(curr_convo.msg_count, 3)
+        self.assertIn("Unknown Person #1", curr_convo.speakers)
+        self.assertNotIn("", curr_convo.msgs_df["sender_name"].values)
+
+
+class TestCacheVersion(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        # Name genders need the model, which isn't what's being tested
+        patcher = mock.patch.object(ConvoReader, "assign_name_genders")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cache_from_other_version_is_rebuilt(self):
+        export_path = os.path.join(self.temp_dir.name, "export")
+        cache_root = os.path.join(self.temp_dir.name, "cache")
+        write_fb_export(export_path, "group_1", ["Raine", "Ben"])
+
+        ConvoReader.build_cache(export_path, cache_root, "Raine")
+
+        # Simulate a cache pickled before the current attributes existed
+        cache_path = os.path.join(cache_root, ConvoReader.cache_file_name)
+        with open(cache_path, "rb") as file_obj:
+            old_user = pickle.load(file_obj)
+        del old_user.cache_version, old_user.sketches
+        with open(cache_path, "wb") as file_obj:
+            pickle.dump(old_user, file_obj)
+
+        with mock.patch("builtins.print"):
+            curr_user = ConvoReader.load_or_create_cache(export_path, cache_root, "Raine")
+
+        self.assertEqual(curr_user.cache_version, ConvoReader.cache_version)
+        self.assertTrue(hasattr(curr_user, "sketches"))
+        self.assertEqual(curr_user.convos["Group"].msg_count, 2)
+
+
+class TestBuildCheckpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        # Name genders need the model, which isn't what's being tested
+        patcher = mock.patch.object(ConvoReader, "assign_name_genders")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.export_path = os.path.join(self.temp_dir.name, "export")
+        self.cache_root = os.path.join(self.temp_dir.name, "cache")
+        self.convo_paths = [write_fb_export(self.export_path, f"{name.lower()}_1", ["Raine", name], title=name)
+                            for name in ["Ben", "Cat", "Dan"]]
+
+    def test_malformed_convo_is_quarantined(self):
+        with open(os.path.join(self.convo_paths[1], "message_1.json"), "w") as file_obj:
+            file_obj.write('{"participants": [{"name": "Cat"}], "messages": [')
+
+        curr_user = ConvoReader.build_cache(self.export_path, self.cache_root, "Raine")
+
+        self.assertListEqual(sorted(curr_user.convos), ["Ben", "Dan"])
+        self.assertListEqual(list(curr_user.quarantined_convos), [self.convo_paths[1]])
+
+        with open(os.path.join(self.cache_root, ConvoReader.quarantine_file_name)) as file_obj:
+            self.assertDictEqual(json.load(file_obj), curr_user.quarantined_convos)
+
+    def test_interrupted_build_resumes_from_checkpoints(self):
+        extract_single_convo = ConvoReader.extract_single_convo
+
+        # Kill the build while extracting the second conversation
+        with mock.patch.object(ConvoReader, "extract_single_convo",
+                               side_effect=[extract_single_convo(User("Raine"), self.convo_paths[0]),
+                                            KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                ConvoReader.build_cache(self.export_path, self.cache_root, "Raine")
+
+        with mock.patch.object(ConvoReader, "extract_single_convo", wraps=extract_single_convo) as extract:
+            curr_user = ConvoReader.build_cache(self.export_path, self.cache_root, "Raine")
+
+        self.assertListEqual([x.args[1] for x in extract.call_args_list], self.convo_paths[1:])
+        self.assertListEqual(sorted(curr_user.convos), ["Ben", "Cat", "Dan"])
+        self.assertEqual(curr_user.source_dirs[os.path.basename(self.convo_paths[0])], "Ben")
+
+        # Checkpoints are removed once the cache is written
+        self.assertFalse(os.path.exists(os.path.join(self.cache_root, ConvoReader.checkpoint_dir)))
+
+    def test_checkpoints_from_other_inputs_are_discarded(self):
+        checkpoint_dir = os.path.join(self.temp_dir.name, "checkpoints")
+        convo = ConvoReader.extract_single_convo(User("Raine"), self.convo_paths[0])
+
+        build_params = {'user_name': "Raine", 'cache_version': 1}
+        BuildCheckpoints(checkpoint_dir, build_params).save(self.convo_paths[0], convo, 0, 0)
+
+        resumed = BuildCheckpoints(checkpoint_dir, build_params).load(self.convo_paths[0])
+        self.assertEqual(resumed[0].msg_count, 2)
+
+        changed = BuildCheckpoints(checkpoint_dir, dict(build_params, cache_version=2))
+        self.assertIsNone(changed.load(self.convo_paths[0]))
+        self.assertListEqual(os.listdir(checkpoint_dir), [BuildCheckpoints.manifest_file_name])
+
+
+def write_shards(convo_path: str, senders: List[str], timestamps_ms: List[int], shard_size: int, title: str):
+    # Shards are numbered from newest to oldest, and each lists its messages newest first
+    msgs = [{"sender_name": x, "timestamp_ms": y, "content": f"m{y}"} for x, y in zip(senders, timestamps_ms)][::-1]
+    os.makedirs(convo_path)
+
+    for ii, start in enumerate(range(0, len(msgs), shard_size)):
+        with open(os.path.join(convo_path, f"message_{ii + 1}.json"), "w") as file_obj:
+            json.dump({"participants": [{"name": x} for x in sorted(set(senders))],
+                       "messages": msgs[start:start + shard_size], "title": title, "is_still_participant": True},
+                      file_obj)
+
+
+class TestShardedConvo(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_every_shard_and_source_is_merged_in_order(self):
+        # 12 Facebook shards (so message_10 onwards sort after message_9) and 3 Instagram shards, whose messages fall
+        # between the Facebook ones
+        fb_path = os.path.join(self.temp_dir.name, "fb", "ben_1")
+        ig_path = os.path.join(self.temp_dir.name, "ig", "ben_1")
+        fb_timestamps = [60_000 * ii for ii in range(1, 61)]
+        ig_timestamps = [60_000 * ii + 30_000 for ii in range(1, 61, 4)]
+        write_shards(fb_path, ["Raine", "Ben"] * 30, fb_timestamps, 5, "Ben")
+        write_shards(ig_path, ["Ben", "Raine"] * 7 + ["Ben"], ig_timestamps, 6, "Ben")
+
+        # Backups left next to the shards aren't read
+        with open(os.path.join(fb_path, "message_1.json.bak"), "w") as file_obj:
+            file_obj.write("not json")
+
+        with self.assertNoLogs(level="WARNING"):
+            curr_convo = ConvoReader.extract_single_convo(User("Raine"), fb_path, ig_path)
+
+        self.assertEqual(len(os.listdir(fb_path)), 13)
+        self.assertEqual(curr_convo.msg_count, 75)
+        self.assertTrue(curr_convo.msgs_df.index.is_monotonic_increasing)
+        self.assertListEqual(curr_convo.msgs_df["text"].tolist(),
+                             [f"m{x}" for x in sorted(fb_timestamps + ig_timestamps)])
+        self.assertListEqual(curr_convo.msgs_df["source"].iloc[:6].tolist(),
+                             ["Facebook", "Instagram", "Facebook", "Facebook", "Facebook", "Facebook"])
+
+
+class TestPreviewAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        # Four one-to-one conversations of three messages each, all in the same stratum
+        self.curr_user = User("Raine")
+        for name in ["Ben", "Chris", "Dana", "Eli"]:
+            msgs_df = build_msgs_df(["Raine", name, "Raine"], [1000, 2000, 3000], ["hi", "hello", "bye"])
+            self.curr_user.convos[name] = Convo(name, ["Raine", name], True, False, msgs_df)
+
+    def test_totals_are_scaled_by_sample_weights(self):
+        # Half the conversations are sampled, each standing in for two
+        summary_df = self.curr_user.preview_analysis(lambda x: sum(c.msg_count for c in x.convos.values()),
+                                                     fraction=0.5, compare_full=True, totals=True)
+
+        self.assertEqual(summary_df.loc['value', 'estimate'], 12)
+        self.assertEqual(summary_df.loc['value', 'full'], 12)
+        self.assertTrue(summary_df.loc['value', 'within_ci'])
+
+    def test_ratios_are_not_scaled(self):
+        summary_df = self.curr_user.preview_analysis(
+            lambda x: np.mean([c.msg_count for c in x.convos.values()]), fraction=0.5, compare_full=True)
+
+        self.assertEqual(summary_df.loc['value', 'estimate'], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
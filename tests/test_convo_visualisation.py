@@ -1,8 +1,17 @@
 import unittest
 
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
 from convo_visualisation import *
 
 
+def render(fig: plt.Figure) -> np.ndarray:
+    canvas = FigureCanvasAgg(fig)
+    canvas.draw()
+
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+
 class TestConvoVisualisation(unittest.TestCase):
 
     def test_incorrect_shape_msg_time_hist(self):
@@ -17,5 +26,50 @@ class TestConvoVisualisation(unittest.TestCase):
             create_msg_time_hist(df_no_col, "test")
 
 
+class TestFigureTemplates(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.templates = FigureTemplates()
+
+        # The second conversation has different speakers and far fewer messages
+        self.first_hours = pd.DataFrame(rng.integers(50, 500, (24, 2)), columns=["Raine", "Ben"])
+        self.second_hours = pd.DataFrame(rng.integers(0, 10, (24, 2)), columns=["Raine", "Cat"])
+
+    def test_msg_time_hist_has_no_stale_data(self):
+        first_fig = create_msg_time_hist(self.first_hours, "Ben", self.templates)
+        second_fig = create_msg_time_hist(self.second_hours, "Cat", self.templates)
+        template = self.templates.get(MsgTimeHistTemplate, 2)
+
+        self.assertIs(first_fig, second_fig)
+        self.assertListEqual([x.get_text() for x in template.legend.get_texts()], ["Raine", "Cat"])
+        for bars, speaker in zip(template.bars, ["Raine", "Cat"]):
+            self.assertListEqual([x.get_height() for x in bars], self.second_hours[speaker].tolist())
+        self.assertIn("Cat", template.ax.get_title())
+        self.assertAlmostEqual(template.ax.get_ylim()[1], self.second_hours.values.max() * 1.05)
+
+        # The reused figure draws exactly as a newly built one
+        np.testing.assert_array_equal(render(second_fig), render(create_msg_time_hist(self.second_hours, "Cat")))
+
+    def test_layouts_get_their_own_template(self):
+        two_speaker_fig = create_msg_time_hist(self.first_hours, "Ben", self.templates)
+        three_speaker_fig = create_msg_time_hist(self.first_hours.assign(Dan=1), "Group", self.templates)
+
+        self.assertIsNot(two_speaker_fig, three_speaker_fig)
+        self.assertIs(create_msg_time_hist(self.second_hours, "Cat", self.templates), two_speaker_fig)
+
+    def test_timeline_hist_has_no_stale_data(self):
+        def build_msgs_df(speakers: List[str], days: int) -> pd.DataFrame:
+            index = pd.date_range("2021-01-01", periods=days * 2, freq="12h", tz="UTC")
+            return pd.DataFrame({"sender_name": speakers * days, "text_len": np.arange(days * 2)}, index=index)
+
+        create_timeline_hist("Ben", build_msgs_df(["Raine", "Ben"], 300), ["Raine", "Ben"], self.templates)
+        second_msgs_df = build_msgs_df(["Raine", "Cat"], 30)
+        second_fig = create_timeline_hist("Cat", second_msgs_df, ["Raine", "Cat"], self.templates)
+
+        np.testing.assert_array_equal(render(second_fig),
+                                      render(create_timeline_hist("Cat", second_msgs_df, ["Raine", "Cat"])))
+
+
 if __name__ == "__main__":
     unittest.main()
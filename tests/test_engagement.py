@@ -0,0 +1,79 @@
+import unittest
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+import engagement
+from convo import Convo
+
+
+def build_engagement_msgs_df(rng: np.random.Generator, start_ms: int, msg_count: int) -> pd.DataFrame:
+    # Messages a few hours apart on average, so there are several weekly periods
+    timestamps_ms = start_ms + np.cumsum(rng.exponential(6 * 3_600_000, msg_count)).astype(np.int64)
+    index = pd.to_datetime(timestamps_ms, unit="ms", utc=True).rename("timestamp")
+
+    return pd.DataFrame({"sender_name": rng.choice(["Raine", "Ben"], msg_count),
+                         "text": ["x" * x for x in rng.integers(1, 80, msg_count)],
+                         "photos": rng.integers(0, 3, msg_count),
+                         "call_duration": np.where(rng.random(msg_count) < 0.05, rng.integers(0, 3600, msg_count),
+                                                   np.nan),
+                         "share_link": np.where(rng.random(msg_count) < 0.1, "https://a.com", None),
+                         "reactions": [[("Ben", "❤")] if x else [] for x in rng.random(msg_count) < 0.2]},
+                        index=index)
+
+
+class TestEngagement(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.msgs_df = build_engagement_msgs_df(rng, 1_600_000_000_000, 300)
+
+        # The appended messages start in the same period as the last stored message
+        self.new_msgs_df = build_engagement_msgs_df(rng, int(self.msgs_df.index[-1].value // 10 ** 6) + 60_000, 100)
+
+    def build_convo(self, msgs_dfs: List[pd.DataFrame]) -> Convo:
+        return Convo("Ben", ["Raine", "Ben"], True, False, pd.concat(msgs_dfs).copy())
+
+    def test_append_matches_full_build(self):
+        convo = self.build_convo([self.msgs_df])
+        period = pd.Timedelta(convo.engagement_period)
+        self.assertLess(self.new_msgs_df.index[0] - convo.engagement_df.index[-1], period)
+        convo.append_msgs(self.new_msgs_df.copy())
+
+        pd.testing.assert_frame_equal(convo.engagement_df, self.build_convo([self.msgs_df, self.new_msgs_df])
+                                      .engagement_df, check_freq=False)
+
+    def test_instance_weights_override_defaults(self):
+        weights = {'photos': 10.0, 'reactions': 0.0}
+        convo = self.build_convo([self.msgs_df])
+        default_convo = self.build_convo([self.msgs_df])
+
+        convo.build_engagement(weights=weights)
+        convo.append_msgs(self.new_msgs_df.copy())
+        default_convo.append_msgs(self.new_msgs_df.copy())
+
+        # The class default isn't changed, so other conversations keep the default weights
+        self.assertDictEqual(dict(Convo.engagement_weights), {})
+        self.assertDictEqual(default_convo.engagement_weights, {})
+
+        for curr_convo, curr_weights in [(convo, weights), (default_convo, None)]:
+            expected_df = engagement.build_period_scores(curr_convo.msgs_df, curr_convo.engagement_period,
+                                                         curr_weights, curr_convo.reaction_counts)
+            pd.testing.assert_frame_equal(curr_convo.engagement_df, expected_df, check_freq=False)
+
+        # Photos score five times their default, far outweighing the reactions no longer scored
+        self.assertGreater(convo.engagement_df.values.sum(), default_convo.engagement_df.values.sum())
+
+    def test_msg_scores_use_given_weights(self):
+        msgs_df = pd.DataFrame({"text_len": [0, np.e - 1], "photos": [2, 0], "call_duration": [np.nan, np.nan]})
+
+        # Only the overridden weights change, the rest keep their defaults
+        scores = engagement.build_msg_scores(msgs_df, {'msg': 0.0, 'photos': 3.0}, np.array([0, 4]))
+
+        np.testing.assert_allclose(scores, [6.0, engagement.default_weights['text_len'] +
+                                            4 * engagement.default_weights['reactions']])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from convo import Convo
+from hourly_profiles import build_hour_counts, cluster_profiles, describe_profile, normalise_profiles
+from conversations.user import User
+
+
+def build_hours_convo(rng: np.random.Generator, name: str, hours: list, msg_count: int = 200) -> Convo:
+    # Messages on random days, all within the given hours
+    days = rng.integers(0, 365, msg_count) * 24 + rng.choice(hours, msg_count)
+    index = pd.to_datetime(np.sort(days) * 3_600_000 + 1_577_836_800_000, unit="ms", utc=True).rename("timestamp")
+    msgs_df = pd.DataFrame({"sender_name": rng.choice(["Raine", name], msg_count), "text": ["hi"] * msg_count},
+                           index=index)
+
+    return Convo(name, ["Raine", name], True, False, msgs_df)
+
+
+class TestHourlyProfiles(unittest.TestCase):
+
+    def test_hour_counts_per_row(self):
+        hour_counts = build_hour_counts(np.array([0, 23, 23, 5]), np.array([0, 0, 2, 2]), 3)
+
+        self.assertTupleEqual(hour_counts.shape, (3, 24))
+        self.assertListEqual(hour_counts[0, [0, 23]].tolist(), [1, 1])
+        self.assertEqual(hour_counts[1].sum(), 0)
+        self.assertListEqual(hour_counts[2, [5, 23]].tolist(), [1, 1])
+        self.assertEqual(hour_counts.sum(), 4)
+
+    def test_profiles_are_shares_of_msgs(self):
+        hour_counts = np.zeros((2, 24))
+        hour_counts[0, [1, 2]] = [30, 10]
+
+        profiles = normalise_profiles(hour_counts)
+
+        self.assertListEqual(profiles[0, [1, 2]].tolist(), [0.75, 0.25])
+        self.assertEqual(profiles[1].sum(), 0)
+
+    def test_clusters_split_night_and_day(self):
+        profiles = np.zeros((6, 24))
+        profiles[:3, [1, 2, 3]] = 1 / 3
+        profiles[3:, [12, 14]] = 0.5
+        profiles[0, [1, 3]] += [0.1, -0.1]
+
+        labels, centroids = cluster_profiles(profiles, 2)
+
+        self.assertEqual(len(set(labels[:3])), 1)
+        self.assertEqual(len(set(labels[3:])), 1)
+        self.assertNotEqual(labels[0], labels[3])
+        self.assertTupleEqual(centroids.shape, (2, 24))
+        self.assertEqual(describe_profile(centroids[labels[0]]), 'Late Night (peak 1:00)')
+        self.assertEqual(describe_profile(centroids[labels[3]]), 'Afternoon (peak 12:00)')
+
+        # There can't be more clusters than profiles
+        self.assertEqual(cluster_profiles(profiles[:2], 5)[1].shape[0], 2)
+
+
+class TestUserClusteredByHour(unittest.TestCase):
+
+    def test_night_and_day_convos_are_separated(self):
+        rng = np.random.default_rng(0)
+        curr_user = User("Raine")
+        for name, hours in [("Ben", [22, 23, 0, 1, 2]), ("Cat", [23, 0, 1, 2, 3]), ("Dan", list(range(10, 16))),
+                            ("Eve", list(range(11, 17))), ("Fay", list(range(9, 15)))]:
+            curr_user.convos[name] = build_hours_convo(rng, name, hours)
+
+        # Too few messages to be clustered
+        curr_user.convos["Gus"] = build_hours_convo(rng, "Gus", [12], 20)
+
+        clusters = curr_user.get_convos_clustered_by_hour(n_clusters=2)
+
+        self.assertListEqual([sorted(x[1]) for x in clusters], [["Dan", "Eve", "Fay"], ["Ben", "Cat"]])
+        self.assertTrue(clusters[0][0].startswith("Afternoon"))
+        self.assertTrue(clusters[1][0].startswith("Late Night"))
+
+        self.assertListEqual(User("Raine").get_convos_clustered_by_hour(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+from convo import Convo
+from leaderboard import top_k
+from conversations.user import User
+
+
+def build_random_convo(rng: np.random.Generator, name: str, speakers: List[str], msg_count: int) -> Convo:
+    # Gaps of up to a few hours, so conversations have a mix of sessions started by each speaker
+    timestamps_ms = 1_600_000_000_000 + np.cumsum(rng.exponential(20 * 60_000, msg_count)).astype(np.int64)
+    index = pd.to_datetime(timestamps_ms, unit="ms", utc=True).rename("timestamp")
+    senders = rng.choice(speakers, msg_count, p=rng.dirichlet(np.ones(len(speakers))))
+
+    msgs_df = pd.DataFrame({"sender_name": senders,
+                            "text": ["x" * x for x in rng.integers(1, 80, msg_count)],
+                            "photos": rng.integers(0, 2, msg_count),
+                            "reactions": [[(rng.choice(speakers), "❤")] if x else []
+                                          for x in rng.random(msg_count) < 0.1]}, index=index)
+
+    return Convo(name, list(speakers), True, len(speakers) > 2, msgs_df)
+
+
+class TestUserRankings(unittest.TestCase):
+    """
+    The rankings are served from the leaderboard table, and must match computing them from each conversation
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.curr_user = User("Raine")
+
+        for name, speakers, msg_count in [("Ben", ["Raine", "Ben"], 900), ("Cat", ["Raine", "Cat"], 500),
+                                          ("Dan", ["Raine", "Dan"], 150), ("Eve", ["Raine", "Eve"], 700),
+                                          ("Group", ["Raine", "Ben", "Cat"], 1300),
+                                          ("Others", ["Ben", "Cat", "Fay"], 800)]:
+            self.curr_user.convos[name] = build_random_convo(rng, name, speakers, msg_count)
+
+    def included_convos(self, no_groupchats: bool) -> List[Convo]:
+        return [x for x in self.curr_user.convos.values() if not (no_groupchats and x.is_group)]
+
+    def test_msg_count(self):
+        for no_groupchats in [False, True]:
+            expected = sorted([(x.convo_name, x.msg_count) for x in self.included_convos(no_groupchats)],
+                              key=lambda x: x[1], reverse=True)
+
+            self.assertListEqual(self.curr_user.get_convos_ranked_by_msg_count(n=3, no_groupchats=no_groupchats),
+                                 expected[:3])
+            self.assertListEqual(self.curr_user.get_convos_ranked_by_msg_count(n=-1, no_groupchats=no_groupchats),
+                                 expected)
+
+    def test_char_ratio(self):
+        for desc in [True, False]:
+            for no_groupchats, min_msgs in [(True, 200), (False, 200), (False, 50)]:
+                expected = []
+                for convo in self.included_convos(no_groupchats):
+                    if self.curr_user.name in convo.speakers and convo.msg_count > min_msgs * len(convo.speakers):
+                        user_chars = convo.msgs_df[convo.msgs_df["sender_name"] == "Raine"]["text_len"].sum()
+                        others_chars = convo.msgs_df["text_len"].sum() - user_chars
+                        expected.append((convo.convo_name, others_chars / (user_chars * (len(convo.speakers) - 1))))
+
+                expected = sorted(expected, key=lambda x: x[1], reverse=desc)
+                ranked = self.curr_user.get_convos_ranked_by_char_ratio(desc, n=-1, no_groupchats=no_groupchats,
+                                                                        min_msgs=min_msgs)
+
+                self.assertListEqual([x[0] for x in ranked], [x[0] for x in expected])
+                np.testing.assert_allclose([x[1] for x in ranked], [x[1] for x in expected])
+
+        # Dan has too few messages at the default minimum, and the group chats are excluded
+        self.assertListEqual(sorted(x[0] for x in self.curr_user.get_convos_ranked_by_char_ratio(True)),
+                             ["Ben", "Cat", "Eve"])
+
+    def test_engagement(self):
+        for no_groupchats in [False, True]:
+            expected = sorted([(x.convo_name, float(x.engagement_df.values.sum()))
+                               for x in self.included_convos(no_groupchats)], key=lambda x: x[1], reverse=True)
+
+            ranked = self.curr_user.get_convos_ranked_by_engagement(n=-1, no_groupchats=no_groupchats)
+
+            self.assertListEqual([x[0] for x in ranked], [x[0] for x in expected])
+            np.testing.assert_allclose([x[1] for x in ranked], [x[1] for x in expected])
+
+    def test_initiation(self):
+        for desc in [True, False]:
+            for no_groupchats, min_sessions in [(True, 20), (False, 20), (False, 1)]:
+                sessions_df = pd.concat([x.sessions_df.assign(convo=x.convo_name)
+                                         for x in self.included_convos(no_groupchats)], ignore_index=True)
+                sessions_df['user_started'] = sessions_df['initiator'] == "Raine"
+
+                initiation_df = sessions_df.groupby('convo')['user_started'].agg(['mean', 'count'])
+                initiation_df = initiation_df[initiation_df['count'] >= min_sessions]
+                initiation_df = initiation_df.sort_values('mean', ascending=not desc, kind='stable')
+
+                ranked = self.curr_user.get_convos_ranked_by_initiation(desc, n=-1, no_groupchats=no_groupchats,
+                                                                        min_sessions=min_sessions)
+
+                self.assertListEqual([x[0] for x in ranked], initiation_df.index.tolist())
+                np.testing.assert_allclose([x[1] for x in ranked], initiation_df['mean'].values)
+                self.assertListEqual([x[2] for x in ranked], initiation_df['count'].tolist())
+
+    def test_leaderboard_is_rebuilt_when_convos_change(self):
+        convo_totals_df = self.curr_user.get_convo_leaderboard_df()
+        self.assertIs(self.curr_user.get_convo_leaderboard_df(), convo_totals_df)
+
+        self.curr_user.convos = {name: x for name, x in self.curr_user.convos.items() if name != "Group"}
+
+        self.assertEqual(self.curr_user.get_convos_ranked_by_msg_count(n=2), [("Ben", 900), ("Others", 800)])
+        self.assertNotIn("Group", self.curr_user.get_convo_leaderboard_df().index)
+
+
+class TestSenderSummary(unittest.TestCase):
+
+    def test_append_matches_full_build(self):
+        full_convo = build_random_convo(np.random.default_rng(1), "Group", ["Raine", "Ben", "Cat"], 400)
+        full_df = full_convo.msgs_df.drop(columns=["hour_of_day", "text_len"])
+        full_df["reactions"] = [[(x.actor, x.reaction) for x in full_convo.reactions_df[
+            full_convo.reactions_df["msg_idx"] == ii].itertuples()] for ii in range(full_df.shape[0])]
+
+        # Cat only speaks in the appended messages, and some reactions are to appended messages
+        is_first_part = np.arange(full_df.shape[0]) < 250
+        first_df = full_df[is_first_part & (full_df["sender_name"] != "Cat").values]
+        convo = Convo("Group", ["Raine", "Ben"], True, False, first_df.copy())
+        convo.append_msgs(full_df[~is_first_part].copy())
+
+        rebuilt_convo = Convo("Group", ["Raine", "Ben", "Cat"], True, True,
+                              pd.concat([first_df, full_df[~is_first_part]]).copy())
+
+        pd.testing.assert_frame_equal(convo.summary_df.sort_index(), rebuilt_convo.summary_df.sort_index(),
+                                      check_dtype=False)
+        self.assertIn("Cat", convo.summary_df.index)
+
+
+class TestTopK(unittest.TestCase):
+
+    def test_matches_stable_sort(self):
+        items = [("a", 3), ("b", 1), ("c", 3), ("d", 2), ("e", 1)]
+
+        for desc in [True, False]:
+            expected = sorted(items, key=lambda x: x[1], reverse=desc)
+            self.assertListEqual(top_k(items, 3, desc), expected[:3])
+            self.assertListEqual(top_k(iter(items), -1, desc), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
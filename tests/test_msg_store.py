@@ -0,0 +1,55 @@
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from msg_store import MsgStore
+
+
+class TestMsgStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        index = pd.to_datetime([1000, 2000, 3000, 4000], unit="ms", utc=True).rename("timestamp")
+        self.msgs_df = pd.DataFrame({"sender_name": ["Raine", None, "Ben", "Raine"],
+                                     "major_type": [np.nan] * 4,
+                                     "text": ["hi", "hello", None, "bye"],
+                                     "text_len": [2, 5, 0, 3]}, index=index)
+
+        self.store = MsgStore(self.temp_dir.name)
+        self.store.write_convo("Ben", self.msgs_df)
+        self.store.save_manifest()
+
+    def test_null_codes_decode_to_nan(self):
+        # Nulls mustn't be decoded as the last dictionary value, or fail when every value is null
+        result_df = MsgStore(self.temp_dir.name).query(columns=["sender_name", "major_type"])
+
+        self.assertListEqual(result_df["sender_name"].isna().tolist(), [False, True, False, False])
+        self.assertListEqual(result_df["sender_name"].dropna().tolist(), ["Raine", "Ben", "Raine"])
+        self.assertTrue(result_df["major_type"].isna().all())
+
+    def test_filters_accept_generators(self):
+        # Filters are used for every conversation, so a generator mustn't be exhausted by the first one
+        self.store.write_convo("Raine", self.msgs_df)
+
+        result_df = self.store.query(senders=(x for x in ["Raine"]), columns=(x for x in ["text"]))
+
+        self.assertEqual(result_df.shape[0], 4)
+        self.assertListEqual(result_df.columns.tolist(), ["text", "convo"])
+        self.assertListEqual(result_df["convo"].value_counts().sort_index().tolist(), [2, 2])
+
+    def test_matches_in_memory_query(self):
+        start_date = pd.Timestamp(1500, unit="ms", tz="UTC")
+        stored_df = self.store.query(senders=["Raine", "Ben"], start_date=start_date, msg_types=["text"])
+        memory_df = MsgStore.query_in_memory({"Ben": self.msgs_df}, senders=["Raine", "Ben"], start_date=start_date,
+                                             msg_types=["text"])
+
+        self.assertListEqual(stored_df.index.tolist(), memory_df.index.tolist())
+        self.assertListEqual(stored_df["text"].tolist(), memory_df["text"].tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
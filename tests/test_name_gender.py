@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from name_gender import NameGenderCache
+
+
+class TestNameGenderCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.table_path = os.path.join(self.temp_dir.name, "model_cache", "name_pgf.csv")
+
+        # Scores names by their length, standing in for the model
+        self.model = mock.Mock()
+        self.model.get_pgf.side_effect = lambda names: np.array([np.nan if " " in x else len(x) / 10 for x in names])
+
+        patcher = mock.patch.object(NameGenderCache, "get_model", return_value=self.model)
+        self.get_model = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached_names_skip_the_model(self):
+        NameGenderCache(self.table_path).get_pgfs(["Ben", "Cat"])
+        self.get_model.reset_mock()
+
+        pgfs = NameGenderCache(self.table_path).get_pgfs(["Cat", "Ben", "Cat"])
+
+        self.assertDictEqual(pgfs, {"Ben": 0.3, "Cat": 0.3})
+        self.get_model.assert_not_called()
+
+    def test_only_uncached_names_are_scored_in_one_batch(self):
+        name_cache = NameGenderCache(self.table_path)
+        name_cache.get_pgfs(["Ben"])
+
+        pgfs = name_cache.get_pgfs(["Ben", "Alice", "Cat", "Alice"])
+
+        self.assertListEqual([x.args[0] for x in self.model.get_pgf.call_args_list], [["Ben"], ["Alice", "Cat"]])
+        self.assertDictEqual(pgfs, {"Ben": 0.3, "Alice": 0.5, "Cat": 0.3})
+
+    def test_unscorable_names_round_trip(self):
+        # Group titles can't be scored, and names which read as missing values must stay names
+        NameGenderCache(self.table_path).get_pgfs(["The Group", "Nan", "NULL", "Ben"])
+
+        name_cache = NameGenderCache(self.table_path)
+        pgfs = name_cache.get_pgfs(["The Group", "Nan", "NULL", "Ben"])
+
+        self.assertTrue(np.isnan(pgfs["The Group"]))
+        self.assertDictEqual({key: val for key, val in pgfs.items() if key != "The Group"},
+                             {"Nan": 0.3, "NULL": 0.4, "Ben": 0.3})
+        self.assertEqual(self.model.get_pgf.call_count, 1)
+
+    def test_save_keeps_names_saved_by_other_workers(self):
+        # Both workers read the table before either scores a new name
+        first_worker, second_worker = NameGenderCache(self.table_path), NameGenderCache(self.table_path)
+        first_worker.get_pgfs(["Ben"])
+        second_worker.get_pgfs(["Alice"])
+
+        self.assertDictEqual(NameGenderCache(self.table_path).pgfs, {"Ben": 0.3, "Alice": 0.5})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import near_duplicates
+from convo import Convo
+from near_duplicates import build_signatures, estimate_similarity, find_duplicate_groups
+from conversations.user import User
+
+chain_msg = "forward this message to ten friends within the hour or you will have bad luck for seven years"
+
+
+class TestNearDuplicates(unittest.TestCase):
+
+    def test_similar_texts_have_similar_signatures(self):
+        signatures = build_signatures(np.array([chain_msg, chain_msg + "!!", "completely unrelated text about dinner"]))
+
+        self.assertEqual(signatures.shape, (3, near_duplicates.num_perm))
+        self.assertGreater(estimate_similarity(signatures[[0]], signatures[[1]])[0], 0.8)
+        self.assertLess(estimate_similarity(signatures[[0]], signatures[[2]])[0], 0.2)
+
+    def test_collisions_between_similar_messages_dont_hide_them(self):
+        # Messages 0 and 17 are identical, and every band they share is also shared with one unrelated message which
+        # sorts between them, so they are never neighbours in any band's sort order
+        rng = np.random.default_rng(0)
+        signatures = rng.integers(0, 2 ** 32, (18, near_duplicates.num_perm), dtype=np.uint32)
+        signatures[17] = signatures[0]
+        for band in range(near_duplicates.bands):
+            band_cols = slice(band * near_duplicates.rows_per_band, (band + 1) * near_duplicates.rows_per_band)
+            signatures[band + 1, band_cols] = signatures[0, band_cols]
+
+        labels = find_duplicate_groups(signatures)
+
+        self.assertEqual(labels[0], labels[17])
+        self.assertNotEqual(labels[0], -1)
+        self.assertTrue((labels[1:17] == -1).all())
+
+    def test_large_buckets_are_compared_with_their_first_message(self):
+        signatures = np.repeat(build_signatures(np.array([chain_msg])), near_duplicates.max_pairwise_bucket * 3, axis=0)
+
+        self.assertTrue((find_duplicate_groups(signatures) == 0).all())
+        self.assertEqual(find_duplicate_groups(signatures[:0]).shape[0], 0)
+
+
+class TestUserNearDuplicates(unittest.TestCase):
+
+    def test_edited_chain_message_is_one_group(self):
+        edits = [chain_msg, chain_msg.upper(), "hey! " + chain_msg, chain_msg.replace("ten", "10"), chain_msg + " x"]
+        unrelated = ["are we still going to the cinema on friday night?", "i left my umbrella in your car yesterday",
+                     "the train is delayed by another twenty minutes", "happy birthday, hope you have a lovely day",
+                     "can you send me the photos from the wedding?"]
+
+        curr_user = User("Raine")
+        for ii, name in enumerate(["Ben", "Cat", "Dan", "Eve", "Fay"]):
+            index = pd.to_datetime([1000 * ii, 1000 * ii + 500], unit="ms", utc=True).rename("timestamp")
+            msgs_df = pd.DataFrame({"sender_name": [name, "Raine"], "text": [edits[ii], unrelated[ii]]},
+                                   index=index)
+            curr_user.convos[name] = Convo(name, ["Raine", name], True, False, msgs_df)
+
+        duplicates_df = curr_user.get_near_duplicate_msgs()
+
+        self.assertListEqual(duplicates_df["group"].unique().tolist(), [1])
+        self.assertListEqual(duplicates_df["convo"].tolist(), ["Ben", "Cat", "Dan", "Eve", "Fay"])
+        self.assertListEqual(duplicates_df["text"].tolist(), edits)
+
+        # The unrelated messages aren't grouped with anything
+        signatures = np.concatenate([x.msg_signatures for x in curr_user.convos.values()])
+        labels = find_duplicate_groups(signatures)
+        self.assertTrue((labels[1::2] == -1).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import io
+import os
+import tempfile
+import unittest
+
+import matplotlib.pyplot as plt
+import pandas as pd
+from PIL import Image
+
+from output_sink import OutputSink, read_indexed_figure
+
+# Tar headers need an extra block for names over 100 characters, which the data offsets must account for
+long_folder = "a_conversation_with_a_very_long_name_" * 3
+
+
+def build_figure(value: int) -> plt.Figure:
+    fig = plt.figure(figsize=(2, 2))
+    fig.gca().bar([0, 1], [value, 1])
+    plt.close(fig)
+
+    return fig
+
+
+class TestOutputSink(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def write_run(self, mode: str, image_format: str = 'png') -> str:
+        output_root = os.path.join(self.temp_dir.name, mode)
+
+        with OutputSink(output_root, "Bars", mode=mode, image_format=image_format) as sink:
+            for ii, (folder, label) in enumerate([("ben", "Ben"), (long_folder, "Long"), ("cat", "Cat")]):
+                sink.add_figure(build_figure(ii + 2), folder, "Bar Chart", label)
+            sink.add_figure(build_figure(9), "cat", "Other Chart", "Cat")
+
+        return os.path.join(output_root, "Bars Index.csv")
+
+    def test_containers_match_loose_files(self):
+        files_index_path = self.write_run('files')
+
+        for mode in ['zip', 'tar']:
+            index_path = self.write_run(mode)
+            index_df = pd.read_csv(index_path)
+
+            self.assertListEqual(index_df['label'].tolist(), ["Ben", "Long", "Cat", "Cat"])
+            self.assertListEqual(index_df['location'].tolist()[:2],
+                                 ["ben/Bar Chart.png", f"{long_folder}/Bar Chart.png"])
+
+            for label, file_name in [("Ben", None), ("Long", None), ("Cat", "Bar Chart.png"),
+                                     ("Cat", "Other Chart.png")]:
+                data = read_indexed_figure(index_path, label, file_name)
+
+                self.assertEqual(data, read_indexed_figure(files_index_path, label, file_name))
+                self.assertEqual(Image.open(io.BytesIO(data)).size, (200, 200))
+
+            with self.assertRaises(KeyError):
+                read_indexed_figure(index_path, "Nobody")
+
+    def test_tar_offsets_point_at_each_image(self):
+        index_path = self.write_run('tar', image_format='jpeg')
+        index_df = pd.read_csv(index_path)
+
+        with open(os.path.join(self.temp_dir.name, "tar", "Bars.tar"), 'rb') as file_obj:
+            tar_data = file_obj.read()
+
+        for offset, size in zip(index_df['offset'].astype(int), index_df['size'].astype(int)):
+            # Every JPEG starts and ends with its markers
+            self.assertEqual(tar_data[offset:offset + 2], b"\xff\xd8")
+            self.assertEqual(tar_data[offset + size - 2:offset + size], b"\xff\xd9")
+
+    def test_pdf_pages_are_indexed(self):
+        index_path = self.write_run('pdf')
+        index_df = pd.read_csv(index_path)
+
+        self.assertListEqual(index_df['location'].tolist(), ["page 1", "page 2", "page 3", "page 4"])
+        self.assertListEqual(index_df['file_name'].tolist(), ["Bar Chart"] * 3 + ["Other Chart"])
+
+        with open(os.path.join(self.temp_dir.name, "pdf", "Bars.pdf"), 'rb') as file_obj:
+            self.assertIn(b"/Count 4", file_obj.read())
+
+        # Pages aren't stored as images
+        with self.assertRaises(KeyError):
+            read_indexed_figure(index_path, "Ben")
+
+
+if __name__ == "__main__":
+    unittest.main()
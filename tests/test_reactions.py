@@ -0,0 +1,37 @@
+import unittest
+
+import pandas as pd
+
+from conversations.user import User
+
+
+class TestUserReactions(unittest.TestCase):
+
+    def test_reactions_table_is_empty_without_convos(self):
+        # e.g. an empty preview, or a small export where every conversation was skipped
+        curr_user = User("Raine")
+
+        self.assertListEqual(curr_user.get_or_create_reactions_df().columns.tolist(),
+                             ['convo', 'actor', 'recipient', 'reaction'])
+        self.assertListEqual(curr_user.get_top_reaction_pairs(), [])
+
+    def test_reaction_distribution_follows_actors(self):
+        curr_user = User("Raine")
+        people = ['Alice', 'Bob', 'Carol']
+        curr_user._reactions_df = pd.DataFrame({
+            'convo': pd.Categorical(['Group'] * 4),
+            'actor': pd.Categorical(['Alice', 'Carol', 'Carol', 'Bob'], categories=people),
+            'recipient': pd.Categorical(['Bob', 'Alice', 'Bob', 'Alice'], categories=people),
+            'reaction': pd.Categorical(['❤', '😆', '😆', '❤'])},
+            index=pd.date_range("2020-01-01", periods=4, freq='h', tz='UTC'))
+
+        # A generator is only iterated once, and rows follow its order rather than the order of the people
+        distribution_df = curr_user.get_reaction_distribution(actors=(x for x in ['Carol', 'Zed', 'Alice']))
+
+        self.assertListEqual(distribution_df.index.tolist(), ['Carol', 'Alice'])
+        self.assertListEqual(distribution_df.loc['Carol'].tolist(), [2, 0])
+        self.assertListEqual(distribution_df.loc['Alice'].tolist(), [0, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from response_times import *
+from conversations.user import User
+
+
+class TestResponseTimes(unittest.TestCase):
+
+    def setUp(self):
+        # Two conversations: A, A, B, A | B, A
+        self.timestamps_ns = np.array([0, 10, 40, 100, 0, 30], dtype=np.int64) * NS_PER_S
+        self.sender_codes = np.array([0, 0, 1, 0, 1, 0])
+        self.convo_codes = np.array([0, 0, 0, 0, 1, 1])
+
+    def test_replies_dont_cross_conversations(self):
+        reply_df = build_reply_df(self.timestamps_ns, self.sender_codes, self.convo_codes)
+
+        self.assertListEqual(reply_df['msg_idx'].tolist(), [2, 3, 5])
+        self.assertListEqual(reply_df['latency_s'].tolist(), [30, 60, 30])
+        self.assertListEqual(reply_df['replied_to'].tolist(), [0, 1, 1])
+
+    def test_max_latency_excludes_long_gaps(self):
+        reply_df = build_reply_df(self.timestamps_ns, self.sender_codes, self.convo_codes, pd.Timedelta(seconds=45))
+
+        self.assertListEqual(reply_df['msg_idx'].tolist(), [2, 5])
+
+    def test_turns(self):
+        turn_df = build_turn_df(self.timestamps_ns, self.sender_codes, self.convo_codes)
+
+        self.assertListEqual(turn_df['msg_count'].tolist(), [2, 1, 1, 1, 1])
+        self.assertListEqual(turn_df['duration_s'].tolist(), [10, 0, 0, 0, 0])
+
+    def test_mismatched_lengths(self):
+        with self.assertRaises(ValueError):
+            build_reply_df(self.timestamps_ns, self.sender_codes[:-1], self.convo_codes)
+
+
+class TestUserWithoutConvos(unittest.TestCase):
+
+    def test_reply_table_is_empty(self):
+        # e.g. an empty preview, or a small export where every conversation was skipped
+        curr_user = User("Raine")
+
+        self.assertListEqual(curr_user.get_or_create_reply_df().columns.tolist(),
+                             ['msg_idx', 'convo', 'sender', 'replied_to', 'latency_s'])
+
+        self.assertListEqual(curr_user.get_convos_ranked_by_reply_time(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+from convo import Convo
+from shares import build_shares_df, parse_links
+from conversations.user import User
+
+
+def build_link_msgs_df(senders: List[str], timestamps_ms: List[int], links: List[str]) -> pd.DataFrame:
+    index = pd.to_datetime(timestamps_ms, unit="ms", utc=True).rename("timestamp")
+    return pd.DataFrame({"sender_name": senders, "text": ["look"] * len(senders), "share_link": links}, index=index)
+
+
+class TestParseLinks(unittest.TestCase):
+
+    def test_links_are_normalised(self):
+        parsed_df = parse_links(pd.Series([
+            "https://www.youtube.com/watch?v=abc&utm_source=share&si=xyz",
+            "youtube.com/watch?v=abc",
+            "http://Example.com:80/news/#top",
+            "https://example.com:8080/a/b/?fbclid=123",
+        ]))
+
+        self.assertListEqual(parsed_df["url"].tolist(), ["youtube.com/watch?v=abc", "youtube.com/watch?v=abc",
+                                                         "example.com/news", "example.com:8080/a/b"])
+        self.assertListEqual(parsed_df["domain"].tolist(), ["youtube.com", "youtube.com", "example.com", "example.com"])
+        self.assertListEqual(parsed_df["path"].tolist(), ["/watch", "/watch", "/news", "/a/b"])
+
+    def test_only_tracking_params_are_removed(self):
+        parsed_df = parse_links(pd.Series(["https://shop.com/item?id=7&utm_medium=social&size=m&gclid=x"]))
+
+        self.assertEqual(parsed_df["url"].iloc[0], "shop.com/item?id=7&size=m")
+
+    def test_non_links_are_nan(self):
+        links = pd.Series([np.nan, "not a link", "https://bbc.co.uk"], index=[10, 11, 12])
+        parsed_df = parse_links(links)
+
+        self.assertListEqual(parsed_df.index.tolist(), [10, 11, 12])
+        self.assertTrue(parsed_df.iloc[:2].isna().all(axis=None))
+        self.assertEqual(parsed_df.loc[12, "url"], "bbc.co.uk")
+
+    def test_shares_reference_msg_positions(self):
+        msgs_df = build_link_msgs_df(["Raine", "Ben", "Ben"], [1000, 2000, 3000],
+                                     [np.nan, "https://a.com/x", "no link here"])
+        shares_df = build_shares_df(msgs_df)
+
+        self.assertListEqual(shares_df["msg_idx"].tolist(), [1])
+        self.assertListEqual(shares_df["domain"].astype(str).tolist(), ["a.com"])
+
+
+class TestUserShares(unittest.TestCase):
+
+    def setUp(self):
+        self.curr_user = User("Raine")
+
+        ben_df = build_link_msgs_df(["Raine", "Ben", "Raine"], [1000, 2000, 3000],
+                                    ["https://b.com/1", "https://www.a.com/1", "https://a.com/1?utm_source=x"])
+        cat_df = build_link_msgs_df(["Cat", "Cat"], [1500, 2500], ["https://a.com/2", "https://c.com/1"])
+
+        self.curr_user.convos["Ben"] = Convo("Ben", ["Raine", "Ben"], True, False, ben_df)
+        self.curr_user.convos["Cat"] = Convo("Cat", ["Raine", "Cat"], True, False, cat_df)
+
+    def test_domain_shares_are_a_contiguous_time_ordered_slice(self):
+        domain_df = self.curr_user.get_domain_shares("A.com")
+
+        self.assertListEqual(domain_df["url"].astype(str).tolist(), ["a.com/2", "a.com/1", "a.com/1"])
+        self.assertListEqual(domain_df["convo"].astype(str).tolist(), ["Cat", "Ben", "Ben"])
+        self.assertTrue(domain_df.index.is_monotonic_increasing)
+
+        self.assertListEqual(self.curr_user.get_domain_shares("c.com")["sender"].astype(str).tolist(), ["Cat"])
+        self.assertEqual(self.curr_user.get_domain_shares("missing.com").shape[0], 0)
+
+    def test_shares_table_is_empty_without_convos(self):
+        curr_user = User("Raine")
+
+        self.assertListEqual(curr_user.get_or_create_shares_df().columns.tolist(),
+                             ['convo', 'sender', 'domain', 'url', 'path', 'title'])
+        self.assertEqual(curr_user.get_top_shared_links().shape[0], 0)
+        self.assertEqual(curr_user.get_domain_shares("a.com").shape[0], 0)
+
+    def test_top_shared_links_match_reshares(self):
+        links_df = self.curr_user.get_top_shared_links()
+
+        self.assertListEqual(links_df["url"].astype(str).tolist(), ["a.com/1"])
+        self.assertListEqual(links_df[["shares", "senders"]].values.tolist(), [[2, 2]])
+        self.assertEqual(links_df["first_sender"].iloc[0], "Ben")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from sketches import HeavyHitters, HyperLogLog, OverviewSketches, TDigest
+
+
+class TestSketches(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_distinct_count_is_within_three_standard_errors(self):
+        hll = HyperLogLog()
+        values = np.arange(100_000)
+
+        # Each value is seen twice, in batches, so repeats mustn't be counted
+        for batch in np.array_split(np.concatenate([values, values]), 20):
+            hll.add(batch)
+
+        std_error = 1.04 / np.sqrt(hll.registers.shape[0])
+        self.assertLess(abs(hll.count() / values.shape[0] - 1), 3 * std_error)
+
+    def test_merged_distinct_counts_match_a_single_sketch(self):
+        first, second, combined = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        first.add(np.arange(0, 6000))
+        second.add(np.arange(4000, 10_000))
+        combined.add(np.arange(0, 10_000))
+
+        first.merge(second)
+
+        self.assertEqual(first.count(), combined.count())
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_quantiles_match_numpy(self):
+        values = self.rng.lognormal(3, 1, 100_000)
+        digest = TDigest()
+        for batch in np.array_split(values, 100):
+            digest.add(batch)
+
+        self.assertEqual(digest.count, values.shape[0])
+        self.assertLess(digest.weights.shape[0], 2 * digest.compression)
+
+        for q, tolerance in [(0.5, 0.01), (0.99, 0.02)]:
+            self.assertAlmostEqual(digest.quantile(q) / np.quantile(values, q), 1, delta=tolerance)
+
+        self.assertEqual(digest.quantile(0), values.min())
+        self.assertEqual(digest.quantile(1), values.max())
+
+    def test_merged_quantiles_match_numpy(self):
+        values = self.rng.exponential(60, 20_000)
+        first, second = TDigest(), TDigest()
+        first.add(values[:5000])
+        second.add(values[5000:])
+
+        first.merge(second)
+        first.merge(TDigest())
+
+        self.assertEqual(first.count, values.shape[0])
+        np.testing.assert_allclose(first.quantile([0.5, 0.99]), np.quantile(values, [0.5, 0.99]), rtol=0.02)
+        self.assertTrue(np.isnan(TDigest().quantile(0.5)))
+
+    def test_merged_counts_are_within_the_undercount_bound(self):
+        items = self.rng.zipf(1.5, 50_000).astype(str)
+        first, second = HeavyHitters(capacity=20), HeavyHitters(capacity=20)
+        for batch in np.array_split(items[:30_000], 10):
+            first.add(batch)
+        second.add(items[30_000:])
+
+        first.merge(second)
+
+        true_counts = pd.Series(items).value_counts()
+        estimates = first.counts.reindex(true_counts.index, fill_value=0)
+        max_undercount = first.total / (first.capacity + 1)
+
+        self.assertEqual(first.total, items.shape[0])
+        self.assertLessEqual(first.counts.shape[0], first.capacity)
+        self.assertTrue((estimates <= true_counts).all())
+        self.assertTrue((true_counts - estimates <= max_undercount).all())
+
+        # Anything more frequent than the bound is kept, in order of frequency
+        frequent = true_counts[true_counts > max_undercount].index
+        self.assertTrue(frequent.isin(first.counts.index).all())
+        self.assertListEqual([x for x, _ in first.top(3)], true_counts.index[:3].tolist())
+
+    def test_summary_without_messages(self):
+        summary = OverviewSketches().summary()
+
+        self.assertIsNone(summary['first_message'])
+        self.assertEqual(summary['distinct_senders'], 0)
+        self.assertListEqual(summary['top_words'], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from convo import Convo
+from social_graph import build_co_membership, build_incidence_matrix, label_propagation, pagerank, write_graphml
+from conversations.user import User
+
+
+def build_adjacency(n_nodes: int, edges: list) -> scipy.sparse.csr_matrix:
+    rows, cols, weights = zip(*edges)
+    upper = scipy.sparse.coo_matrix((weights, (rows, cols)), shape=(n_nodes, n_nodes))
+
+    return (upper + upper.T).tocsr()
+
+
+class TestSocialGraph(unittest.TestCase):
+
+    def setUp(self):
+        # Two triangles joined by a single weak edge
+        self.two_cliques = build_adjacency(6, [(0, 1, 3), (0, 2, 3), (1, 2, 3), (3, 4, 3), (3, 5, 3), (4, 5, 3),
+                                               (2, 3, 0.5)])
+
+    def test_co_membership_counts_shared_convos(self):
+        # People 0 and 1 share two conversations, 1 and 2 share one, and person 3 is alone
+        incidence = build_incidence_matrix(np.array([0, 1, 0, 1, 2, 1, 3]), np.array([0, 0, 1, 1, 1, 1, 2]), (4, 3))
+        co_membership = build_co_membership(incidence).toarray()
+
+        self.assertListEqual(co_membership.tolist(), [[0, 2, 1, 0], [2, 0, 1, 0], [1, 1, 0, 0], [0, 0, 0, 0]])
+
+    def test_pagerank_sums_to_one_with_dangling_nodes(self):
+        # Node 3 has no links, and node 0 is linked to by everyone else
+        adjacency = scipy.sparse.csr_matrix(np.array([[0, 1, 0, 0], [1, 0, 0, 0], [1, 0, 0, 0], [0, 0, 0, 0]],
+                                                     dtype=float))
+        ranks = pagerank(adjacency)
+
+        self.assertAlmostEqual(ranks.sum(), 1)
+        self.assertEqual(np.argmax(ranks), 0)
+        self.assertAlmostEqual(ranks[2], ranks[3])
+
+    def test_pagerank_of_symmetric_cliques(self):
+        ranks = pagerank(self.two_cliques)
+
+        self.assertAlmostEqual(ranks.sum(), 1)
+        self.assertAlmostEqual(ranks[2], ranks[3])
+        self.assertGreater(ranks[2], ranks[0])
+
+    def test_label_propagation_finds_two_cliques(self):
+        labels = label_propagation(self.two_cliques)
+
+        self.assertEqual(len(set(labels[:3])), 1)
+        self.assertEqual(len(set(labels[3:])), 1)
+        self.assertNotEqual(labels[0], labels[3])
+
+    def test_label_propagation_without_edges(self):
+        labels = label_propagation(scipy.sparse.csr_matrix((3, 3)))
+
+        self.assertListEqual(labels.tolist(), [0, 1, 2])
+        self.assertEqual(label_propagation(scipy.sparse.csr_matrix((0, 0))).shape[0], 0)
+
+    def test_graphml_round_trips(self):
+        nodes_df = pd.DataFrame({'pagerank': [0.6, 0.4], 'community': [0, 1]}, index=['A & B', '"C"'])
+        edges_df = pd.DataFrame({'source': ['A & B'], 'target': ['"C"'], 'replies': [3]})
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, 'graph.graphml')
+            write_graphml(file_path, nodes_df, edges_df)
+            root = ElementTree.parse(file_path).getroot()
+
+        ns = {'g': 'http://graphml.graphdrawing.org/xmlns'}
+        keys = {x.get('id'): (x.get('attr.name'), x.get('attr.type')) for x in root.findall('g:key', ns)}
+        self.assertDictEqual(keys, {'n0': ('pagerank', 'double'), 'n1': ('community', 'long'),
+                                    'e0': ('replies', 'long')})
+
+        nodes = root.findall('g:graph/g:node', ns)
+        self.assertListEqual([x.get('id') for x in nodes], ['A & B', '"C"'])
+        self.assertListEqual([x.text for x in nodes[1]], ['0.4', '1'])
+
+        edge = root.find('g:graph/g:edge', ns)
+        self.assertTupleEqual((edge.get('source'), edge.get('target'), edge[0].text), ('A & B', '"C"', '3'))
+
+
+class TestUserSocialGraph(unittest.TestCase):
+
+    def test_one_to_one_convos_only(self):
+        # Excluding yourself, people who only have one-to-one conversations with you have no links
+        curr_user = User("Raine")
+        for name in ["Ben", "Cat"]:
+            index = pd.to_datetime([1000, 2000, 3000], unit="ms", utc=True).rename("timestamp")
+            msgs_df = pd.DataFrame({"sender_name": ["Raine", name, "Raine"], "text": ["hi", "hello", "bye"]},
+                                   index=index)
+            curr_user.convos[name] = Convo(name, ["Raine", name], True, False, msgs_df)
+
+        nodes_df, edges_df = curr_user.get_social_graph()
+
+        self.assertListEqual(sorted(nodes_df.index), ["Ben", "Cat"])
+        self.assertListEqual(sorted(nodes_df['community']), [0, 1])
+        self.assertEqual(edges_df.shape[0], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import json
+import os
+import tempfile
+import unittest
+from typing import *
+from unittest import mock
+
+import pandas as pd
+
+from source_readers import InstagramReader, WhatsAppReader, build_msgs_df, facebook_reader, instagram_reader
+from conversations.convo_reader import ConvoReader
+from conversations.user import User
+
+
+def write_chat(file_path: str, lines: List[str]):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as file_obj:
+        file_obj.write("\n".join(lines) + "\n")
+
+    return file_path
+
+
+def write_meta_shards(convo_path: str, shards: List[List[dict]], title: str, participants: List[str]):
+    # Shards are numbered from the newest, and list their messages newest first
+    os.makedirs(convo_path)
+    for ii, shard_msgs in enumerate(shards):
+        with open(os.path.join(convo_path, f"message_{ii + 1}.json"), "w") as file_obj:
+            json.dump({"participants": [{"name": x} for x in participants], "messages": shard_msgs[::-1],
+                       "title": title, "is_still_participant": True}, file_obj)
+
+
+class TestMetaExportReaders(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_instagram_fields(self):
+        # Text is UTF-8 escaped as latin-1, as in the export
+        ig_path = os.path.join(self.temp_dir.name, "ben_1")
+        write_meta_shards(ig_path, [[
+            {"sender_name": "ben", "timestamp_ms": 1000, "content": "caf\u00c3\u00a9",
+             "reactions": [{"actor": "raine", "reaction": "\u00e2\u009d\u00a4"}]},
+            {"sender_name": "raine", "timestamp_ms": 2000, "photos": [{"uri": "a"}, {"uri": "b"}]},
+            {"sender_name": "ben", "timestamp_ms": 3000, "share": {"link": "https://a.com", "share_text": "post"}},
+        ]], "ben", ["raine", "ben"])
+
+        msgs_df = build_msgs_df(instagram_reader.read_batches(ig_path), InstagramReader.source_name)
+
+        self.assertListEqual(msgs_df["text"].tolist(), ["café", "nan", "nan"])
+        self.assertListEqual(msgs_df["photos"].tolist(), [0, 2, 0])
+        self.assertEqual(msgs_df["share_link"].iloc[2], "https://a.com")
+        self.assertListEqual(msgs_df["reactions"].tolist()[0], [("raine", "❤")])
+        self.assertListEqual(msgs_df["major_type"].tolist(), ["Generic"] * 3)
+        self.assertTupleEqual(instagram_reader.read_convo_info(ig_path), ("ben", True))
+
+    def test_shards_read_in_order_and_header_reused(self):
+        fb_path = os.path.join(self.temp_dir.name, "ben_1")
+        msgs = [{"sender_name": "Ben", "timestamp_ms": 1000 * ii, "content": f"m{ii}"} for ii in range(1, 8)]
+        write_meta_shards(fb_path, [msgs[4:], msgs[2:4], msgs[:2]], "Ben", ["Raine", "Ben"])
+
+        with mock.patch.object(json, "load", wraps=json.load) as load:
+            batches = list(facebook_reader.read_batches(fb_path))
+            participants = facebook_reader.read_participants(fb_path)
+
+        self.assertListEqual([x["text"].tolist() for x in batches], [["m1", "m2"], ["m3", "m4"], ["m5", "m6", "m7"]])
+        self.assertListEqual(participants, ["Raine", "Ben"])
+        self.assertEqual(load.call_count, 3)
+
+    def test_delta_stops_at_older_shard(self):
+        fb_path = os.path.join(self.temp_dir.name, "ben_1")
+        msgs = [{"sender_name": "Ben", "timestamp_ms": 1000 * ii, "content": f"m{ii}"} for ii in range(1, 5)]
+        write_meta_shards(fb_path, [msgs[2:], msgs[1:2], msgs[:1]], "Ben", ["Raine", "Ben"])
+
+        # The second shard is entirely older, so the oldest shard (which would fail) isn't read
+        with open(os.path.join(fb_path, "message_3.json"), "w") as file_obj:
+            file_obj.write("not json")
+
+        msgs_df = build_msgs_df(facebook_reader.read_batches(fb_path, since_ms=3000), "Facebook")
+
+        self.assertListEqual(msgs_df["text"].tolist(), ["m3", "m4"])
+
+    def test_instagram_linked_after_reading(self):
+        fb_path = os.path.join(self.temp_dir.name, "fb", "ben_1")
+        ig_path = os.path.join(self.temp_dir.name, "ig", "ben_1")
+        write_meta_shards(fb_path, [[{"sender_name": "Ben", "timestamp_ms": 1000, "content": "fb1"},
+                                     {"sender_name": "Raine", "timestamp_ms": 3000, "content": "fb2"}]],
+                          "Ben", ["Raine", "Ben"])
+        write_meta_shards(ig_path, [[{"sender_name": "ben_ig", "timestamp_ms": 2000, "content": "ig1"},
+                                     {"sender_name": "Raine", "timestamp_ms": 4000, "content": "ig2"}]],
+                          "ben_ig", ["Raine", "ben_ig"])
+
+        msgs_df, is_active, title, convo_persons = ConvoReader.extract_convo_msgs(User("Raine"), fb_path, ig_path)
+
+        self.assertEqual(title, "Ben")
+        self.assertListEqual(msgs_df["text"].tolist(), ["fb1", "ig1", "fb2", "ig2"])
+        self.assertListEqual(msgs_df["sender_name"].tolist(), ["Ben", "Ben", "Raine", "Raine"])
+        self.assertListEqual(msgs_df["source"].tolist(), ["Facebook", "Instagram", "Facebook", "Instagram"])
+        self.assertListEqual(sorted(convo_persons), ["Ben", "Raine"])
+
+
+class TestWhatsAppReader(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        self.reader = WhatsAppReader()
+
+    def read_msgs(self, lines: List[str], reader: WhatsAppReader = None) -> pd.DataFrame:
+        chat_path = write_chat(os.path.join(self.temp_dir.name, "WhatsApp Chat with Ben.txt"), lines)
+        return build_msgs_df((reader or self.reader).read_batches(chat_path), WhatsAppReader.source_name)
+
+    def test_android_format(self):
+        msgs_df = self.read_msgs([
+            "31/12/2020, 21:15 - Messages and calls are end-to-end encrypted.",
+            "31/12/2020, 21:15 - Raine: Happy new year",
+            "31/12/2020, 21:16 - Ben: Same to you: see you",
+            "tomorrow",
+            "01/01/2021, 09:00 - Ben: <Media omitted>",
+            "01/01/2021, 09:01 - Raine: https://example.com/page?utm_source=x",
+        ])
+
+        self.assertListEqual(msgs_df["sender_name"].tolist(), ["Raine", "Ben", "Ben", "Raine"])
+        self.assertEqual(msgs_df["text"].iloc[1], "Same to you: see you\ntomorrow")
+        self.assertEqual(msgs_df["files"].iloc[2], 1)
+        self.assertEqual(msgs_df["share_link"].iloc[3], "https://example.com/page?utm_source=x")
+        self.assertEqual(msgs_df.index[0].strftime("%Y-%m-%d %H:%M"), "2020-12-31 21:15")
+
+    def test_ios_format(self):
+        msgs_df = self.read_msgs([
+            "[1/2/21, 9:15:42 PM] Raine: hi",
+            "[1/2/21, 9:16:00 PM] Ben: ‎image omitted",
+            "[1/13/21, 12:05:00 AM] Ben: This message was deleted",
+        ])
+
+        # Month/day is inferred from a date with a 'day' over 12
+        self.assertListEqual([x.strftime("%m-%d %H:%M:%S") for x in msgs_df.index],
+                             ["01-02 21:15:42", "01-02 21:16:00", "01-13 00:05:00"])
+        self.assertListEqual(msgs_df["photos"].tolist(), [0, 1, 0])
+        self.assertListEqual(msgs_df["is_unsent"].tolist(), [False, False, True])
+
+    def test_messages_split_across_chunks(self):
+        lines = [f"01/02/2021, 10:{ii:02d} - Ben: line {ii}\ncontinued {ii}" for ii in range(50)]
+
+        # Tiny chunks put chunk boundaries inside messages, which must be carried into the next chunk
+        msgs_df = self.read_msgs(lines, WhatsAppReader(chunk_chars=64))
+
+        self.assertEqual(msgs_df.shape[0], 50)
+        self.assertListEqual(msgs_df["text"].tolist(), [f"line {ii}\ncontinued {ii}" for ii in range(50)])
+
+    def test_single_file_exports_have_distinct_keys(self):
+        alice_path = write_chat(os.path.join(self.temp_dir.name, "WhatsApp Chat with Alice.txt"), [])
+        team_path = write_chat(os.path.join(self.temp_dir.name, "Team", "_chat.txt"), [])
+
+        self.assertEqual(self.reader.convo_key(alice_path, alice_path), "WhatsApp:WhatsApp Chat with Alice.txt")
+        self.assertEqual(self.reader.convo_key(team_path, team_path), "WhatsApp:" + os.path.join("Team", "_chat.txt"))
+
+        # The same chats in a folder export have the same keys
+        self.assertEqual(self.reader.convo_key(self.temp_dir.name, alice_path), "WhatsApp:WhatsApp Chat with Alice.txt")
+        self.assertEqual(self.reader.convo_key(self.temp_dir.name, team_path),
+                         "WhatsApp:" + os.path.join("Team", "_chat.txt"))
+
+
+class TestWhatsAppDeltaIngestion(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        # Name genders need the model, which isn't what's being tested
+        patcher = mock.patch.object(ConvoReader, "assign_name_genders")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_chat_with(self, name: str, n_msgs: int) -> str:
+        return write_chat(os.path.join(self.temp_dir.name, f"WhatsApp Chat with {name}.txt"),
+                          [f"01/02/2021, 10:{ii:02d} - {name if ii % 2 else 'Raine'}: {name} {ii}"
+                           for ii in range(n_msgs)])
+
+    def test_single_file_exports_update_their_own_convo(self):
+        alice_path = self.write_chat_with("Alice", 6)
+        zed_path = self.write_chat_with("Zed", 6)
+
+        curr_user = ConvoReader.read_convos("Raine", source_paths={"WhatsApp": alice_path})
+
+        # A later single file export of another chat is a new conversation, rather than an update of the first
+        ConvoReader.read_new_convo_msgs(curr_user, source_paths={"WhatsApp": zed_path})
+        self.assertListEqual(sorted(curr_user.convos), ["Alice", "Zed"])
+        self.assertEqual(curr_user.convos["Alice"].msg_count, 6)
+
+        alice_path = self.write_chat_with("Alice", 8)
+        changed = ConvoReader.read_new_convo_msgs(curr_user, source_paths={"WhatsApp": alice_path})
+
+        self.assertListEqual(changed, ["Alice"])
+        self.assertEqual(curr_user.convos["Alice"].msg_count, 8)
+        self.assertEqual(curr_user.convos["Zed"].msg_count, 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+import text_similarity
+from convo import Convo
+from text_similarity import add_sender_counts, build_count_matrix, cluster_vectors, top_k_similar, weight_vectors
+from conversations.user import User
+
+football_texts = ["did you watch the football match last night", "what a goal in the second half of the match",
+                  "the referee ruined the football match", "tickets for the next match are on sale"]
+cooking_texts = ["i baked bread with the new recipe", "the recipe needs more garlic and butter",
+                 "baking bread takes all afternoon", "can you send me that pasta recipe"]
+
+
+class TestTextSimilarity(unittest.TestCase):
+
+    def test_count_matrix_sums_msgs_into_rows(self):
+        texts = np.array(["hello there", "hello", "goodbye now"])
+        count_matrix = build_count_matrix(texts, np.array([1, 1, 0]), 3)
+        msg_matrix = text_similarity.vectorizer.transform(texts)
+
+        self.assertTupleEqual(count_matrix.shape, (3, text_similarity.n_features))
+        np.testing.assert_array_equal(count_matrix[1].toarray(), (msg_matrix[0] + msg_matrix[1]).toarray())
+        np.testing.assert_array_equal(count_matrix[0].toarray(), msg_matrix[2].toarray())
+        self.assertEqual(count_matrix[2].nnz, 0)
+
+        # Vectorising in chunks gives the same counts
+        with mock.patch.object(text_similarity, "chunk_size", 1):
+            self.assertEqual((build_count_matrix(texts, np.array([1, 1, 0]), 3) != count_matrix).nnz, 0)
+
+    def test_added_counts_match_counting_together(self):
+        counts = build_count_matrix(np.array(["hi ben", "hi raine"]), np.array([0, 1]), 2)
+        new_counts = build_count_matrix(np.array(["hi all", "hello ben"]), np.array([0, 1]), 2)
+
+        combined, senders = add_sender_counts(counts, pd.Index(["Ben", "Raine"]), new_counts, pd.Index(["Cat", "Ben"]))
+        expected = build_count_matrix(np.array(["hi ben", "hi raine", "hi all", "hello ben"]), np.array([0, 1, 2, 0]),
+                                      3)
+
+        self.assertListEqual(senders.tolist(), ["Ben", "Raine", "Cat"])
+        self.assertEqual((combined != expected).nnz, 0)
+
+    def test_blockwise_neighbours_match_full_similarity(self):
+        vectors = weight_vectors(build_count_matrix(np.array(football_texts + cooking_texts), np.arange(8), 8))
+        neighbours, similarities = top_k_similar(vectors, k=3, block_size=3)
+
+        full_sims = (vectors @ vectors.T).toarray()
+        np.fill_diagonal(full_sims, -1)
+
+        self.assertTupleEqual(neighbours.shape, (8, 3))
+        self.assertFalse((neighbours == np.arange(8)[:, None]).any())
+        np.testing.assert_allclose(similarities, -np.sort(-full_sims, axis=1)[:, :3], rtol=1e-5)
+        np.testing.assert_allclose(np.take_along_axis(full_sims, neighbours, axis=1), similarities, rtol=1e-5)
+
+    def test_neighbours_of_few_rows(self):
+        vectors = weight_vectors(build_count_matrix(np.array(football_texts[:2]), np.arange(2), 2))
+
+        self.assertTupleEqual(top_k_similar(vectors, k=5)[0].shape, (2, 1))
+        self.assertTupleEqual(top_k_similar(vectors[:1], k=5)[0].shape, (1, 0))
+        self.assertTupleEqual(top_k_similar(vectors[:0], k=5)[0].shape, (0, 0))
+
+    def test_clusters_separate_topics(self):
+        vectors = weight_vectors(build_count_matrix(np.array(football_texts + cooking_texts), np.arange(8), 8))
+        labels = cluster_vectors(vectors, 2)
+
+        self.assertEqual(len(set(labels[:4])), 1)
+        self.assertEqual(len(set(labels[4:])), 1)
+        self.assertNotEqual(labels[0], labels[4])
+        self.assertEqual(len(set(cluster_vectors(vectors[:3], 10))), 3)
+
+
+class TestUserTextSimilarity(unittest.TestCase):
+
+    def build_user(self, texts_by_convo: dict) -> User:
+        curr_user = User("Raine")
+        for name, texts in texts_by_convo.items():
+            index = pd.to_datetime(np.arange(len(texts)) * 1000, unit="ms", utc=True).rename("timestamp")
+            msgs_df = pd.DataFrame({"sender_name": [name, "Raine"] * (len(texts) // 2), "text": texts}, index=index)
+            curr_user.convos[name] = Convo(name, ["Raine", name], True, False, msgs_df)
+
+        return curr_user
+
+    def test_similar_convos(self):
+        curr_user = self.build_user({"Ben": football_texts * 25, "Cat": cooking_texts * 25,
+                                     "Dan": football_texts[::-1] * 25})
+        similar_df = curr_user.get_similar_texts(k=1)
+
+        self.assertListEqual(similar_df.columns.tolist(), ['name', 'rank', 'similar_name', 'similarity'])
+        similar_names = dict(zip(similar_df['name'], similar_df['similar_name']))
+        self.assertListEqual([similar_names["Ben"], similar_names["Dan"]], ["Dan", "Ben"])
+        self.assertAlmostEqual(similar_df['similarity'].iloc[0], 1, places=5)
+
+    def test_empty_without_text(self):
+        # A User without conversations, and one whose conversations have no text (e.g. only photos)
+        for curr_user in [User("Raine"), self.build_user({"Ben": ["nan"] * 100})]:
+            similar_df = curr_user.get_similar_texts()
+
+            self.assertEqual(similar_df.shape[0], 0)
+            self.assertListEqual(similar_df.columns.tolist(), ['name', 'rank', 'similar_name', 'similarity'])
+            self.assertDictEqual(curr_user.get_text_clusters(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()